@@ -13,7 +13,8 @@ License:
 """
 
 import asyncio
-from typing import Any, List
+from dataclasses import dataclass
+from typing import Any, Dict, List
 import gi
 
 gi.require_version("Gst", "1.0")
@@ -25,10 +26,27 @@ from gi.repository import GstWebRTC
 
 from apps.app import GstWebRTCApp, GstWebRTCAppConfig
 from apps.pipelines import DEFAULT_BIN_PIPELINE
+from media.preset import VideoPreset
 from utils.base import GSTWEBRTCAPP_EXCEPTION, LOGGER
 from utils.gst import DEFAULT_GCC_SETTINGS
 
 
+@dataclass
+class EncoderBranch:
+    """
+    An encoder branch of the pipeline (raw caps -> encoder -> payloader -> webrtcbin sink pad) with its current params.
+    The single-branch pipelines have one branch, the shared decode ones have one per tee'd encoder.
+    """
+
+    raw_capsfilter: Gst.Element
+    encoder: Gst.Element
+    payloader: Gst.Element
+    pay_capsfilter: Gst.Element
+    bitrate: int
+    resolution: Dict[str, int]
+    framerate: int
+
+
 class AhoyApp(GstWebRTCApp):
     """
     An application that uses GStreamer's WEBRTCBIN plugin to stream the video source to the AhoyMedia WebRTC client.
@@ -46,6 +64,7 @@ class AhoyApp(GstWebRTCApp):
         self.encoder = None
         self.pay_capsfilter = None
         self.transceivers = []
+        self.branches = []
         self.gcc = None
         self.gcc_estimated_bitrates = asyncio.Queue()
         self.bus = None
@@ -67,20 +86,15 @@ class AhoyApp(GstWebRTCApp):
         else:
             raise GSTWEBRTCAPP_EXCEPTION("can't find webrtcbin in the pipeline")
 
-        # collect main named elems
+        # collect main named elems, the elems of the first branch are also the default ones
         self.source = self.pipeline.get_by_name("source")
-        self.raw_capsfilter = self.pipeline.get_by_name("raw_capsfilter")
-        self.encoder = self.pipeline.get_by_name("encoder")
-        self.payloader = self.pipeline.get_by_name("payloader")
-        self.pay_capsfilter = self.pipeline.get_by_name("payloader_capsfilter")
-        if (
-            not self.source
-            or not self.raw_capsfilter
-            or not self.encoder
-            or not self.payloader
-            or not self.pay_capsfilter
-        ):
+        if not self.source:
             raise GSTWEBRTCAPP_EXCEPTION("can't find needed elements in the pipeline")
+        self.branches = self._collect_branches()
+        self.raw_capsfilter = self.branches[0].raw_capsfilter
+        self.encoder = self.branches[0].encoder
+        self.payloader = self.branches[0].payloader
+        self.pay_capsfilter = self.branches[0].pay_capsfilter
 
         # set video source location
         if self.source.get_property("location") is not None:
@@ -89,7 +103,8 @@ class AhoyApp(GstWebRTCApp):
             LOGGER.info(f"OK: video location is set to {self.video_url}")
 
         # set delayed caps for raw_capsfilter to safely change resolution and framerate on the fly
-        self.raw_capsfilter.set_property("caps-change-mode", "delayed")
+        for branch in self.branches:
+            branch.raw_capsfilter.set_property("caps-change-mode", "delayed")
 
         # set gcc estimator if settings are provided
         if self.gcc_settings is not None:
@@ -101,10 +116,11 @@ class AhoyApp(GstWebRTCApp):
         # set priority (DSCP marking)
         self.set_priority()
 
-        # set resolution, framerate, bitrate and fec percentage
-        self.set_resolution(self.resolution["width"], self.resolution["height"])
-        self.set_framerate(self.framerate)
-        self.set_bitrate(self.bitrate)
+        # set resolution, framerate, bitrate of each branch and fec percentage
+        for i, branch in enumerate(self.branches):
+            self.set_resolution(branch.resolution["width"], branch.resolution["height"], i)
+            self.set_framerate(branch.framerate, i)
+            self.set_bitrate(branch.bitrate, i)
         self.set_fec_percentage(self.fec_percentage)
 
         LOGGER.info("OK: pipeline is built")
@@ -120,6 +136,44 @@ class AhoyApp(GstWebRTCApp):
     def _post_init_pipeline(self) -> None:
         pass
 
+    def _collect_branches(self) -> List[EncoderBranch]:
+        # the single-branch pipelines name the elems without an index, the shared decode ones as raw_capsfilter_0, etc.
+        if self.pipeline.get_by_name("encoder"):
+            suffixes = [""]
+        else:
+            suffixes = []
+            while self.pipeline.get_by_name(f"encoder_{len(suffixes)}"):
+                suffixes.append(f"_{len(suffixes)}")
+        if not suffixes:
+            raise GSTWEBRTCAPP_EXCEPTION("can't find needed elements in the pipeline")
+
+        branches = []
+        for i, suffix in enumerate(suffixes):
+            elements = [
+                self.pipeline.get_by_name(f"{name}{suffix}")
+                for name in ("raw_capsfilter", "encoder", "payloader", "payloader_capsfilter")
+            ]
+            if not all(elements):
+                raise GSTWEBRTCAPP_EXCEPTION(f"can't find needed elements of the encoder branch {i} in the pipeline")
+            branch_cfg = self.branch_cfgs[i] if i < len(self.branch_cfgs) else {}
+            branches.append(
+                EncoderBranch(
+                    *elements,
+                    bitrate=branch_cfg.get("bitrate", self.bitrate),
+                    resolution=dict(branch_cfg.get("resolution", self.resolution)),
+                    framerate=branch_cfg.get("framerate", self.framerate),
+                )
+            )
+        if len(branches) > 1:
+            LOGGER.info(f"OK: found {len(branches)} encoder branches sharing one decoded source")
+        return branches
+
+    def get_branch(self, index: int = 0) -> EncoderBranch:
+        try:
+            return self.branches[index]
+        except IndexError:
+            raise GSTWEBRTCAPP_EXCEPTION(f"can't find encoder branch with index {index}")
+
     def set_gcc(self) -> None:
         # add rtpgccbwe element and enable twcc RTP extension for the payloader
         self.gcc = Gst.ElementFactory.make("rtpgccbwe")
@@ -129,7 +183,8 @@ class AhoyApp(GstWebRTCApp):
             "http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01"
         )
         twcc_ext.set_id(1)
-        self.payloader.emit("add-extension", twcc_ext)
+        for branch in self.branches:
+            branch.payloader.emit("add-extension", twcc_ext)
         self.webrtcbin.connect("request-aux-sender", self._cb_add_gcc)
         self.webrtcbin.connect('deep-element-added', lambda _, __, ___: None)
         LOGGER.info("OK: gcc is set")
@@ -171,43 +226,69 @@ class AhoyApp(GstWebRTCApp):
                 wrtc_priority_type = GstWebRTC.WebRTCPriorityType.HIGH
             case _:
                 wrtc_priority_type = GstWebRTC.WebRTCPriorityType.LOW
-        sender = self.transceivers[0].get_property("sender")
-        if sender is not None:
-            # NOTE: it produces a warning but it is a buggy introspection of a C assertion, so it's safe to ignore
-            sender.set_property("priority", wrtc_priority_type)
-            LOGGER.info(f"OK: set priority (DSCP marking) to {self.priority}, min 1, max 4")
-        else:
-            raise GSTWEBRTCAPP_EXCEPTION("can't set priority, sender is None")
+        # each encoder branch has its own transceiver
+        for transceiver in self.transceivers[: max(1, len(self.branches))]:
+            sender = transceiver.get_property("sender")
+            if sender is not None:
+                # NOTE: it produces a warning but it is a buggy introspection of a C assertion, so it's safe to ignore
+                sender.set_property("priority", wrtc_priority_type)
+            else:
+                raise GSTWEBRTCAPP_EXCEPTION("can't set priority, sender is None")
+        LOGGER.info(f"OK: set priority (DSCP marking) to {self.priority}, min 1, max 4")
 
-    def get_raw_caps(self) -> Gst.Caps:
+    def get_raw_caps(self, branch: int = 0) -> Gst.Caps:
         raw = 'video/x-raw' if not self.is_cuda else 'video/x-raw(memory:CUDAMemory)'
-        s = f"{raw},format=I420,width={self.resolution['width']},height={self.resolution['height']},framerate={self.framerate}/1,"
+        resolution = self.get_branch(branch).resolution
+        framerate = self.get_branch(branch).framerate
+        s = f"{raw},format=I420,width={resolution['width']},height={resolution['height']},framerate={framerate}/1,"
         return Gst.Caps.from_string(s)
 
-    def set_bitrate(self, bitrate_kbps: int) -> None:
+    def set_bitrate(self, bitrate_kbps: int, branch: int = 0) -> None:
+        encoder = self.get_branch(branch).encoder
         if self.encoder_gst_name.startswith("nv") or self.encoder_gst_name.startswith("x26"):
-            self.encoder.set_property("bitrate", bitrate_kbps)
+            encoder.set_property("bitrate", bitrate_kbps)
         elif self.encoder_gst_name.startswith("vp"):
-            self.encoder.set_property("target-bitrate", bitrate_kbps * 1000)
+            encoder.set_property("target-bitrate", bitrate_kbps * 1000)
         elif self.encoder_gst_name.startswith("av1"):
-            self.encoder.set_property("target-bitrate", bitrate_kbps)
+            encoder.set_property("target-bitrate", bitrate_kbps)
         else:
             raise GSTWEBRTCAPP_EXCEPTION(f"encoder {self.encoder_gst_name} is not supported")
 
-        self.bitrate = bitrate_kbps
-        LOGGER.info(f"ACTION: set bitrate to {bitrate_kbps} kbps")
-
-    def set_resolution(self, width: int, height: int) -> None:
-        self.resolution = {"width": width, "height": height}
-        self.raw_caps = self.get_raw_caps()
-        self.raw_capsfilter.set_property("caps", self.raw_caps)
-        LOGGER.info(f"ACTION: set resolution to {self.resolution['width']}x{self.resolution['height']}")
-
-    def set_framerate(self, framerate: int) -> None:
-        self.framerate = framerate
-        self.raw_caps = self.get_raw_caps()
-        self.raw_capsfilter.set_property("caps", self.raw_caps)
-        LOGGER.info(f"ACTION: set framerate to {self.framerate}")
+        self.get_branch(branch).bitrate = bitrate_kbps
+        if branch == 0:
+            self.bitrate = bitrate_kbps
+        LOGGER.info(f"ACTION: set bitrate to {bitrate_kbps} kbps{self._get_branch_log_suffix(branch)}")
+
+    def set_resolution(self, width: int, height: int, branch: int = 0) -> None:
+        self.get_branch(branch).resolution = {"width": width, "height": height}
+        raw_caps = self.get_raw_caps(branch)
+        self.get_branch(branch).raw_capsfilter.set_property("caps", raw_caps)
+        if branch == 0:
+            self.resolution = {"width": width, "height": height}
+            self.raw_caps = raw_caps
+        LOGGER.info(f"ACTION: set resolution to {width}x{height}{self._get_branch_log_suffix(branch)}")
+
+    def set_framerate(self, framerate: int, branch: int = 0) -> None:
+        self.get_branch(branch).framerate = framerate
+        raw_caps = self.get_raw_caps(branch)
+        self.get_branch(branch).raw_capsfilter.set_property("caps", raw_caps)
+        if branch == 0:
+            self.framerate = framerate
+            self.raw_caps = raw_caps
+        LOGGER.info(f"ACTION: set framerate to {framerate}{self._get_branch_log_suffix(branch)}")
+
+    def set_preset(self, preset: VideoPreset, branch: int = 0) -> None:
+        LOGGER.info(f"ACTION: set video preset to {preset.name}{self._get_branch_log_suffix(branch)}")
+        current = self.get_branch(branch)
+        if preset.width != current.resolution["width"] or preset.height != current.resolution["height"]:
+            self.set_resolution(preset.width, preset.height, branch)
+        if preset.framerate != current.framerate:
+            self.set_framerate(preset.framerate, branch)
+        if preset.bitrate != current.bitrate:
+            self.set_bitrate(preset.bitrate, branch)
+
+    def _get_branch_log_suffix(self, branch: int) -> str:
+        return f" on branch {branch}" if len(self.branches) > 1 else ""
 
     def set_fec_percentage(self, percentage: int, index: int = -1) -> None:
         if len(self.transceivers) == 0:
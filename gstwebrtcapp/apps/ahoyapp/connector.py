@@ -14,9 +14,11 @@ License:
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
 import asyncio
 from datetime import datetime
+import functools
 import json
 import requests
 import threading
+import time
 from typing import List
 
 import gi
@@ -28,14 +30,15 @@ from gi.repository import Gst
 from gi.repository import GstSdp
 from gi.repository import GstWebRTC
 
-from apps.app import GstWebRTCAppConfig
+from apps.app import GstWebRTCAppConfig, async_wait_for_promise
+from apps.stats_scheduler import StatsScheduler
 from apps.ahoyapp.app import AhoyApp
 from control.agent import Agent
 from media.preset import get_video_preset
-from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber
+from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber, unpack_mqtt_msg
 from network.controller import NetworkController
-from utils.base import LOGGER, wait_for_condition, async_wait_for_condition
-from utils.gst import stats_to_dict
+from utils.base import LOGGER, async_wait_for_condition
+from utils.gst import StatsSchema, StatsSnapshot, stats_structure_to_dict
 
 
 class AhoyConnector:
@@ -81,15 +84,19 @@ class AhoyConnector:
         self.webrtcbin_sdp = None
         self.webrtcbin_ice_connection_state = GstWebRTC.WebRTCICEConnectionState.NEW
         self.pc_out_ice_connection_state = "new"
+        # epoch time of the last published stats, used for the health reports
+        self.last_stats_time = None
 
         self.agents = agents
         self.agent_threads = []
+        # compiled once from the agents' schemas to extract and publish only the stats they consume
+        self.stats_schema = StatsSchema.compile([agent.stats_schema for agent in self.agents]) if self.agents else None
+        self.stats_scheduler = StatsScheduler()
         self.mqtt_config = mqtt_config
         self.mqtts = MqttPair(
             publisher=MqttPublisher(self.mqtt_config),
             subscriber=MqttSubscriber(self.mqtt_config),
         )
-        self.mqtts_threads = None
         self.network_controller = network_controller
 
         self.is_running = False
@@ -119,10 +126,16 @@ class AhoyConnector:
             "capabilities": {"video": {"codecs": [self.pipeline_config.codec.upper()]}},
             "name": self.feed_name,
         }
-        request = requests.post(
-            self.server + requests.utils.quote(self.feed_name),
-            headers=headers,
-            data=json.dumps(data),
+        # the request blocks, so send it off the event loop not to stall the other feeds
+        request = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                requests.post,
+                self.server + requests.utils.quote(self.feed_name),
+                headers=headers,
+                data=json.dumps(data),
+                timeout=self.pipeline_config.max_timeout,
+            ),
         )
         LOGGER.info(f"INFO: connect, request ... {request}")
         LOGGER.info(f"INFO: connect, request.status_code ... {request.status_code}")
@@ -179,9 +192,8 @@ class AhoyConnector:
                     self.is_locked = True
                     LOGGER.info(f"INFO: SIGNALLING CHANNEL received sdpRequest {msg}")
 
-                    self._on_received_sdp_request(msg["sdpRequest"]["sdp"])
-
-                    wait_for_condition(lambda: self.webrtcbin_sdp is not None, self._app.max_timeout)
+                    if not await self._on_received_sdp_request(msg["sdpRequest"]["sdp"]):
+                        return
                     LOGGER.info(
                         f"INFO: on_message, succesfully created local answer for webrtcbin on incoming SDP request..."
                     )
@@ -216,35 +228,53 @@ class AhoyConnector:
             LOGGER.info(f"INFO: STATS CHANNEL received stats message {msg}")
             self.ahoy_stats.append((datetime.now().strftime("%Y-%m-%d-%H:%M:%S:%f")[:-3], msg))
 
-    def _on_received_sdp_request(self, sdp) -> None:
+    async def _on_received_sdp_request(self, sdp) -> bool:
+        # negotiates the webrtcbin answer on the event loop without blocking it, returns False if it has failed
         LOGGER.info(f"INFO: _on_received_sdp_request callback, processing the incoming SDP request...")
         res, sdpmsg = GstSdp.SDPMessage.new_from_text(sdp)
         if res < 0:
             LOGGER.error(f"ERROR: _on_received_sdp_request callback, failed to parse remote offer SDP")
             self.terminate_webrtc_coro()
+            return False
 
         # NOTE: the app (GstPipeline) starts first when the video content is requested. Before that this object is None
         try:
-            self._app = AhoyApp(self.pipeline_config)
+            # building the pipeline blocks, so do it off the event loop
+            self._app = await asyncio.get_running_loop().run_in_executor(None, AhoyApp, self.pipeline_config)
             if self._app is None:
                 LOGGER.error(f"ERROR: _on_received_sdp_request callback, failed to create AhoyApp object")
                 self.terminate_webrtc_coro()
+                return False
         except Exception as e:
             LOGGER.error(
                 f"ERROR: _on_received_sdp_request callback, failed to create AhoyApp object due to an excepion:\n {str(e)}..."
             )
             self.terminate_webrtc_coro()
-        wait_for_condition(lambda: self._app.is_webrtc_ready(), self._app.max_timeout)
-        self._app.webrtcbin.connect('on-negotiation-needed', lambda _: None)
-        self._app.webrtcbin.connect('notify::ice-connection-state', self._on_ice_connection_state_notify)
-
-        # add new transceiver
-        self._add_transceiver(sdpmsg)
-
-        # set remote offer and create answer
-        remote_offer = GstWebRTC.WebRTCSessionDescription.new(GstWebRTC.WebRTCSDPType.OFFER, sdpmsg)
-        promise = Gst.Promise.new_with_change_func(self._on_offer_set, None, None)
-        self._app.webrtcbin.emit('set-remote-description', remote_offer, promise)
+            return False
+        try:
+            await async_wait_for_condition(lambda: self._app.is_webrtc_ready(), self._app.max_timeout)
+            self._app.webrtcbin.connect('on-negotiation-needed', lambda _: None)
+            self._app.webrtcbin.connect('notify::ice-connection-state', self._on_ice_connection_state_notify)
+
+            # add new transceiver
+            self._add_transceiver(sdpmsg)
+
+            # set remote offer and create answer
+            remote_offer = GstWebRTC.WebRTCSessionDescription.new(GstWebRTC.WebRTCSDPType.OFFER, sdpmsg)
+            await async_wait_for_promise(
+                lambda promise: self._app.webrtcbin.emit('set-remote-description', remote_offer, promise),
+                self._app.max_timeout,
+            )
+            reply = await async_wait_for_promise(
+                lambda promise: self._app.webrtcbin.emit('create-answer', None, promise),
+                self._app.max_timeout,
+            )
+            self._on_answer_created(reply)
+        except Exception as e:
+            LOGGER.error(f"ERROR: _on_received_sdp_request callback, failed to negotiate the answer: {str(e)}")
+            self.terminate_webrtc_coro()
+            return False
+        return True
 
     def _add_transceiver(self, sdpmsg) -> None:
         # assign new media, we assumed that we are interested only in the first one
@@ -278,14 +308,7 @@ class AhoyConnector:
             f" {self._app.webrtcbin.emit('get-transceivers').len} transceivers in webrtcbin"
         )
 
-    def _on_offer_set(self, promise, _, __) -> None:
-        assert promise.wait() == Gst.PromiseResult.REPLIED, "FAIL: offer set promise was not replied"
-        promise = Gst.Promise.new_with_change_func(self._on_answer_created, None, None)
-        self._app.webrtcbin.emit('create-answer', None, promise)
-
-    def _on_answer_created(self, promise, _, __) -> None:
-        assert promise.wait() == Gst.PromiseResult.REPLIED, "FAIL: create answer promise was not replied"
-        reply = promise.get_reply()
+    def _on_answer_created(self, reply: Gst.Structure) -> None:
         answer = reply.get_value('answer')
         answer_sdp = answer.sdp
         for i in range(0, answer_sdp.medias_len()):
@@ -314,21 +337,26 @@ class AhoyConnector:
         if self.webrtcbin_ice_connection_state == GstWebRTC.WebRTCICEConnectionState.CONNECTED:
             LOGGER.info("OK: ICE connection is established")
 
-    def _on_get_webrtcbin_stats(self, promise, _, __) -> None:
-        assert promise.wait() == Gst.PromiseResult.REPLIED, "FAIL: get webrtcbin stats promise was not replied"
-        stats = {}
-        stats_struct = promise.get_reply()
+    def _on_get_webrtcbin_stats(self, stats_struct: Gst.Structure) -> None:
+        stats = StatsSnapshot()
         if stats_struct.n_fields() > 0:
             session_struct_n_fields = stats_struct.n_fields()
             for i in range(session_struct_n_fields):
                 stat_name = stats_struct.nth_field_name(i)
+                if self.stats_schema is not None and not self.stats_schema.is_selected(stat_name):
+                    continue
                 stat_value = stats_struct.get_value(stat_name)
                 if isinstance(stat_value, Gst.Structure):
-                    stats[stat_name] = stats_to_dict(stat_value.to_string())
+                    stats[stat_name] = stats_structure_to_dict(
+                        stat_value,
+                        self.stats_schema.get_fields(stat_name) if self.stats_schema is not None else None,
+                    )
         else:
             LOGGER.error(f"ERROR: no stats to save...")
 
-        self.mqtts.publisher.publish(self.mqtt_config.topics.stats, json.dumps(stats))
+        self.stats_scheduler.on_stats(stats)
+        self.mqtts.publisher.publish(self.mqtt_config.topics.stats, stats)
+        self.last_stats_time = time.time()
 
     async def handle_ice_connection(self) -> None:
         LOGGER.info(f"OK: ICE CONNECTION HANDLER IS ON -- ready to check for ICE connection state")
@@ -352,18 +380,33 @@ class AhoyConnector:
     async def handle_webrtcbin_stats(self) -> None:
         LOGGER.info(f"OK: WEBRTCBIN STATS HANDLER IS ON -- ready to check for stats")
         while self.is_running:
-            await asyncio.sleep(0.1)
-            promise = Gst.Promise.new_with_change_func(self._on_get_webrtcbin_stats, None, None)
-            self._app.webrtcbin.emit('get-stats', None, promise)
+            await self.stats_scheduler.wait()
+            try:
+                # the next collection is not requested until webrtcbin has replied to the previous one
+                stats_struct = await async_wait_for_promise(
+                    lambda promise: self._app.webrtcbin.emit('get-stats', None, promise),
+                    self._app.max_timeout,
+                )
+            except Exception as e:
+                LOGGER.error(f"ERROR: failed to get webrtcbin stats: {str(e)}")
+                continue
+            self._on_get_webrtcbin_stats(stats_struct)
         LOGGER.info(f"OK: WEBRTCBIN STATS HANDLER IS OFF!")
 
     async def handle_actions(self) -> None:
         LOGGER.info(f"OK: ACTIONS HANDLER IS ON -- ready to pick and apply actions")
         while self.is_running:
-            action_msg = await self.mqtts.subscriber.message_queues[self.mqtt_config.topics.actions].get()
-            msg = json.loads(action_msg.msg)
+            action_msg = await self.mqtts.subscriber.async_get_message(self.mqtt_config.topics.actions)
+            msg = unpack_mqtt_msg(action_msg.msg)
             if self._app is not None and len(msg) > 0:
+                # an optional branch index selects the encoder branch of a shared decode pipeline, default is the first
+                branch = msg.get("branch", 0)
+                if isinstance(branch, bool) or not isinstance(branch, int) or not 0 <= branch < len(self._app.branches):
+                    LOGGER.error(f"ERROR: Invalid branch in the message, skipping it: {msg}")
+                    continue
                 for action in msg:
+                    if action == "branch":
+                        continue
                     if msg.get(action) is None:
                         LOGGER.error(f"ERROR: Action {action} has no value!")
                         continue
@@ -371,14 +414,15 @@ class AhoyConnector:
                         match action:
                             case "bitrate":
                                 # add 10% policy: if bitrate difference is less than 10% then don't change it
-                                if abs(self._app.bitrate - msg[action]) / self._app.bitrate > 0.1:
-                                    self._app.set_bitrate(msg[action])
+                                current_bitrate = self._app.get_branch(branch).bitrate
+                                if abs(current_bitrate - msg[action]) / current_bitrate > 0.1:
+                                    self._app.set_bitrate(msg[action], branch=branch)
                             case "resolution":
-                                self._app.set_resolution(msg[action])
+                                self._app.set_resolution(msg[action], branch=branch)
                             case "framerate":
-                                self._app.set_framerate(msg[action])
+                                self._app.set_framerate(msg[action], branch=branch)
                             case "preset":
-                                self._app.set_preset(get_video_preset(msg[action]))
+                                self._app.set_preset(get_video_preset(msg[action]), branch=branch)
                             case _:
                                 LOGGER.error(f"ERROR: Unknown action in the message: {msg}")
         LOGGER.info(f"OK: ACTION HANDLER IS OFF!")
@@ -387,7 +431,8 @@ class AhoyConnector:
         LOGGER.info(f"OK: BANDWIDTH ESTIMATIONS HANDLER IS ON -- ready to publish bandwidth estimations")
         while self.is_running:
             gcc_bw = await self._app.gcc_estimated_bitrates.get()
-            self.mqtts.publisher.publish(self.mqtt_config.topics.gcc, str(gcc_bw))
+            self.stats_scheduler.on_bandwidth_estimation(gcc_bw)
+            self.mqtts.publisher.publish(self.mqtt_config.topics.gcc, gcc_bw)
         LOGGER.info(f"OK: BANDWIDTH ESTIMATIONS HANDLER IS OFF!")
 
     async def webrtc_coro(self) -> None:
@@ -397,10 +442,8 @@ class AhoyConnector:
         tasks = []
         try:
             LOGGER.info(f"OK: main webrtc coroutine has been started!")
-            self.mqtts_threads = [
-                threading.Thread(target=self.mqtts.publisher.run, daemon=True).start(),
-                threading.Thread(target=self.mqtts.subscriber.run, daemon=True).start(),
-            ]
+            # connecting blocks, so do it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.mqtts.start)
             self.mqtts.subscriber.subscribe([self.mqtt_config.topics.actions])
             ######################################## TASKS ########################################
             signalling_task = asyncio.create_task(self.handle_ice_connection())
@@ -415,6 +458,10 @@ class AhoyConnector:
                     agent_thread = threading.Thread(target=agent.run, args=(True,), daemon=True)
                     agent_thread.start()
                     self.agent_threads.append(agent_thread)
+                    self.stats_scheduler.subscribe(agent, agent.stats_interval)
+            else:
+                # no agents, keep publishing the stats for the external consumers of the stats topic
+                self.stats_scheduler.subscribe(self.mqtt_config.topics.stats)
             if self.network_controller is not None:
                 # start network controller's task
                 network_controller_task = asyncio.create_task(self.network_controller.update_network_rule())
@@ -435,11 +482,7 @@ class AhoyConnector:
                     task.cancel()
                 if self.agent_threads:
                     self.terminate_agents()
-                self.mqtts.publisher.stop()
-                self.mqtts.subscriber.stop()
-                for t in self.mqtts_threads:
-                    if t:
-                        t.join()
+                self.mqtts.stop()
                 self._app = None
                 LOGGER.info("OK: main webrtc coroutine is stopped on streamStopRequest, pending...")
                 return await self.webrtc_coro()
@@ -454,11 +497,7 @@ class AhoyConnector:
                     task.cancel()
                 if self.agent_threads:
                     self.terminate_agents()
-                self.mqtts.publisher.stop()
-                self.mqtts.subscriber.stop()
-                for t in self.mqtts_threads:
-                    if t:
-                        t.join()
+                self.mqtts.stop()
                 self._app = None
                 LOGGER.error(
                     "ERROR: main webrtc coroutine has been interrupted due to an internal exception, stopping..."
@@ -472,11 +511,7 @@ class AhoyConnector:
                 task.cancel()
             if self.agent_threads:
                 self.terminate_agents()
-            self.mqtts.publisher.stop()
-            self.mqtts.subscriber.stop()
-            for t in self.mqtts_threads:
-                if t:
-                    t.join()
+            self.mqtts.stop()
             self._app = None
             LOGGER.error(
                 "ERROR: main webrtc coroutine has been unexpectedly interrupted due to an exception:"
@@ -498,6 +533,7 @@ class AhoyConnector:
     def terminate_agents(self) -> None:
         if self.agent_threads:
             for agent in self.agents:
+                self.stats_scheduler.unsubscribe(agent)
                 agent.stop()
             for agent_thread in self.agent_threads:
                 if agent_thread:
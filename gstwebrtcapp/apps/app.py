@@ -31,6 +31,46 @@ from media.preset import VideoPreset
 from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION, wait_for_condition
 from utils.gst import DEFAULT_GCC_SETTINGS, get_gst_encoder_name
 
+# the types of the pipeline bus messages handled by GstWebRTCApp.handle_pipeline
+BUS_MESSAGE_TYPES = (
+    Gst.MessageType.APPLICATION
+    | Gst.MessageType.EOS
+    | Gst.MessageType.ERROR
+    | Gst.MessageType.LATENCY
+    | Gst.MessageType.STATE_CHANGED
+)
+
+
+async def async_wait_for_promise(emit_func: Callable[[Gst.Promise], Any], timeout_sec: float) -> Gst.Structure | None:
+    """
+    Asynchronously wait for the reply of a Gst.Promise without blocking the event loop
+
+    :param emit_func: callable that passes the given promise to GStreamer, e.g., emits a webrtcbin action signal with it
+    :param timeout_sec: timeout in seconds
+    :return: the reply structure of the promise (could be None, e.g., for set-*-description)
+    :raises TimeoutError: if timeout_sec is reached, the promise is interrupted then
+    :raises GSTWEBRTCAPP_EXCEPTION: if the promise was interrupted or expired
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def on_changed(promise: Gst.Promise, *_) -> None:
+        # called from the GStreamer thread (or synchronously from emit_func) once the promise is resolved
+        loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    promise = Gst.Promise.new_with_change_func(on_changed, None, None)
+    emit_func(promise)
+    try:
+        await asyncio.wait_for(future, timeout_sec)
+    except asyncio.TimeoutError:
+        promise.interrupt()
+        raise TimeoutError(f"Timeout {timeout_sec} sec is reached for the promise")
+    # the promise is resolved, so wait returns immediately
+    result = promise.wait()
+    if result != Gst.PromiseResult.REPLIED:
+        raise GSTWEBRTCAPP_EXCEPTION(f"promise was not replied, result: {result.value_nick}")
+    return promise.get_reply()
+
 
 @dataclass
 class GstWebRTCAppConfig:
@@ -53,6 +93,8 @@ class GstWebRTCAppConfig:
     :param int max_timeout: Maximum timeout for operations in seconds. Default is 60.
     :param bool is_cuda: Flag indicating whether the pipeline uses CUDA for HA encoding. Currently only H264 is supported. Default is False.
     :param bool is_debug: Flag indicating whether debugging GStreamer logs are enabled. Default is False.
+    :param List[Dict[str, Any]] branch_cfgs: Initial "bitrate", "resolution" and "framerate" of each encoder branch
+        of a shared decode pipeline (see make_shared_decode_bin_pipeline). The missing values are taken from above.
     """
 
     pipeline_str: str = DEFAULT_BIN_PIPELINE
@@ -68,6 +110,7 @@ class GstWebRTCAppConfig:
     max_timeout: int = 60
     is_cuda: bool = False
     is_debug: bool = False
+    branch_cfgs: List[Dict[str, Any]] = field(default_factory=lambda: [])
 
 
 class GstWebRTCApp(metaclass=ABCMeta):
@@ -91,9 +134,12 @@ class GstWebRTCApp(metaclass=ABCMeta):
         self.data_channels = {}
         self.priority = config.priority
         self.max_timeout = config.max_timeout
+        self.branch_cfgs = config.branch_cfgs
         self.is_running = False
 
-        Gst.init(None)
+        # many apps could live in one process (see FeedManager), GStreamer is initialized once per process
+        if not Gst.is_initialized():
+            Gst.init(None)
         if config.is_debug:
             Gst.debug_set_default_threshold(Gst.DebugLevel.WARNING)
             Gst.debug_set_active(True)
@@ -209,60 +255,85 @@ class GstWebRTCApp(metaclass=ABCMeta):
         self.data_channels[data_channel_name].emit("send-string", json.dumps(data))
 
     async def handle_pipeline(self) -> None:
-        # run the loop to fetch messages from the bus
+        # the bus is read on the event loop: its fd wakes the loop as soon as a message is posted
         LOGGER.info("OK: PIPELINE HANDLER IS ON -- ready to read pipeline bus messages")
         self.bus = self.pipeline.get_bus()
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        bus_fd = self._get_bus_fd()
+        if bus_fd is not None:
+            loop.add_reader(bus_fd, self._on_bus_readable, messages)
+            # the messages posted before the reader was added do not wake the loop again
+            self._on_bus_readable(messages)
+        else:
+            LOGGER.warning("WARNING: handle_pipeline, the bus has no pollable fd, reading it in a thread")
         try:
             while True:
-                message = self.bus.timed_pop_filtered(
-                    0.1 * Gst.SECOND,
-                    Gst.MessageType.APPLICATION
-                    | Gst.MessageType.EOS
-                    | Gst.MessageType.ERROR
-                    | Gst.MessageType.LATENCY
-                    | Gst.MessageType.STATE_CHANGED,
-                )
-                if message:
-                    message_type = message.type
-                    if message_type == Gst.MessageType.APPLICATION:
-                        if message.get_structure().get_name() == "termination":
-                            LOGGER.info("INFO: received termination message, preparing to terminate the pipeline...")
-                            break
-                        elif message.get_structure().get_name() == "post-init":
-                            LOGGER.info(
-                                "INFO: received post-init message, preparing to continue initializing the pipeline"
-                            )
-                            self._post_init_pipeline()
-                    elif message_type == Gst.MessageType.EOS:
-                        LOGGER.info("INFO: got EOS message, preparing to terminate the pipeline...")
-                        break
-                    elif message_type == Gst.MessageType.ERROR:
-                        err, _ = message.parse_error()
-                        LOGGER.error(f"ERROR: Pipeline error")
-                        self.is_running = False
-                        raise GSTWEBRTCAPP_EXCEPTION(err.message)
-                    elif message_type == Gst.MessageType.LATENCY:
-                        try:
-                            self.pipeline.recalculate_latency()
-                            LOGGER.debug("INFO: latency is recalculated")
-                        except Exception as e:
-                            raise GSTWEBRTCAPP_EXCEPTION(f"can't recalculate latency, reason: {e}")
-                    elif message_type == Gst.MessageType.STATE_CHANGED:
-                        if message.src == self.pipeline:
-                            old, new, _ = message.parse_state_changed()
-                            LOGGER.info(
-                                "INFO: Pipeline state changed from "
-                                f"{Gst.Element.state_get_name(old)} to "
-                                f"{Gst.Element.state_get_name(new)}"
-                            )
-                await asyncio.sleep(0.1)
+                if bus_fd is not None:
+                    message = await messages.get()
+                else:
+                    message = await loop.run_in_executor(
+                        None, self.bus.timed_pop_filtered, 0.1 * Gst.SECOND, BUS_MESSAGE_TYPES
+                    )
+                if message and not self._handle_bus_message(message):
+                    break
         except KeyboardInterrupt:
             LOGGER.info("ERROR: handle_pipeline, KeyboardInterrupt received, exiting...")
+        finally:
+            if bus_fd is not None:
+                loop.remove_reader(bus_fd)
 
         LOGGER.info("OK: PIPELINE HANDLER IS OFF")
         self.is_running = False
         self.terminate_pipeline()
 
+    def _get_bus_fd(self) -> int | None:
+        # the pollable fd of the bus is not available on all platforms (e.g., Windows)
+        try:
+            bus_fd = self.bus.get_pollfd().fd
+        except Exception:
+            return None
+        return bus_fd if bus_fd >= 0 else None
+
+    def _on_bus_readable(self, messages: asyncio.Queue) -> None:
+        # drain the bus: popping the last message resets its fd, the messages of other types are dropped
+        while (message := self.bus.pop_filtered(BUS_MESSAGE_TYPES)) is not None:
+            messages.put_nowait(message)
+
+    def _handle_bus_message(self, message: Gst.Message) -> bool:
+        # returns False if the pipeline should be terminated
+        message_type = message.type
+        if message_type == Gst.MessageType.APPLICATION:
+            if message.get_structure().get_name() == "termination":
+                LOGGER.info("INFO: received termination message, preparing to terminate the pipeline...")
+                return False
+            elif message.get_structure().get_name() == "post-init":
+                LOGGER.info("INFO: received post-init message, preparing to continue initializing the pipeline")
+                self._post_init_pipeline()
+        elif message_type == Gst.MessageType.EOS:
+            LOGGER.info("INFO: got EOS message, preparing to terminate the pipeline...")
+            return False
+        elif message_type == Gst.MessageType.ERROR:
+            err, _ = message.parse_error()
+            LOGGER.error(f"ERROR: Pipeline error")
+            self.is_running = False
+            raise GSTWEBRTCAPP_EXCEPTION(err.message)
+        elif message_type == Gst.MessageType.LATENCY:
+            try:
+                self.pipeline.recalculate_latency()
+                LOGGER.debug("INFO: latency is recalculated")
+            except Exception as e:
+                raise GSTWEBRTCAPP_EXCEPTION(f"can't recalculate latency, reason: {e}")
+        elif message_type == Gst.MessageType.STATE_CHANGED:
+            if message.src == self.pipeline:
+                old, new, _ = message.parse_state_changed()
+                LOGGER.info(
+                    "INFO: Pipeline state changed from "
+                    f"{Gst.Element.state_get_name(old)} to "
+                    f"{Gst.Element.state_get_name(new)}"
+                )
+        return True
+
     def terminate_pipeline(self) -> None:
         LOGGER.info("OK: terminating pipeline...")
         for data_channel_name in self.data_channels.keys():
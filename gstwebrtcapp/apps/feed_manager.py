@@ -0,0 +1,231 @@
+"""
+feed_manager.py
+
+Description: A manager that hosts many feeds (AhoyConnector or SinkConnector sessions) on one event loop of one process.
+The feeds share the GStreamer initialization, the MQTT connection (see MessageHub) and the executor, while each feed
+gets its own MQTT topics namespace (gstwebrtcapp/<feed>/stats, etc.). The feeds could be started and stopped on the fly.
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+import asyncio
+from dataclasses import dataclass, field, replace
+import time
+from typing import Any, Callable, Dict, List
+
+from apps.app import GstWebRTCAppConfig
+from apps.ahoyapp.connector import AhoyConnector
+from apps.sinkapp.connector import SinkConnector
+from control.agent import Agent
+from message.client import MqttConfig, make_namespaced_mqtt_config
+from network.controller import NetworkController
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+FEED_CONNECTORS = {
+    "ahoy": AhoyConnector,
+    "sink": SinkConnector,
+}
+
+
+@dataclass
+class FeedConfig:
+    """
+    Configuration of a feed hosted by FeedManager.
+
+    :param str name: Name of the feed, unique within the manager. It is also the feed's name for the connector
+        and the namespace of its MQTT topics.
+    :param GstWebRTCAppConfig pipeline_config: Configuration for the GStreamer WebRTC pipeline.
+    :param str connector: Type of the connector, "ahoy" (AhoyConnector) or "sink" (SinkConnector). Default is "ahoy".
+    :param Dict[str, Any] connector_kwargs: Extra keyword arguments of the connector, e.g., server and api_key.
+    :param Callable[[MqttConfig], List[Agent]] | None agents_factory: Makes the feed's agents with the feed's
+        MqttConfig (the topics are namespaced per feed). If None, the feed has no agents. Default is None.
+    :param NetworkController | None network_controller: Network controller of the feed. Nullable.
+    """
+
+    name: str
+    pipeline_config: GstWebRTCAppConfig = field(default_factory=GstWebRTCAppConfig)
+    connector: str = "ahoy"
+    connector_kwargs: Dict[str, Any] = field(default_factory=dict)
+    agents_factory: Callable[[MqttConfig], List[Agent]] | None = None
+    network_controller: NetworkController | None = None
+
+
+@dataclass
+class Feed:
+    config: FeedConfig
+    connector: AhoyConnector | SinkConnector
+    task: asyncio.Task | None = None
+    # starting -> running -> stopped | failed
+    state: str = "starting"
+    started_at: float = field(default_factory=time.time)
+    error: str | None = None
+
+
+class FeedManager:
+    """
+    Hosts many feeds in one process on the running event loop.
+
+    :param MqttConfig mqtt_config: The MQTT config shared by the feeds. The connection is always shared.
+    :param float stop_timeout: The time in seconds to wait for a feed to stop gracefully before cancelling it.
+    :param float max_stats_age: The time in seconds without stats after which a streaming feed is reported unhealthy.
+    """
+
+    def __init__(
+        self,
+        mqtt_config: MqttConfig = MqttConfig(),
+        stop_timeout: float = 10.0,
+        max_stats_age: float = 10.0,
+    ) -> None:
+        self.mqtt_config = replace(mqtt_config, is_shared_connection=True)
+        self.stop_timeout = stop_timeout
+        self.max_stats_age = max_stats_age
+        self.feeds: Dict[str, Feed] = {}
+
+    def get_mqtt_config(self, name: str) -> MqttConfig:
+        """
+        Get the MQTT config of the feed, e.g., to make the external agents or consumers of its topics.
+
+        :param str name: Name of the feed.
+        :return: MqttConfig with the topics under gstwebrtcapp/<name>/
+        """
+        return make_namespaced_mqtt_config(self.mqtt_config, name)
+
+    async def start_feed(self, config: FeedConfig) -> None:
+        """
+        Start the feed in the background. It runs until it is stopped or its connector exits.
+
+        :param FeedConfig config: Configuration of the feed.
+        """
+        if config.name in self.feeds and self.feeds[config.name].state in ("starting", "running"):
+            raise GSTWEBRTCAPP_EXCEPTION(f"FeedManager: feed {config.name} is already running")
+        if config.connector not in FEED_CONNECTORS:
+            raise GSTWEBRTCAPP_EXCEPTION(f"FeedManager: unknown connector {config.connector} of feed {config.name}")
+
+        mqtt_config = self.get_mqtt_config(config.name)
+        connector = FEED_CONNECTORS[config.connector](
+            # the connectors may modify the pipeline config, so each feed gets its own copy
+            pipeline_config=replace(config.pipeline_config),
+            agents=config.agents_factory(mqtt_config) if config.agents_factory is not None else None,
+            feed_name=config.name,
+            mqtt_config=mqtt_config,
+            network_controller=config.network_controller,
+            **config.connector_kwargs,
+        )
+        feed = Feed(config=config, connector=connector)
+        feed.task = asyncio.create_task(self._run_feed(feed), name=f"feed_{config.name}")
+        self.feeds[config.name] = feed
+        LOGGER.info(f"OK: FeedManager: feed {config.name} has been started, {len(self.feeds)} feeds in total")
+
+    async def stop_feed(self, name: str) -> None:
+        """
+        Stop the feed gracefully or cancel it after stop_timeout.
+
+        :param str name: Name of the feed.
+        """
+        feed = self.feeds.pop(name, None)
+        if feed is None:
+            LOGGER.warning(f"WARNING: FeedManager: feed {name} is not found")
+            return
+        if feed.task is not None and not feed.task.done():
+            if feed.connector.app is not None:
+                feed.connector.terminate_webrtc_coro()
+                try:
+                    await asyncio.wait_for(asyncio.shield(feed.task), self.stop_timeout)
+                except asyncio.TimeoutError:
+                    LOGGER.warning(
+                        f"WARNING: FeedManager: feed {name} has not stopped in {self.stop_timeout} sec, cancelling it"
+                    )
+                except Exception as e:
+                    LOGGER.error(f"ERROR: FeedManager: feed {name} has raised while stopping: {str(e)}")
+            if not feed.task.done():
+                # e.g., the feed still waits for a viewer or its handlers do not exit
+                feed.task.cancel()
+                await asyncio.gather(feed.task, return_exceptions=True)
+        LOGGER.info(f"OK: FeedManager: feed {name} has been stopped")
+
+    async def stop(self) -> None:
+        # stop all feeds concurrently
+        await asyncio.gather(*[self.stop_feed(name) for name in list(self.feeds.keys())])
+
+    def get_health(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the health report of each feed.
+
+        :return: dict with the feed names as keys and dicts with the state, uptime in seconds, whether it is streaming,
+            the age of the last stats in seconds, the ICE connection state (ahoy only), the error and is_healthy flag.
+        """
+        now = time.time()
+        health = {}
+        for name, feed in self.feeds.items():
+            connector = feed.connector
+            is_streaming = connector.app is not None and connector.app.is_running
+            last_stats_time = connector.last_stats_time
+            last_stats_age = now - last_stats_time if last_stats_time is not None else None
+            health[name] = {
+                "state": feed.state,
+                "uptime": now - feed.started_at,
+                "is_streaming": is_streaming,
+                "last_stats_age": last_stats_age,
+                "error": feed.error,
+                "is_healthy": feed.state in ("starting", "running")
+                and (not is_streaming or (last_stats_age is not None and last_stats_age <= self.max_stats_age)),
+            }
+            if isinstance(connector, AhoyConnector):
+                health[name]["ice_state"] = connector.webrtcbin_ice_connection_state.value_nick
+        return health
+
+    async def run(self, feeds: List[FeedConfig], health_interval: float = 60.0) -> None:
+        """
+        Start the feeds and run until all of them have exited, logging their health meanwhile.
+
+        :param List[FeedConfig] feeds: Configurations of the feeds.
+        :param float health_interval: The interval in seconds between the health logs. 0 disables them.
+        """
+        for config in feeds:
+            await self.start_feed(config)
+        try:
+            while any(feed.task is not None and not feed.task.done() for feed in self.feeds.values()):
+                tasks = [feed.task for feed in self.feeds.values() if feed.task is not None and not feed.task.done()]
+                await asyncio.wait(tasks, timeout=health_interval or None, return_when=asyncio.FIRST_COMPLETED)
+                if health_interval > 0:
+                    health = self.get_health()
+                    for name, report in health.items():
+                        if not report["is_healthy"]:
+                            LOGGER.warning(f"WARNING: FeedManager: feed {name} is unhealthy: {report}")
+                    num_healthy = sum(report["is_healthy"] for report in health.values())
+                    LOGGER.info(f"INFO: FeedManager: {num_healthy}/{len(health)} feeds are healthy")
+        finally:
+            await self.stop()
+
+    async def _run_feed(self, feed: Feed) -> None:
+        connector = feed.connector
+        name = feed.config.name
+        try:
+            if isinstance(connector, AhoyConnector):
+                await connector.connect_coro()
+            feed.state = "running"
+            await connector.webrtc_coro()
+            feed.state = "stopped"
+        except asyncio.CancelledError:
+            feed.state = "stopped"
+            # the connectors clean up on their own only if they exit by themselves
+            if connector.agent_threads:
+                connector.terminate_agents()
+            raise
+        except Exception as e:
+            feed.state = "failed"
+            feed.error = str(e)
+            LOGGER.error(f"ERROR: FeedManager: feed {name} has failed: {str(e)}")
+        finally:
+            connector.mqtts.stop()
+            if isinstance(connector, AhoyConnector):
+                try:
+                    await connector.pc_out.close()
+                except Exception:
+                    pass
+            LOGGER.info(f"INFO: FeedManager: feed {name} has exited with the state {feed.state}")
@@ -121,3 +121,45 @@ DEFAULT_SINK_H265_CUDA_PIPELINE = '''
     rtspsrc name=source location=rtsp://10.10.3.254:554 latency=100 ! queue ! rtph265depay ! h265parse ! nvh265dec ! videoconvert ! videoscale ! videorate ! cudaupload ! cudaconvert ! 
     video/x-raw(memory:CUDAMemory),format=I420,framerate=25/1 ! ws.
 '''
+
+# shared decode, fan-out encode: one ingest/decode branch is tee'd into several encoder branches (an encoding ladder).
+# Each branch is linked to its own webrtcbin sink pad (transceiver) and is controlled separately (see AhoyApp).
+# Use make_shared_decode_bin_pipeline to build the pipeline with the wanted number of branches
+SHARED_DECODE_BIN_INGEST = '''
+    webrtcbin name=webrtc latency=1 bundle-policy=max-bundle stun-server=stun://stun.l.google.com:19302
+    rtspsrc name=source location=rtsp://10.10.3.254:554 latency=10 ! rtph264depay ! h264parse ! avdec_h264 ! videoconvert !
+    tee name=decoded_tee allow-not-linked=true
+'''
+SHARED_DECODE_BIN_H265_IN_INGEST = '''
+    webrtcbin name=webrtc latency=1 bundle-policy=max-bundle stun-server=stun://stun.l.google.com:19302
+    rtspsrc name=source location=rtsp://10.10.3.254:554 latency=10 ! rtph265depay ! h265parse ! avdec_h265 ! videoconvert !
+    tee name=decoded_tee allow-not-linked=true
+'''
+# {i} is the index of the branch, {payload} is its RTP payload type
+SHARED_DECODE_BIN_BRANCH = '''
+    decoded_tee. ! queue name=queue_{i} leaky=downstream max-size-buffers=2 max-size-time=0 max-size-bytes=0 ! videoscale ! videorate !
+    capsfilter name=raw_capsfilter_{i} caps=video/x-raw,format=I420 !
+    x264enc name=encoder_{i} tune=zerolatency threads=4 key-int-max=60 aud=true cabac=1 bframes=2 vbv-buf-capacity=120 !
+    rtph264pay name=payloader_{i} auto-header-extension=true aggregate-mode=zero-latency config-interval=1 mtu=1250 !
+    capsfilter name=payloader_capsfilter_{i} caps="application/x-rtp, media=(string)video, clock-rate=(int)90000, encoding-name=(string)H264, payload=(int){payload}" ! webrtc.
+'''
+
+
+def make_shared_decode_bin_pipeline(
+    num_branches: int,
+    ingest: str = SHARED_DECODE_BIN_INGEST,
+    branch: str = SHARED_DECODE_BIN_BRANCH,
+) -> str:
+    """
+    Build the webrtcbin pipeline where one decoded source feeds num_branches encoder branches via a tee.
+    The elements of branch i are named raw_capsfilter_i, encoder_i, payloader_i and payloader_capsfilter_i.
+
+    :param num_branches: number of the encoder branches
+    :param ingest: the webrtcbin and the ingest/decode part ending with a tee named decoded_tee
+    :param branch: the template of an encoder branch with {i} and {payload} placeholders
+    :return: the pipeline string
+    """
+    if num_branches < 1:
+        raise ValueError(f"make_shared_decode_bin_pipeline: invalid number of branches {num_branches}")
+    # the payload types are counted down from 126 used by the single-branch pipelines
+    return ingest + "".join(branch.format(i=i, payload=126 - i) for i in range(num_branches))
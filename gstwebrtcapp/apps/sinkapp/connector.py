@@ -13,9 +13,9 @@ License:
 
 import asyncio
 from collections import deque
-import json
 import re
 import threading
+import time
 from typing import List
 import gi
 
@@ -24,13 +24,14 @@ gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
 from apps.app import GstWebRTCAppConfig
+from apps.stats_scheduler import StatsScheduler
 from apps.sinkapp.app import SinkApp
 from control.agent import Agent
 from media.preset import get_video_preset
-from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber
+from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber, unpack_mqtt_msg
 from network.controller import NetworkController
 from utils.base import LOGGER, async_wait_for_condition
-from utils.gst import stats_to_dict
+from utils.gst import StatsSchema, StatsSnapshot, stats_structure_to_dict
 
 
 class SinkConnector:
@@ -55,23 +56,28 @@ class SinkConnector:
 
         self.agents = agents
         self.agent_threads = []
+        # compiled once from the agents' schemas to extract and publish only the stats they consume
+        self.stats_schema = StatsSchema.compile([agent.stats_schema for agent in self.agents]) if self.agents else None
+        self.stats_scheduler = StatsScheduler()
         self.mqtt_config = mqtt_config
         self.mqtts = MqttPair(
             publisher=MqttPublisher(self.mqtt_config),
             subscriber=MqttSubscriber(self.mqtt_config),
         )
-        self.mqtts_threads = None
         self.feed_name = feed_name
         self.network_controller = network_controller
 
         self._app = None
         self.webrtcbin_stats = deque(maxlen=10000)
+        # epoch time of the last published stats, used for the health reports
+        self.last_stats_time = None
 
         self.is_running = False
 
     async def webrtc_coro(self) -> None:
         try:
-            self._app = SinkApp(self.pipeline_config)
+            # building the pipeline blocks, so do it off the event loop
+            self._app = await asyncio.get_running_loop().run_in_executor(None, SinkApp, self.pipeline_config)
             if self._app is None:
                 raise Exception("SinkApp object is None!")
             self._app.webrtcsink.set_property("meta", Gst.Structure.new_from_string(f"meta,name={self.feed_name}"))
@@ -84,10 +90,8 @@ class SinkConnector:
         tasks = []
         try:
             LOGGER.info(f"OK: main webrtc coroutine has been started!")
-            self.mqtts_threads = [
-                threading.Thread(target=self.mqtts.publisher.run, daemon=True).start(),
-                threading.Thread(target=self.mqtts.subscriber.run, daemon=True).start(),
-            ]
+            # connecting blocks, so do it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.mqtts.start)
             self.mqtts.subscriber.subscribe([self.mqtt_config.topics.actions])
             ######################################## TASKS ########################################
             pipeline_task = asyncio.create_task(self._app.handle_pipeline())
@@ -102,6 +106,10 @@ class SinkConnector:
                     agent_thread = threading.Thread(target=agent.run, args=(True,), daemon=True)
                     agent_thread.start()
                     self.agent_threads.append(agent_thread)
+                    self.stats_scheduler.subscribe(agent, agent.stats_interval)
+            else:
+                # no agents, keep publishing the stats for the external consumers of the stats topic
+                self.stats_scheduler.subscribe(self.mqtt_config.topics.stats)
             if self.network_controller is not None:
                 # start network controller's task
                 network_controller_task = asyncio.create_task(self.network_controller.update_network_rule())
@@ -115,11 +123,7 @@ class SinkConnector:
                 task.cancel()
             if self.agent_threads:
                 self.terminate_agents()
-            self.mqtts.publisher.stop()
-            self.mqtts.subscriber.stop()
-            for t in self.mqtts_threads:
-                if t:
-                    t.join()
+            self.mqtts.stop()
             self._app = None
             LOGGER.error(
                 "ERROR: main webrtc coroutine has been unexpectedly interrupted due to an exception:"
@@ -130,6 +134,8 @@ class SinkConnector:
     async def handle_post_init_pipeline(self) -> None:
         await async_wait_for_condition(lambda: self._app.bus is not None, timeout_sec=5.0)
         await async_wait_for_condition(lambda: self._app.webrtcsink_elements, timeout_sec=self._app.max_timeout)
+        # post-init runs on the event loop, so the encoder is awaited here and not in the app's blocking wait
+        await async_wait_for_condition(lambda: self._app.encoder is not None, timeout_sec=self._app.max_timeout)
         self._app.send_post_init_message_to_bus()
 
     def terminate_webrtc_coro(self) -> None:
@@ -143,6 +149,7 @@ class SinkConnector:
     def terminate_agents(self) -> None:
         if self.agent_threads:
             for agent in self.agents:
+                self.stats_scheduler.unsubscribe(agent)
                 agent.stop()
             for agent_thread in self.agent_threads:
                 if agent_thread:
@@ -151,8 +158,8 @@ class SinkConnector:
     async def handle_webrtcsink_stats(self) -> None:
         LOGGER.info(f"OK: WEBRTCSINK STATS HANDLER IS ON -- ready to check for stats")
         while self.is_running:
-            await asyncio.sleep(0.1)
-            stats = {}
+            await self.stats_scheduler.wait()
+            stats = StatsSnapshot()
             stats_struct = self.app.webrtcsink.get_property("stats")
             if stats_struct.n_fields() > 0:
                 session_name = stats_struct.nth_field_name(0)
@@ -161,20 +168,27 @@ class SinkConnector:
                     session_struct_n_fields = session_struct.n_fields()
                     for i in range(session_struct_n_fields):
                         stat_name = session_struct.nth_field_name(i)
+                        if self.stats_schema is not None and not self.stats_schema.is_selected(stat_name):
+                            continue
                         stat_value = session_struct.get_value(stat_name)
                         if isinstance(stat_value, Gst.Structure):
-                            stats[stat_name] = stats_to_dict(stat_value.to_string())
+                            stats[stat_name] = stats_structure_to_dict(
+                                stat_value,
+                                self.stats_schema.get_fields(stat_name) if self.stats_schema is not None else None,
+                            )
             # push the stats to the agent's controller queue or save it to an own one
             if stats:
-                self.mqtts.publisher.publish(self.mqtt_config.topics.stats, json.dumps(stats))
+                self.stats_scheduler.on_stats(stats)
+                self.mqtts.publisher.publish(self.mqtt_config.topics.stats, stats)
+                self.last_stats_time = time.time()
 
         LOGGER.info(f"OK: WEBRTCSINK STATS HANDLER IS OFF!")
 
     async def handle_actions(self) -> None:
         LOGGER.info(f"OK: ACTIONS HANDLER IS ON -- ready to pick and apply actions")
         while self.is_running:
-            action_msg = await self.mqtts.subscriber.message_queues[self.mqtt_config.topics.actions].get()
-            msg = json.loads(action_msg.msg)
+            action_msg = await self.mqtts.subscriber.async_get_message(self.mqtt_config.topics.actions)
+            msg = unpack_mqtt_msg(action_msg.msg)
             if self._app is not None and len(msg) > 0:
                 for action in msg:
                     if msg.get(action) is None:
@@ -199,7 +213,8 @@ class SinkConnector:
         LOGGER.info(f"OK: BANDWIDTH ESTIMATIONS HANDLER IS ON -- ready to publish bandwidth estimations")
         while self.is_running:
             gcc_bw = await self._app.gcc_estimated_bitrates.get()
-            self.mqtts.publisher.publish(self.mqtt_config.topics.gcc, str(gcc_bw))
+            self.stats_scheduler.on_bandwidth_estimation(gcc_bw)
+            self.mqtts.publisher.publish(self.mqtt_config.topics.gcc, gcc_bw)
         LOGGER.info(f"OK: BANDWIDTH ESTIMATIONS HANDLER IS OFF!")
 
     @property
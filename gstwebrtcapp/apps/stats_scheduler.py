@@ -0,0 +1,139 @@
+"""
+stats_scheduler.py
+
+Description: An adaptive scheduler for the webrtc stats collection. It polls at the rate requested by the subscribed consumers,
+backs off when the RTCP reports do not change, speeds up on congestion and pauses when nothing is subscribed.
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+import asyncio
+import time
+from typing import Any, Dict
+
+from utils.base import LOGGER
+from utils.gst import GstWebRTCStatsType, find_stat, is_same_rtcp
+
+
+class StatsScheduler:
+    """
+    Adaptive cadence for the get-stats calls.
+
+    :param float min_interval: The minimal interval between two stats collections in seconds (used on congestion)
+    :param float max_interval: The maximal interval in seconds the scheduler backs off to while RTCP does not change.
+        The backoff never exceeds the smallest interval declared by the consumers, only the consumers subscribed
+        without an interval could be polled as rarely as max_interval
+    :param float backoff_factor: The factor the interval is multiplied by per each stats collection with the same RTCP
+    :param float congestion_drop: The relative drop of the GCC estimate that is treated as congestion, e.g., 0.1 is 10%
+    :param float congestion_factor: The factor the interval is multiplied by during congestion
+    :param float congestion_time: The time in seconds the scheduler stays in the congestion mode after the last drop
+    """
+
+    DEFAULT_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        min_interval: float = 0.05,
+        max_interval: float = 1.0,
+        backoff_factor: float = 1.5,
+        congestion_drop: float = 0.1,
+        congestion_factor: float = 0.5,
+        congestion_time: float = 5.0,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.congestion_drop = congestion_drop
+        self.congestion_factor = congestion_factor
+        self.congestion_time = congestion_time
+
+        # None marks the consumers subscribed without an interval, they are polled with the DEFAULT_INTERVAL
+        self.intervals: Dict[Any, float | None] = {}
+        self.backoff = 1.0
+        self.last_rtp_inbound = None
+        self.last_bandwidth = None
+        self.congestion_ends = 0.0
+
+        # created lazily to be bound to the running event loop
+        self._subscribed_event = None
+        self._wakeup_event = None
+
+    def subscribe(self, consumer: Any, interval: float | None = None) -> None:
+        self.intervals[consumer] = interval or None
+        self._get_subscribed_event().set()
+        self._get_wakeup_event().set()
+        LOGGER.info(
+            f"INFO: StatsScheduler: {consumer} has subscribed with the interval {interval or self.DEFAULT_INTERVAL} sec"
+        )
+
+    def unsubscribe(self, consumer: Any) -> None:
+        if consumer in self.intervals:
+            del self.intervals[consumer]
+            LOGGER.info(f"INFO: StatsScheduler: {consumer} has unsubscribed")
+        if not self.intervals:
+            self._get_subscribed_event().clear()
+            LOGGER.info(f"INFO: StatsScheduler: no consumers are subscribed, stats collection is paused")
+
+    @property
+    def interval(self) -> float:
+        if not self.intervals:
+            return self.DEFAULT_INTERVAL
+        declared_intervals = [interval for interval in self.intervals.values() if interval is not None]
+        if len(declared_intervals) < len(self.intervals):
+            base_interval = min(declared_intervals + [self.DEFAULT_INTERVAL])
+        else:
+            base_interval = min(declared_intervals)
+        if time.time() < self.congestion_ends:
+            return max(self.min_interval, base_interval * self.congestion_factor)
+        # the consumers that declared an interval must get the stats at least that often
+        max_interval = min(declared_intervals) if declared_intervals else max(self.max_interval, base_interval)
+        return min(max_interval, base_interval * self.backoff)
+
+    async def wait(self) -> None:
+        """
+        Wait until the next stats collection is due. Blocks while nothing is subscribed.
+        The wait is shortened if a consumer subscribes or a congestion is detected meanwhile.
+        """
+        await self._get_subscribed_event().wait()
+        wakeup_event = self._get_wakeup_event()
+        wakeup_event.clear()
+        try:
+            await asyncio.wait_for(wakeup_event.wait(), timeout=self.interval)
+        except asyncio.TimeoutError:
+            pass
+
+    def on_stats(self, stats: Dict[str, Any]) -> None:
+        # could be called from the GStreamer thread, hence no asyncio calls here
+        rtp_inbound = find_stat(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM)
+        if not rtp_inbound or any("rb-round-trip" not in r or "rb-jitter" not in r for r in rtp_inbound):
+            return
+        if self.last_rtp_inbound is not None and len(self.last_rtp_inbound) == len(rtp_inbound):
+            if all(is_same_rtcp(r, last_r) for r, last_r in zip(rtp_inbound, self.last_rtp_inbound)):
+                self.backoff = min(self.backoff * self.backoff_factor, self.max_interval / self.min_interval)
+            else:
+                self.backoff = 1.0
+        self.last_rtp_inbound = rtp_inbound
+
+    def on_bandwidth_estimation(self, bandwidth: float) -> None:
+        if self.last_bandwidth is not None and bandwidth < self.last_bandwidth * (1.0 - self.congestion_drop):
+            self.congestion_ends = time.time() + self.congestion_time
+            self.backoff = 1.0
+            self._get_wakeup_event().set()
+        self.last_bandwidth = bandwidth
+
+    def _get_subscribed_event(self) -> asyncio.Event:
+        if self._subscribed_event is None:
+            self._subscribed_event = asyncio.Event()
+            if self.intervals:
+                self._subscribed_event.set()
+        return self._subscribed_event
+
+    def _get_wakeup_event(self) -> asyncio.Event:
+        if self._wakeup_event is None:
+            self._wakeup_event = asyncio.Event()
+        return self._wakeup_event
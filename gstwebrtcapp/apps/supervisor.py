@@ -0,0 +1,388 @@
+"""
+supervisor.py
+
+Description: A supervisor that shards the feeds across worker processes to scale beyond one core (GIL) per host.
+Each worker runs a FeedManager with its shard of the feeds, is optionally pinned to a CPU set, reports its health
+and metrics to the supervisor and is restarted with a backoff if it crashes. A crash affects only the feeds of its
+worker, and the restarted worker runs only those of them that had not finished normally. A failed feed is restarted
+within its worker with the same backoff, the other feeds of the worker keep running meanwhile.
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+import multiprocessing as mp
+import os
+import queue
+import resource
+import signal
+import time
+from typing import Any, Dict, List
+
+from apps.feed_manager import FeedConfig, FeedManager
+from message.client import MqttConfig
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+@dataclass
+class FeedSupervisorConfig:
+    """
+    Configuration class for FeedSupervisor.
+
+    :param int feeds_per_worker: The number of feeds per worker process. Default is 1.
+    :param List[List[int]] | str | None cpu_sets: The CPU sets to pin the workers to, one per worker. "auto" splits
+        the CPUs available to the supervisor evenly between the workers, None disables pinning. Default is "auto".
+    :param float min_restart_delay: The delay in seconds before restarting a crashed worker or a failed feed
+        for the first time.
+    :param float max_restart_delay: The maximal delay in seconds before restarting a crashed worker or a failed feed.
+    :param float restart_backoff_factor: The factor the delay is multiplied by per each consecutive crash or failure.
+    :param float stable_time: The time in seconds a worker or a feed should run to reset its backoff after a crash.
+    :param int max_restarts: The maximal number of restarts per worker and per feed within its worker, -1 means
+        unlimited. Default is -1.
+    :param float report_interval: The interval in seconds between the health reports of the workers.
+    :param float stop_timeout: The time in seconds to wait for a worker to stop gracefully before killing it.
+    """
+
+    feeds_per_worker: int = 1
+    cpu_sets: List[List[int]] | str | None = "auto"
+    min_restart_delay: float = 1.0
+    max_restart_delay: float = 60.0
+    restart_backoff_factor: float = 2.0
+    stable_time: float = 60.0
+    max_restarts: int = -1
+    report_interval: float = 10.0
+    stop_timeout: float = 15.0
+
+
+@dataclass
+class Worker:
+    id: int
+    feeds: List[FeedConfig]
+    cpus: List[int] | None = None
+    process: mp.Process | None = None
+    started_at: float = 0.0
+    restarts: int = 0
+    consecutive_crashes: int = 0
+    # time.monotonic() when a crashed worker is due to restart, None if it is not pending
+    restart_at: float | None = None
+    last_exitcode: int | None = None
+    last_report: Dict[str, Any] = field(default_factory=dict)
+    last_report_time: float | None = None
+
+
+class FeedSupervisor:
+    """
+    Runs the feeds in the worker processes, each with its own FeedManager on its own event loop.
+    The feed configs are sent to the spawned workers, so they should be picklable (e.g., the agents factories
+    should be module-level functions, not lambdas).
+
+    :param List[FeedConfig] feeds: Configurations of the feeds.
+    :param MqttConfig mqtt_config: The MQTT config of the feeds, each worker shares one connection between its feeds.
+    :param FeedSupervisorConfig config: Configuration of the supervisor.
+    """
+
+    def __init__(
+        self,
+        feeds: List[FeedConfig],
+        mqtt_config: MqttConfig = MqttConfig(),
+        config: FeedSupervisorConfig = FeedSupervisorConfig(),
+    ) -> None:
+        if not feeds:
+            raise GSTWEBRTCAPP_EXCEPTION("FeedSupervisor: no feeds to supervise")
+        if len({feed.name for feed in feeds}) != len(feeds):
+            raise GSTWEBRTCAPP_EXCEPTION("FeedSupervisor: feed names should be unique")
+        self.mqtt_config = mqtt_config
+        self.config = config
+
+        step = max(1, config.feeds_per_worker)
+        shards = [feeds[i : i + step] for i in range(0, len(feeds), step)]
+        cpu_sets = self._make_cpu_sets(len(shards))
+        self.workers = [Worker(id=i, feeds=shard, cpus=cpu_sets[i]) for i, shard in enumerate(shards)]
+
+        # spawn: the workers must not inherit the GStreamer and MQTT threads of the parent
+        self._mp_context = mp.get_context("spawn")
+        self._reports = self._mp_context.Queue()
+        self._is_supervising = False
+        self.is_running = False
+
+    def run(self) -> None:
+        """
+        Start the workers and supervise them until all have finished or stop() is called. Blocks the calling thread.
+        """
+        self.is_running = True
+        self._is_supervising = True
+        for worker in self.workers:
+            self._start_worker(worker)
+        LOGGER.info(f"OK: FeedSupervisor: {len(self.workers)} workers have been started")
+
+        last_log_time = time.monotonic()
+        try:
+            while self.is_running:
+                self._collect_reports(timeout=0.5)
+                self._check_workers()
+                if all(w.process is None and w.restart_at is None for w in self.workers):
+                    LOGGER.info("INFO: FeedSupervisor: all workers have finished")
+                    break
+                if time.monotonic() - last_log_time >= self.config.report_interval:
+                    last_log_time = time.monotonic()
+                    health = self.get_health()
+                    LOGGER.info(
+                        f"INFO: FeedSupervisor: {health['alive_workers']}/{len(self.workers)} workers are alive,"
+                        f" {health['healthy_feeds']}/{health['feeds']} feeds are healthy"
+                    )
+        except KeyboardInterrupt:
+            LOGGER.info("INFO: FeedSupervisor: KeyboardInterrupt received, stopping...")
+        finally:
+            self._is_supervising = False
+            self.stop()
+
+    def stop(self) -> None:
+        self.is_running = False
+        if self._is_supervising:
+            # called from another thread while run() supervises: run() stops the workers once its loop exits
+            return
+        for worker in self.workers:
+            worker.restart_at = None
+            if worker.process is not None and worker.process.is_alive():
+                # the workers stop their feeds gracefully on SIGTERM
+                worker.process.terminate()
+        deadline = time.monotonic() + self.config.stop_timeout
+        while time.monotonic() < deadline and any(w.process is not None and w.process.is_alive() for w in self.workers):
+            # keep draining the reports: a worker does not exit until its queue feeder thread has flushed them
+            self._collect_reports(timeout=0)
+            for worker in self.workers:
+                if worker.process is not None:
+                    worker.process.join(0.05)
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            if worker.process.is_alive():
+                LOGGER.warning(f"WARNING: FeedSupervisor: worker {worker.id} has not stopped in time, killing it")
+                worker.process.kill()
+            worker.process.join()
+            worker.last_exitcode = worker.process.exitcode
+            worker.process = None
+        self._collect_reports(timeout=0)
+        self._reports.close()
+        self._reports.join_thread()
+        LOGGER.info("OK: FeedSupervisor has been stopped")
+
+    def get_health(self) -> Dict[str, Any]:
+        """
+        Get the aggregated health of the workers and their feeds.
+
+        :return: dict with the totals and the per-worker reports: pid, liveness, CPU set, restarts, the age of
+            the last report, CPU time and max RSS of the worker, and the health of its feeds (see FeedManager)
+        """
+        now = time.monotonic()
+        workers = {}
+        for worker in self.workers:
+            workers[worker.id] = {
+                "pid": worker.process.pid if worker.process is not None else None,
+                "is_alive": worker.process is not None and worker.process.is_alive(),
+                "cpus": worker.cpus,
+                "restarts": worker.restarts,
+                "last_exitcode": worker.last_exitcode,
+                "last_report_age": now - worker.last_report_time if worker.last_report_time is not None else None,
+                "cpu_time": worker.last_report.get("cpu_time"),
+                "max_rss_mb": worker.last_report.get("max_rss_mb"),
+                "feeds": worker.last_report.get("feeds", {}),
+            }
+        feeds = [report for worker in workers.values() for report in worker["feeds"].values()]
+        return {
+            "alive_workers": sum(worker["is_alive"] for worker in workers.values()),
+            "restarts": sum(worker["restarts"] for worker in workers.values()),
+            "feeds": sum(len(w.feeds) for w in self.workers),
+            "healthy_feeds": sum(bool(report.get("is_healthy")) for report in feeds),
+            "workers": workers,
+        }
+
+    def _make_cpu_sets(self, num_workers: int) -> List[List[int] | None]:
+        cpu_sets = self.config.cpu_sets
+        if cpu_sets is None or not hasattr(os, "sched_setaffinity"):
+            return [None] * num_workers
+        if cpu_sets == "auto":
+            cpus = sorted(os.sched_getaffinity(0))
+            if num_workers >= len(cpus):
+                # more workers than CPUs: each worker gets one CPU in a round robin
+                return [[cpus[i % len(cpus)]] for i in range(num_workers)]
+            # contiguous and even chunks of the CPUs, so the workers do not share the cores
+            bounds = [round(i * len(cpus) / num_workers) for i in range(num_workers + 1)]
+            return [cpus[bounds[i] : bounds[i + 1]] for i in range(num_workers)]
+        if len(cpu_sets) < num_workers:
+            raise GSTWEBRTCAPP_EXCEPTION(
+                f"FeedSupervisor: {len(cpu_sets)} CPU sets are given for {num_workers} workers"
+            )
+        return [list(cpu_set) for cpu_set in cpu_sets[:num_workers]]
+
+    def _start_worker(self, worker: Worker) -> None:
+        worker.process = self._mp_context.Process(
+            target=_run_worker,
+            args=(worker.id, worker.feeds, self.mqtt_config, worker.cpus, self._reports, self.config),
+            name=f"feed_worker_{worker.id}",
+            daemon=False,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        LOGGER.info(
+            f"OK: FeedSupervisor: worker {worker.id} (pid {worker.process.pid}) has been started with"
+            f" {len(worker.feeds)} feeds on CPUs {worker.cpus if worker.cpus is not None else 'any'}"
+        )
+
+    def _check_workers(self) -> None:
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                worker.process.join()
+                worker.last_exitcode = worker.process.exitcode
+                pid = worker.process.pid
+                worker.process = None
+                if worker.last_exitcode == 0:
+                    LOGGER.info(f"INFO: FeedSupervisor: worker {worker.id} has finished")
+                    continue
+                # the last report of the worker tells which of its feeds have finished normally before the crash
+                self._collect_reports(timeout=0)
+                self._drop_finished_feeds(worker, pid)
+                if now - worker.started_at >= self.config.stable_time:
+                    worker.consecutive_crashes = 0
+                worker.consecutive_crashes += 1
+                if 0 <= self.config.max_restarts <= worker.restarts:
+                    LOGGER.error(
+                        f"ERROR: FeedSupervisor: worker {worker.id} has crashed with exit code {worker.last_exitcode},"
+                        f" the restart limit {self.config.max_restarts} is reached"
+                    )
+                    continue
+                delay = min(
+                    self.config.max_restart_delay,
+                    self.config.min_restart_delay
+                    * self.config.restart_backoff_factor ** (worker.consecutive_crashes - 1),
+                )
+                worker.restart_at = now + delay
+                LOGGER.error(
+                    f"ERROR: FeedSupervisor: worker {worker.id} has crashed with exit code {worker.last_exitcode},"
+                    f" restarting it in {delay:.1f} sec"
+                )
+            elif worker.process is None and worker.restart_at is not None and now >= worker.restart_at:
+                worker.restarts += 1
+                self._start_worker(worker)
+
+    def _drop_finished_feeds(self, worker: Worker, pid: int) -> None:
+        if worker.last_report.get("pid") != pid:
+            # no report from the crashed process, so all its feeds are restarted
+            return
+        feeds = worker.last_report.get("feeds", {})
+        finished = [feed.name for feed in worker.feeds if feeds.get(feed.name, {}).get("state") == "stopped"]
+        if finished:
+            worker.feeds = [feed for feed in worker.feeds if feed.name not in finished]
+            LOGGER.info(f"INFO: FeedSupervisor: worker {worker.id} will not restart the finished feeds {finished}")
+
+    def _collect_reports(self, timeout: float) -> None:
+        try:
+            report = self._reports.get(timeout=timeout)
+            while True:
+                worker = self.workers[report["worker"]]
+                worker.last_report = report
+                worker.last_report_time = time.monotonic()
+                report = self._reports.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def _run_worker(
+    worker_id: int,
+    feeds: List[FeedConfig],
+    mqtt_config: MqttConfig,
+    cpus: List[int] | None,
+    reports: mp.Queue,
+    config: FeedSupervisorConfig,
+) -> None:
+    # entry point of a worker process
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(_run_worker_coro(worker_id, feeds, mqtt_config, reports, config))
+
+
+async def _run_worker_coro(
+    worker_id: int,
+    feeds: List[FeedConfig],
+    mqtt_config: MqttConfig,
+    reports: mp.Queue,
+    config: FeedSupervisorConfig,
+) -> None:
+    manager = FeedManager(mqtt_config=mqtt_config)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # the failed feeds are restarted within the worker with the same backoff as the crashed workers
+    restarts = {feed_config.name: 0 for feed_config in feeds}
+    consecutive_failures = {feed_config.name: 0 for feed_config in feeds}
+    # time.monotonic() when a failed feed is due to restart
+    restart_at: Dict[str, float] = {}
+    stop_task = asyncio.create_task(stop_event.wait())
+    try:
+        for feed_config in feeds:
+            await manager.start_feed(feed_config)
+        while not stop_event.is_set():
+            now = time.monotonic()
+            for name, feed in manager.feeds.items():
+                if feed.state != "failed" or name in restart_at:
+                    continue
+                if 0 <= config.max_restarts <= restarts[name]:
+                    continue
+                if time.time() - feed.started_at >= config.stable_time:
+                    consecutive_failures[name] = 0
+                consecutive_failures[name] += 1
+                delay = min(
+                    config.max_restart_delay,
+                    config.min_restart_delay * config.restart_backoff_factor ** (consecutive_failures[name] - 1),
+                )
+                restart_at[name] = now + delay
+                LOGGER.error(f"ERROR: worker {worker_id}: feed {name} has failed, restarting it in {delay:.1f} sec")
+            for name, due in list(restart_at.items()):
+                if now >= due:
+                    del restart_at[name]
+                    restarts[name] += 1
+                    await manager.start_feed(manager.feeds[name].config)
+            tasks = [feed.task for feed in manager.feeds.values() if not feed.task.done()]
+            if not tasks and not restart_at:
+                break
+            timeout = min([config.report_interval] + [due - now for due in restart_at.values()])
+            await asyncio.wait([*tasks, stop_task], timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED)
+            reports.put(_make_worker_report(worker_id, manager))
+        failed = [name for name, feed in manager.feeds.items() if feed.state == "failed"]
+    finally:
+        stop_task.cancel()
+        await manager.stop()
+    if failed and not stop_event.is_set():
+        # the feeds have exhausted their restarts: a non-zero exit code hands them over to the supervisor,
+        # which restarts the worker with the feeds that have not finished normally
+        raise GSTWEBRTCAPP_EXCEPTION(f"worker {worker_id}: feeds {failed} have failed")
+
+
+def _make_worker_report(worker_id: int, manager: FeedManager) -> Dict[str, Any]:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "worker": worker_id,
+        "pid": os.getpid(),
+        "time": time.time(),
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in KB on Linux
+        "max_rss_mb": usage.ru_maxrss / 1024,
+        "feeds": manager.get_health(),
+    }
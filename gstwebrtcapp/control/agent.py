@@ -14,9 +14,9 @@ License:
 
 from abc import ABCMeta
 from enum import Enum
-import threading
 
 from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber
+from utils.gst import StatsSchema
 
 
 class AgentType(Enum):
@@ -37,21 +37,16 @@ class Agent(metaclass=ABCMeta):
             publisher=MqttPublisher(self.mqtt_config),
             subscriber=MqttSubscriber(self.mqtt_config),
         )
-        self.mqtts_threads = []
         self.type = AgentType.ABSTRACT
+        # stats the agent consumes, None means all stats
+        self.stats_schema: StatsSchema | None = None
+        # desired interval between the stats collections in seconds, None means the default one of the StatsScheduler
+        self.stats_interval: float | None = None
 
     def run(self, *args, **kwargs) -> None:
-        self.mqtts_threads = [
-            threading.Thread(target=self.mqtts.publisher.run, daemon=True).start(),
-            threading.Thread(target=self.mqtts.subscriber.run, daemon=True).start(),
-        ]
+        self.mqtts.start()
         self.mqtts.subscriber.subscribe([self.mqtt_config.topics.gcc])
         self.mqtts.subscriber.subscribe([self.mqtt_config.topics.stats])
 
     def stop(self) -> None:
-        self.mqtts.publisher.stop()
-        self.mqtts.subscriber.stop()
-        if self.mqtts_threads:
-            for t in self.mqtts_threads:
-                if t:
-                    t.join()
+        self.mqtts.stop()
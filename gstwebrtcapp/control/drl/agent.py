@@ -1,29 +1,46 @@
 import time
-from typing import Tuple
+from typing import List, Tuple
 
 from control.agent import Agent, AgentType
 from control.drl.config import DrlConfig
 from control.drl.manager import DrlManager
 from control.drl.mdp import MDP
-from message.client import MqttConfig
+from message.client import MqttConfig, MqttPair, MqttPublisher, MqttSubscriber
 from utils.base import LOGGER
 
 
 class DrlAgent(Agent):
+    """
+    DRL agent. Given a list of MQTT configs (one per feed with the topics under gstwebrtcapp/<feed>/, e.g., made by
+    FeedManager.get_mqtt_config or make_namespaced_mqtt_config), it trains or evaluates one model on all feeds at once
+    with one env per feed stepped in parallel.
+    """
+
     def __init__(
         self,
         drl_config: DrlConfig,
         mdp: MDP,
-        mqtt_config: MqttConfig,
+        mqtt_config: MqttConfig | List[MqttConfig],
         warmup: float = 10.0,
     ) -> None:
-        super().__init__(mqtt_config)
+        mqtt_configs = mqtt_config if isinstance(mqtt_config, list) else [mqtt_config]
+        super().__init__(mqtt_configs[0])
         self.warmup = warmup
         self.type = AgentType.DRL
-        self.manager = DrlManager(drl_config, mdp, self.mqtts)
+        self.feed_mqtt_configs = mqtt_configs
+        self.feed_mqtts = [self.mqtts] + [
+            MqttPair(publisher=MqttPublisher(config), subscriber=MqttSubscriber(config)) for config in mqtt_configs[1:]
+        ]
+        self.manager = DrlManager(drl_config, mdp, self.feed_mqtts if len(self.feed_mqtts) > 1 else self.mqtts)
+        self.stats_schema = mdp.get_stats_schema()
+        self.stats_interval = drl_config.state_update_interval / mdp.num_observations_for_state
 
     def run(self, is_load_last_model: bool = False) -> None:
         super().run()
+        for config, mqtts in zip(self.feed_mqtt_configs[1:], self.feed_mqtts[1:]):
+            mqtts.start()
+            mqtts.subscriber.subscribe([config.topics.gcc])
+            mqtts.subscriber.subscribe([config.topics.stats])
         time.sleep(self.warmup)
         LOGGER.info(f"INFO: DRL Agent warmup {self.warmup} sec is finished, starting...")
 
@@ -37,5 +54,7 @@ class DrlAgent(Agent):
 
     def stop(self) -> None:
         super().stop()
+        for mqtts in self.feed_mqtts[1:]:
+            mqtts.stop()
         LOGGER.info("INFO: stopping DRL agent...")
         self.manager.stop()
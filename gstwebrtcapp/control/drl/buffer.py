@@ -0,0 +1,155 @@
+import collections
+import numpy as np
+import operator
+from typing import Any, Callable, Dict, List
+
+from utils.gst import StatsSchema, StatsSnapshot
+
+
+class _StatColumns:
+    '''
+    Preallocated columns of one stat (e.g., rtp-inbound-stream_1234): a NumPy structured array with one field
+    per stat field, so each column is a view and the rows of all observations are written with one assignment.
+    '''
+
+    def __init__(self, capacity: int, stat: Dict[str, Any], fields: frozenset | None) -> None:
+        self.keys = tuple(stat)
+        self.fields = tuple(f for f in stat if fields is None or f in fields)
+        self.get_values = operator.itemgetter(*self.fields) if len(self.fields) > 1 else _single_getter(self.fields)
+        self.types = tuple(map(type, self.get_values(stat))) if self.fields else ()
+        self.data = np.empty(capacity, dtype=[(f, _get_column_dtype(stat[f])) for f in self.fields])
+
+    def matches(self, stat: Dict[str, Any]) -> bool:
+        # whether the columns could be reused for the stats with the given first row
+        return tuple(stat) == self.keys and (not self.fields or tuple(map(type, self.get_values(stat))) == self.types)
+
+    def write(self, rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray] | None:
+        # NOTE: the types of the values are checked only for the first row. It relies on the stats fields keeping
+        # their types over the time, which holds for GStreamer stats (each field has a fixed GType)
+        if len(set(map(len, rows))) > 1:
+            return None
+        try:
+            self.data[: len(rows)] = [self.get_values(row) for row in rows]
+        except (KeyError, OverflowError, TypeError, ValueError):
+            return None
+        return {f: self.data[f][: len(rows)] for f in self.fields}
+
+
+class ObservationBuffer:
+    '''
+    Ring buffer for the stats observations collected within one env step with columnar (NumPy) access to them.
+    It replaces utils.base.merge_observations: instead of appending value by value to the lists, the kept
+    observations are converted per stat with a single assignment into the preallocated structured arrays,
+    and the merged observations are dict[stat, dict[field, array]] of views into them.
+
+    The views are only valid until the next call of get_last/get_selected, so the consumers that keep the stats
+    for longer should copy them.
+
+    :param int capacity: The maximal number of the observations kept. The oldest ones are dropped when it is full
+    :param StatsSchema stats_schema: The schema that selects the stats and fields to keep. None means all of them
+    '''
+
+    def __init__(self, capacity: int = 256, stats_schema: StatsSchema | None = None) -> None:
+        self.capacity = max(1, capacity)
+        self.stats_schema = stats_schema
+        self.observations = collections.deque(maxlen=self.capacity)
+        self.columns: Dict[str, _StatColumns] = {}
+
+    def append(self, observation: Dict[str, Dict[str, Any]]) -> None:
+        self.observations.append(observation)
+
+    def clear(self) -> None:
+        # the columns are kept to be reused in the next step
+        self.observations.clear()
+
+    def __len__(self) -> int:
+        return len(self.observations)
+
+    def get_observation(self, index: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the raw observation by its index among the kept observations (negative indices are allowed).
+        """
+        return self.observations[index]
+
+    def get_last(self, n: int) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Get the last n observations merged into dict[stat, dict[field, array]] as merge_observations does.
+        The arrays are views into the buffer.
+
+        :param n: number of the last observations
+        :return: merged observations
+        """
+        n = min(n, len(self.observations))
+        start = len(self.observations) - n
+        return self._merge([self.observations[i] for i in range(start, start + n)])
+
+    def get_selected(self, indices: List[int]) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Get the selected observations merged into dict[stat, dict[field, array]] as merge_observations does.
+        The arrays are views into the buffer.
+
+        :param indices: indices of the observations among the kept observations
+        :return: merged observations
+        """
+        return self._merge([self.observations[i] for i in indices])
+
+    def _merge(self, observations: List[Dict[str, Dict[str, Any]]]) -> StatsSnapshot:
+        # rows per stat in the order of the first appearance of the stats
+        rows_per_stat = {}
+        for observation in observations:
+            for stat_name, stat in observation.items():
+                rows = rows_per_stat.get(stat_name, None)
+                if rows is None:
+                    rows = rows_per_stat[stat_name] = []
+                rows.append(stat)
+
+        merged = StatsSnapshot()
+        for stat_name, rows in rows_per_stat.items():
+            if not isinstance(rows[0], dict):
+                continue
+            if self.stats_schema is not None:
+                if not self.stats_schema.is_selected(stat_name):
+                    continue
+                fields = self.stats_schema.get_fields(stat_name)
+            else:
+                fields = None
+            columns = self.columns.get(stat_name, None)
+            if columns is None or not columns.matches(rows[0]):
+                columns = self.columns[stat_name] = _StatColumns(self.capacity, rows[0], fields)
+            stat = columns.write(rows) if columns.fields else None
+            # the fields differ between the observations, merge them one by one
+            merged[stat_name] = stat if stat is not None else _merge_rows(rows, fields)
+        return merged
+
+
+def _merge_rows(rows: List[Dict[str, Any]], fields: frozenset | None) -> Dict[str, np.ndarray]:
+    columns = {}
+    for row in rows:
+        for field, value in row.items():
+            if fields is None or field in fields:
+                column = columns.get(field, None)
+                if column is None:
+                    column = columns[field] = []
+                column.append(value)
+    return {field: _to_array(values) for field, values in columns.items()}
+
+
+def _to_array(values: List[Any]) -> np.ndarray:
+    dtypes = set(_get_column_dtype(v) for v in values)
+    return np.array(values, dtype=dtypes.pop() if len(dtypes) == 1 else np.result_type(*dtypes))
+
+
+def _single_getter(fields: tuple) -> Callable:
+    # itemgetter with one key returns a scalar instead of a tuple
+    return lambda row: tuple(row[f] for f in fields)
+
+
+def _get_column_dtype(value: Any) -> np.dtype:
+    if isinstance(value, (bool, np.bool_)):
+        return np.dtype(np.bool_)
+    elif isinstance(value, (int, np.integer)) and -(2**63) <= value < 2**63:
+        return np.dtype(np.int64)
+    elif isinstance(value, (float, np.floating)):
+        return np.dtype(np.float64)
+    else:
+        return np.dtype(object)
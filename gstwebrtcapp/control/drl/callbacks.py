@@ -74,7 +74,7 @@ class DrlCheckpointCallback(CheckpointCallback):
 class DrlPrintStepCallback(BaseCallback):
     """
     Prints each transition with all state vars and reward parts.
-    For the clear and concise output, it works only with a single environment or with a 1-dim vectorized one.
+    For the vectorized envs with several feeds, the transitions of each env are printed prefixed with the env index.
 
     :param verbose: Verbosity level (0 -- 2)
     """
@@ -89,20 +89,24 @@ class DrlPrintStepCallback(BaseCallback):
 
     def _on_step(self):
         if isinstance(self.env, VecEnv):
-            episodes = self.env.get_attr("episodes")[0]
-            steps = self.env.get_attr("steps")[0]
-            last_action = self.env.get_attr("last_action")[0]
-            state = self.env.get_attr("state")[0]
-            rewards = self.env.get_attr("reward_parts")[0]
-            is_finished = self.env.get_attr("is_finished")[0]
+            attrs = [
+                self.env.get_attr(attr)
+                for attr in ("episodes", "steps", "last_action", "state", "reward_parts", "is_finished")
+            ]
+            for env_idx, env_attrs in enumerate(zip(*attrs)):
+                self._print_step(*env_attrs, env_prefix=f"Env {env_idx}: " if self.env.num_envs > 1 else "")
         else:
-            episodes = self.env.episodes
-            steps = self.env.steps
-            last_action = self.env.last_action
-            state = self.env.state
-            rewards = self.env.reward_parts
-            is_finished = self.env.is_finished
+            self._print_step(
+                self.env.episodes,
+                self.env.steps,
+                self.env.last_action,
+                self.env.state,
+                self.env.reward_parts,
+                self.env.is_finished,
+            )
+        return True
 
+    def _print_step(self, episodes, steps, last_action, state, rewards, is_finished, env_prefix: str = "") -> None:
         state = {k: v.tolist() for k, v in state.items()}
         time_elapsed = datetime.datetime.now() - self.start_time
 
@@ -110,7 +114,7 @@ class DrlPrintStepCallback(BaseCallback):
             if self.verbose > 1:
                 # print on every step
                 LOGGER.info(
-                    "INFO: Training step info: \n "
+                    f"INFO: {env_prefix}Training step info: \n "
                     + f"Time elapsed (hh:mm:ss.ms) {time_elapsed}"
                     + "\n"
                     + f"Episodes: {episodes}"
@@ -128,7 +132,7 @@ class DrlPrintStepCallback(BaseCallback):
                 # print short version on every 100th step (and 1th as well)
                 if steps == 1 or (steps >= 100 and steps % 100 == 0):
                     LOGGER.info(
-                        "INFO: Training step info: \n "
+                        f"INFO: {env_prefix}Training step info: \n "
                         + f"Time elapsed (hh:mm:ss.ms) {time_elapsed}"
                         + "\n"
                         + f"Episodes: {episodes}"
@@ -136,13 +140,12 @@ class DrlPrintStepCallback(BaseCallback):
                         + f"Step: {steps},"
                         + "\n"
                     )
-        return True
 
 
 class DrlSaveStepCallback(BaseCallback):
     """
     Saves env step info to a csv file.
-    For the clear and concise output, it works only with a single environment or with a 1-dim vectorized one.
+    For the vectorized envs with several feeds, each env gets its own csv file suffixed with the env index.
 
     :param save_path: Path for the folder where csv files are saved.
     :param model_name: Current model name.
@@ -164,31 +167,41 @@ class DrlSaveStepCallback(BaseCallback):
 
     def _init_callback(self):
         self.env = self.eval_env if self.eval_env is not None else self.training_env
+        self.num_envs = self.env.num_envs if isinstance(self.env, VecEnv) else 1
         os.makedirs(self.save_path, exist_ok=True)
-        self.file_handler = open(self._get_csv_filename(), mode="a", newline="\n")
-        self.csv_writer = csv.DictWriter(self.file_handler, fieldnames=self._get_step_info().keys())
-        if os.stat(self._get_csv_filename()).st_size == 0:
-            self.csv_writer.writeheader()
-        self.file_handler.flush()
+        self.file_handlers = []
+        self.csv_writers = []
+        for env_idx, step_info in enumerate(self._get_step_infos()):
+            file_handler = open(self._get_csv_filename(env_idx), mode="a", newline="\n")
+            csv_writer = csv.DictWriter(file_handler, fieldnames=step_info.keys())
+            if os.stat(self._get_csv_filename(env_idx)).st_size == 0:
+                csv_writer.writeheader()
+            file_handler.flush()
+            self.file_handlers.append(file_handler)
+            self.csv_writers.append(csv_writer)
 
     def _on_step(self):
-        steps = self.env.get_attr("steps")[0] if isinstance(self.env, VecEnv) else self.env.steps
-        if steps > 0:
-            # might be a bug writing zero dummy step because of vecenv wrapper
-            self.csv_writer.writerow(self._get_step_info())
+        steps = self.env.get_attr("steps") if isinstance(self.env, VecEnv) else [self.env.steps]
+        step_infos = self._get_step_infos()
+        for env_idx, env_steps in enumerate(steps):
+            if env_steps > 0:
+                # might be a bug writing zero dummy step because of vecenv wrapper
+                self.csv_writers[env_idx].writerow(step_infos[env_idx])
         return True
 
     def _on_training_end(self):
-        self.file_handler.close()
+        for file_handler in self.file_handlers:
+            file_handler.close()
 
-    def _get_csv_filename(self):
-        return os.path.join(self.save_path, f"drl_training_{self.model_name}_{self.time}.csv")
+    def _get_csv_filename(self, env_idx: int = 0):
+        suffix = f"_env{env_idx}" if self.num_envs > 1 else ""
+        return os.path.join(self.save_path, f"drl_training_{self.model_name}_{self.time}{suffix}.csv")
 
-    def _get_step_info(self):
+    def _get_step_infos(self):
         if isinstance(self.env, VecEnv):
-            return self.env.env_method("get_step_info")[0]
+            return self.env.env_method("get_step_info")
         else:
-            return self.env.get_step_info()
+            return [self.env.get_step_info()]
 
 
 class DrlBreakCallback(BaseCallback):
@@ -224,8 +237,7 @@ class DrlBreakCallback(BaseCallback):
 
     def _trigger_stop(self, unfinished_indices):
         if isinstance(self.training_env, VecEnv):
-            for env_idx in unfinished_indices:
-                self.training_env.env_method("close")[env_idx]
+            self.training_env.env_method("close", indices=unfinished_indices)
         else:
             self.training_env.close()
 
@@ -20,6 +20,7 @@ class DrlConfig:
     :param save_model_path: The path to save the DRL model
     :param save_log_path: The path to save the DRL logs
     :param device: The device to run the DRL model on. Nullable
+    :param is_compiled_inference: Whether to evaluate a deterministic policy with the compiled batched inference engine
     :param verbose: The verbosity level. One of 0, 1, 2
     """
 
@@ -36,4 +37,5 @@ class DrlConfig:
     save_model_path: str = './models'
     save_log_path: str = './logs'
     device: str | None = None
+    is_compiled_inference: bool = False
     verbose: int = 1
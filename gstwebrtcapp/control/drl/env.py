@@ -1,20 +1,20 @@
 import collections
-import json
 from gymnasium.core import Env
 from gymnasium.spaces import Box, MultiDiscrete
 import numpy as np
 import time
 from typing import Any, Dict, List, OrderedDict
 
+from control.drl.buffer import ObservationBuffer
 from control.drl.mdp import MDP
-from message.client import MqttPair
+from message.client import MqttPair, unpack_mqtt_msg
 from utils.base import (
     LOGGER,
     sleep_until_condition_with_intervals,
-    merge_observations,
     select_n_equidistant_elements_from_list,
     cut_first_elements_in_list,
 )
+from utils.gst import StatsSnapshot
 
 
 class DrlEnv(Env):
@@ -25,6 +25,7 @@ class DrlEnv(Env):
         max_episodes: int = -1,
         state_update_interval: float = 1.0,
         max_inactivity_time: float = 20.0,
+        observation_buffer_capacity: int = 256,
     ):
         self.mdp = mdp
         self.mqtts = mqtts
@@ -40,16 +41,16 @@ class DrlEnv(Env):
         self.reward_parts = {}
         self.is_finished = False
 
+        # the accepted observations of the current step, merged column-wise into preallocated arrays
+        self.observation_buffer = ObservationBuffer(observation_buffer_capacity, self.mdp.get_stats_schema())
+
         self.observation_space = self.mdp.create_observation_space()
         self.action_space = self.mdp.create_action_space()
 
     def step(self, action):
         self.steps += 1
         self.last_action = action
-        self.mqtts.publisher.publish(
-            self.mqtts.subscriber.topics.actions,
-            json.dumps(self.mdp.pack_action_for_controller(action)),
-        )
+        self._apply_action(action)
 
         # get observation (webrtc stats) from the controller
         stats = self._get_observation()
@@ -88,6 +89,13 @@ class DrlEnv(Env):
         LOGGER.info(f"INFO: resetting the DRL env: episodes {self.episodes}, is finished {self.is_finished}")
         return self.state, {}
 
+    def _apply_action(self, action: Any) -> None:
+        # send the action to the controller
+        self.mqtts.publisher.publish(
+            self.mqtts.subscriber.topics.actions,
+            self.mdp.pack_action_for_controller(action),
+        )
+
     def _get_observation(self) -> Dict[str, Any] | None:
         # wait for the state update and check meanwhile if the env is finished
         is_finished = sleep_until_condition_with_intervals(10, self.state_update_interval, lambda: self.is_finished)
@@ -98,9 +106,14 @@ class DrlEnv(Env):
 
         time_inactivity_starts = time.time()
         is_collected = False
-        obs_list = []
+        self.observation_buffer.clear()
         while not is_collected and not self.is_finished:
-            stats = self.mqtts.subscriber.get_message(self.mqtts.subscriber.topics.stats)
+            # block until the next stats arrive, wake up at least once per state update interval to check is_finished
+            remaining_time = self.max_inactivity_time - (time.time() - time_inactivity_starts)
+            stats = self.mqtts.subscriber.get_message(
+                self.mqtts.subscriber.topics.stats,
+                timeout=max(0.0, min(remaining_time, self.state_update_interval)),
+            )
             if stats is None:
                 if time.time() - time_inactivity_starts > self.max_inactivity_time:
                     LOGGER.warning(
@@ -112,26 +125,32 @@ class DrlEnv(Env):
                     self.reward = 0.0
                     return None
             else:
-                stats_unwrapped = json.loads(stats.msg)
+                stats_unwrapped = StatsSnapshot.wrap(unpack_mqtt_msg(stats.msg))
                 if self.mdp.check_observation(stats_unwrapped):
-                    obs_list.append(stats_unwrapped)
+                    self.observation_buffer.append(stats_unwrapped)
                 is_collected = (
-                    len(obs_list) >= self.mdp.num_observations_for_state
+                    len(self.observation_buffer) >= self.mdp.num_observations_for_state
                     and self.mqtts.subscriber.message_queues[self.mqtts.subscriber.topics.stats].empty()
                 )
 
+        return self._select_observations()
+
+    def _select_observations(self) -> Dict[str, Any] | None:
         # 25% of the observations are selected to be cut to prevent the influence of the last action
-        if not self.mdp.is_deliver_all_observations:
-            obs_list = select_n_equidistant_elements_from_list(obs_list, self.mdp.num_observations_for_state, 25)
+        num_obs = len(self.observation_buffer)
+        if not self.mdp.is_deliver_all_observations and num_obs > 0:
+            indices = select_n_equidistant_elements_from_list(
+                list(range(num_obs)), self.mdp.num_observations_for_state, 25
+            )
         else:
-            obs_list = cut_first_elements_in_list(obs_list, 25, self.mdp.num_observations_for_state)
+            indices = cut_first_elements_in_list(list(range(num_obs)), 25, self.mdp.num_observations_for_state)
 
-        if len(obs_list) > 1:
-            # merge observations from list[dict[str, dict]] to dict[str, dict[list]]
-            return merge_observations(obs_list)
-        elif len(obs_list) == 1:
+        if len(indices) > 1:
+            # merge observations from list[dict[str, dict]] to dict[str, dict[np.ndarray]] (views into the buffer)
+            return self.observation_buffer.get_selected(indices)
+        elif len(indices) == 1:
             # old MDP versions consume unpacked observation of type dict[str, Any]
-            return obs_list[0]
+            return self.observation_buffer.get_observation(indices[0])
         else:
             if self.is_finished:
                 self._on_finish()
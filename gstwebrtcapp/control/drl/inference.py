@@ -0,0 +1,331 @@
+import copy
+import json
+import queue
+import threading
+from typing import Any, Dict, List, Mapping, Tuple
+
+from gymnasium import spaces
+import numpy as np
+import torch
+
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+
+class PolicyInputLayout:
+    '''
+    Flat float32 layout of a Dict (or Box) observation space: the values of each key occupy a fixed slice of one row
+    in the order of the space keys, i.e., the same order in which the SB3 extractors concatenate them. The states
+    (the MDP dicts or the gym samples) are written straight into the preallocated rows w/o intermediate arrays.
+
+    :param observation_space: The Dict observation space of the MDP or a Box one
+    '''
+
+    def __init__(self, observation_space: spaces.Space) -> None:
+        self.is_dict = isinstance(observation_space, spaces.Dict)
+        subspaces = observation_space.spaces if self.is_dict else {None: observation_space}
+        self.keys = []
+        self.shapes = []
+        self.slices = []
+        start = 0
+        for key, space in subspaces.items():
+            if not isinstance(space, spaces.Box):
+                raise GSTWEBRTCAPP_EXCEPTION(f"PolicyInputLayout: only Box observations are supported, got {space}")
+            size = int(np.prod(space.shape))
+            self.keys.append(key)
+            self.shapes.append(tuple(space.shape))
+            self.slices.append(slice(start, start + size))
+            start += size
+        self.size = start
+
+    def write(self, row: np.ndarray, state: Mapping[str, Any] | np.ndarray) -> None:
+        """
+        Write one state into the row of size self.size.
+        """
+        if not self.is_dict:
+            row[:] = np.ravel(state)
+            return
+        for key, s in zip(self.keys, self.slices):
+            value = state[key]
+            if s.stop - s.start == 1 and not isinstance(value, (list, tuple, np.ndarray)):
+                row[s.start] = value
+            else:
+                row[s] = np.ravel(value)
+
+    def write_batch(self, rows: np.ndarray, observations: Mapping[str, np.ndarray] | np.ndarray) -> None:
+        """
+        Write the batched observations (e.g., of a VecEnv: dict[key, array of shape (n, *shape)]) into the rows.
+        """
+        if not self.is_dict:
+            rows[:] = np.reshape(observations, rows.shape)
+            return
+        for key, s in zip(self.keys, self.slices):
+            rows[:, s] = np.reshape(observations[key], (rows.shape[0], s.stop - s.start))
+
+    def split(self, inputs: torch.Tensor) -> Dict[str, torch.Tensor] | torch.Tensor:
+        """
+        Split the flat tensor of shape (n, self.size) into the observation tensors as the policy expects them.
+        """
+        if not self.is_dict:
+            return inputs.reshape((-1,) + self.shapes[0])
+        return {
+            key: inputs[:, s].reshape((-1,) + shape) for key, s, shape in zip(self.keys, self.slices, self.shapes)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"keys": self.keys, "shapes": self.shapes}
+
+    @classmethod
+    def from_dict(cls, layout: Dict[str, Any]) -> 'PolicyInputLayout':
+        boxes = {
+            key: spaces.Box(low=-np.inf, high=np.inf, shape=tuple(shape), dtype=np.float32)
+            for key, shape in zip(layout["keys"], layout["shapes"])
+        }
+        return cls(spaces.Dict(boxes) if None not in boxes else boxes[None])
+
+
+class _FlatInputPolicy(torch.nn.Module):
+    # SB3 policy with the flat input tensor and the deterministic actions as the output, traceable by TorchScript
+    def __init__(self, policy: Any, layout: PolicyInputLayout) -> None:
+        super().__init__()
+        self.policy = policy
+        self.layout = layout
+
+    def forward(self, inputs: torch.Tensor) -> torch.Tensor:
+        return self.policy._predict(self.layout.split(inputs), deterministic=True)
+
+
+class PolicyInferenceEngine:
+    '''
+    Compiled (TorchScript, CPU) deterministic policy that serves the observations of many feeds in one forward pass.
+    The input tensor is preallocated for max_batch_size rows and the states are written into it directly, so one
+    step of N feeds costs a single forward pass and no per-feed tensor conversions.
+
+    The engine follows the SB3 predict() signature, so it could replace the model in evaluate_policy with a VecEnv
+    of several feeds. The actions are post-processed as SB3 does (unscaled or clipped to the action space bounds).
+
+    :param module: The TorchScript module that maps the flat float32 inputs of shape (n, layout.size) to the actions
+    :param layout: The input layout
+    :param action_low: The lower bounds of a Box action space. None for the other spaces or the ready actions
+    :param action_high: The upper bounds of a Box action space. None for the other spaces or the ready actions
+    :param is_squashed: Whether the module outputs the actions in [-1, 1] that should be unscaled to the bounds
+    :param max_batch_size: The maximal number of states per forward pass
+    '''
+
+    def __init__(
+        self,
+        module: torch.jit.ScriptModule,
+        layout: PolicyInputLayout,
+        action_low: np.ndarray | None = None,
+        action_high: np.ndarray | None = None,
+        is_squashed: bool = False,
+        max_batch_size: int = 64,
+    ) -> None:
+        self.module = module
+        self.layout = layout
+        self.action_low = action_low
+        self.action_high = action_high
+        self.is_squashed = is_squashed
+        self.max_batch_size = max(1, max_batch_size)
+        # the numpy view shares the memory with the tensor
+        self.inputs = torch.zeros((self.max_batch_size, self.layout.size), dtype=torch.float32)
+        self.inputs_np = self.inputs.numpy()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_sb3(cls, model: Any, max_batch_size: int = 64) -> 'PolicyInferenceEngine':
+        """
+        Export the policy of a trained SB3 model once: a CPU copy of it is traced with TorchScript and frozen.
+
+        :param model: SB3 model (e.g., SAC, PPO)
+        :param max_batch_size: The maximal number of states per forward pass
+        :return: the engine
+        """
+        policy = copy.deepcopy(model.policy).cpu()
+        policy.set_training_mode(False)
+        layout = PolicyInputLayout(policy.observation_space)
+        module = _FlatInputPolicy(policy, layout).eval()
+        with torch.no_grad():
+            traced = torch.jit.trace(module, torch.zeros((max(1, max_batch_size), layout.size)), check_trace=False)
+        try:
+            traced = torch.jit.freeze(traced)
+        except RuntimeError as e:
+            LOGGER.warning(f"WARNING: PolicyInferenceEngine: the traced policy could not be frozen: {e}")
+        action_space = policy.action_space
+        is_box = isinstance(action_space, spaces.Box)
+        LOGGER.info(f"OK: PolicyInferenceEngine: exported {type(model).__name__} policy with {layout.size} inputs")
+        return cls(
+            traced,
+            layout,
+            action_space.low if is_box else None,
+            action_space.high if is_box else None,
+            bool(policy.squash_output) if is_box else False,
+            max_batch_size,
+        )
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        observation_space: spaces.Space | None = None,
+        max_batch_size: int = 64,
+    ) -> 'PolicyInferenceEngine':
+        """
+        Load the engine saved with save() or a TorchScript policy exported elsewhere, e.g., by d3rlpy save_policy().
+        The foreign policies take the flat observations and output the ready actions, so they need the observation
+        space to build the input layout.
+
+        :param path: path to the TorchScript file
+        :param observation_space: the observation space. Required for the foreign policies only
+        :param max_batch_size: The maximal number of states per forward pass
+        :return: the engine
+        """
+        extra_files = {"engine.json": ""}
+        module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        module.eval()
+        if extra_files["engine.json"]:
+            meta = json.loads(extra_files["engine.json"])
+            layout = PolicyInputLayout.from_dict(meta["layout"])
+            action_low = np.asarray(meta["action_low"], dtype=np.float32) if meta["action_low"] is not None else None
+            action_high = np.asarray(meta["action_high"], dtype=np.float32) if meta["action_high"] is not None else None
+            is_squashed = meta["is_squashed"]
+        elif observation_space is not None:
+            layout = PolicyInputLayout(observation_space)
+            action_low, action_high, is_squashed = None, None, False
+        else:
+            raise GSTWEBRTCAPP_EXCEPTION(f"PolicyInferenceEngine: no observation space is given for the policy {path}")
+        LOGGER.info(f"OK: PolicyInferenceEngine: loaded the policy from {path}")
+        return cls(module, layout, action_low, action_high, is_squashed, max_batch_size)
+
+    def save(self, path: str) -> None:
+        meta = {
+            "layout": self.layout.to_dict(),
+            "action_low": self.action_low.tolist() if self.action_low is not None else None,
+            "action_high": self.action_high.tolist() if self.action_high is not None else None,
+            "is_squashed": self.is_squashed,
+        }
+        torch.jit.save(self.module, path, _extra_files={"engine.json": json.dumps(meta)})
+
+    def predict_batch(self, states: List[Mapping[str, Any] | np.ndarray]) -> np.ndarray:
+        """
+        Get the actions for the states of many feeds in one forward pass (in chunks of max_batch_size).
+
+        :param states: the states, e.g., made by MDP.make_state or returned by DrlEnv.step
+        :return: actions of shape (len(states), *action_shape)
+        """
+        with self._lock:
+            actions = []
+            for start in range(0, len(states), self.max_batch_size):
+                chunk = states[start : start + self.max_batch_size]
+                for i, state in enumerate(chunk):
+                    self.layout.write(self.inputs_np[i], state)
+                actions.append(self._forward(len(chunk)))
+            return np.concatenate(actions) if len(actions) > 1 else actions[0]
+
+    def predict(
+        self,
+        observation: Mapping[str, np.ndarray] | np.ndarray,
+        state: Tuple[np.ndarray, ...] | None = None,
+        episode_start: np.ndarray | None = None,
+        deterministic: bool = True,
+    ) -> Tuple[np.ndarray, Tuple[np.ndarray, ...] | None]:
+        """
+        SB3-compatible predict for the batched observations of a VecEnv. The actions are always deterministic.
+        """
+        first = next(iter(observation.values())) if isinstance(observation, Mapping) else observation
+        first_shape = self.layout.shapes[0]
+        n = first.shape[0] if first.ndim > len(first_shape) else 1
+        if n > self.max_batch_size:
+            raise GSTWEBRTCAPP_EXCEPTION(f"PolicyInferenceEngine: batch {n} exceeds the max {self.max_batch_size}")
+        with self._lock:
+            self.layout.write_batch(self.inputs_np[:n], observation)
+            return self._forward(n), state
+
+    def _forward(self, n: int) -> np.ndarray:
+        with torch.inference_mode():
+            actions = self.module(self.inputs[:n]).numpy()
+        if self.action_low is not None:
+            if self.is_squashed:
+                actions = self.action_low + 0.5 * (actions + 1.0) * (self.action_high - self.action_low)
+            else:
+                actions = np.clip(actions, self.action_low, self.action_high)
+        return actions
+
+
+class BatchedPolicyServer:
+    '''
+    Serves the policy to many feeds running in their own threads (e.g., one agent per feed) with one model instance.
+    The concurrent requests are gathered into one forward pass: the server waits up to max_delay seconds after
+    the first pending request for the others to join the batch.
+
+    :param engine: The inference engine
+    :param max_delay: The maximal time in seconds to wait for a batch to be filled
+    '''
+
+    def __init__(self, engine: PolicyInferenceEngine, max_delay: float = 0.002) -> None:
+        self.engine = engine
+        self.max_delay = max_delay
+        self.requests = queue.SimpleQueue()
+        self.is_running = False
+        self.thread = None
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._serve, name="policy_server", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.is_running = False
+        self.requests.put(None)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def predict(self, state: Mapping[str, Any] | np.ndarray, timeout: float | None = None) -> np.ndarray:
+        """
+        Get the action for one state. Could be called from any thread, blocks until the batch is served.
+        """
+        if not self.is_running:
+            raise GSTWEBRTCAPP_EXCEPTION("BatchedPolicyServer: the server is not running")
+        request = [state, None, threading.Event()]
+        self.requests.put(request)
+        if not request[2].wait(timeout):
+            raise GSTWEBRTCAPP_EXCEPTION("BatchedPolicyServer: the request has timed out")
+        if isinstance(request[1], Exception):
+            raise request[1]
+        return request[1]
+
+    def _serve(self) -> None:
+        while self.is_running:
+            request = self.requests.get()
+            if request is None:
+                continue
+            batch = [request]
+            while len(batch) < self.engine.max_batch_size:
+                try:
+                    request = self.requests.get(timeout=self.max_delay)
+                except queue.Empty:
+                    break
+                if request is None:
+                    break
+                batch.append(request)
+            try:
+                actions = self.engine.predict_batch([r[0] for r in batch])
+                for r, action in zip(batch, actions):
+                    r[1] = action
+            except Exception as e:
+                LOGGER.error(f"ERROR: BatchedPolicyServer: failed to serve a batch of {len(batch)}: {e}")
+                for r in batch:
+                    r[1] = e
+            for r in batch:
+                r[2].set()
+        # release the requests that came after stop()
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request[1] = GSTWEBRTCAPP_EXCEPTION("BatchedPolicyServer: the server has been stopped")
+                request[2].set()
@@ -1,3 +1,4 @@
+import copy
 import csv
 import os
 import time
@@ -7,6 +8,7 @@ from typing import Dict, List, Tuple, Union
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.evaluation import evaluate_policy
 from stable_baselines3.common.logger import configure
+from stable_baselines3.common.vec_env import VecEnv
 
 from control.drl.config import DrlConfig
 from control.drl.callbacks import (
@@ -17,8 +19,10 @@ from control.drl.callbacks import (
     DrlBreakCallback,
 )
 from control.drl.env import DrlEnv
+from control.drl.inference import PolicyInferenceEngine
 from control.drl.mconfigurator import DrlModelConfigurator
 from control.drl.mdp import MDP
+from control.drl.vec_env import ThreadedVecEnv
 from message.client import MqttPair
 from utils.base import LOGGER
 
@@ -26,28 +30,32 @@ from utils.base import LOGGER
 class DrlManager:
     """
     A manager for preprocessing, running and overall controlling of DRL training/evaluation process, namely it:
-        1) instantiates a Gymnasium environment,\n
+        1) instantiates a Gymnasium environment (a vectorized one for several feeds),\n
         2) configures SB3 DRL model according to the given hyperparameters and configuration settings,\n
         3) attaches loggers and callbacks and controls the output directories,\n
         4) performs a training or evaluation process for the DRL model using SB3 backend.\n
 
     :param config: DRL model params, look into ``control/drl/config.py``.
     :param mdp: The MDP instance, look into ``control/drl/mdp.py``.
-    :param mqtts: MQTT instances`.
+    :param mqtts: MQTT instances`. A list of them (one per feed) runs one env per feed stepped in parallel.
     """
 
     MAX_EPISODES = 1e9
 
-    def __init__(self, config: DrlConfig, mdp: MDP, mqtts: MqttPair):
+    def __init__(self, config: DrlConfig, mdp: MDP, mqtts: MqttPair | List[MqttPair]):
         self.config = config
+        self.mqtts_list = mqtts if isinstance(mqtts, list) else [mqtts]
+        self.mqtts = self.mqtts_list[0]
+        # each env gets its own copy of the MDP since the MDPs keep the per-feed state (last stats, rtts, etc.)
+        self.mdps = [mdp] + [copy.deepcopy(mdp) for _ in self.mqtts_list[1:]]
         self.mdp = mdp
-        self.mqtts = mqtts
 
         self._setup()
 
     def _setup(self) -> None:
-        # set mqqts for the mdp
-        self.mdp.mqtts = self.mqtts
+        # set mqqts for the mdps
+        for mdp, mqtts in zip(self.mdps, self.mqtts_list):
+            mdp.mqtts = mqtts
 
         # set paths
         self.log_path, self.model_path = self._set_save_paths(self.config.save_log_path, self.config.save_model_path)
@@ -82,13 +90,16 @@ class DrlManager:
                 LOGGER.info("INFO: Cuda is OFF: using cpu only\n")
 
         # initialize env
-        self.env = DrlEnv(
-            mdp=self.mdp,
-            mqtts=self.mqtts,
-            max_episodes=self.episodes,
-            state_update_interval=self.config.state_update_interval,
-            max_inactivity_time=self.config.state_max_inactivity_time,
-        )
+        if len(self.mqtts_list) == 1:
+            self.env = self._make_env(self.mdp, self.mqtts)
+        else:
+            self.env = ThreadedVecEnv(
+                [
+                    lambda mdp=mdp, mqtts=mqtts: self._make_env(mdp, mqtts)
+                    for mdp, mqtts in zip(self.mdps, self.mqtts_list)
+                ]
+            )
+            LOGGER.info(f"OK: {self.env.num_envs} DRL envs are stepped in parallel, one per feed")
 
         # initialize SB3 DRL model
         if isinstance(self.config.hyperparams_cfg, Dict):
@@ -153,7 +164,11 @@ class DrlManager:
     def reset(self, is_load_last_model: bool = False) -> None:
         """reset the manager after breaking the training"""
 
-        self.env.reset(options={"reset_after_break": True})
+        if isinstance(self.env, VecEnv):
+            self.env.set_options({"reset_after_break": True})
+            self.env.reset()
+        else:
+            self.env.reset(options={"reset_after_break": True})
 
         if (
             is_load_last_model
@@ -175,7 +190,10 @@ class DrlManager:
     def stop(self) -> None:
         """stop the manager and the env"""
 
-        self.env.is_finished = True
+        if isinstance(self.env, VecEnv):
+            self.env.set_attr("is_finished", True)
+        else:
+            self.env.is_finished = True
 
     def train(self) -> None:
         """train the model"""
@@ -205,12 +223,22 @@ class DrlManager:
         else:
             callback_step = None
 
+        policy = self.model
+        if self.config.is_compiled_inference:
+            if self.deterministic:
+                # one forward pass of the compiled policy for the observations of all feeds
+                policy = PolicyInferenceEngine.from_sb3(
+                    self.model, max_batch_size=self.env.num_envs if isinstance(self.env, VecEnv) else 1
+                )
+            else:
+                LOGGER.warning("WARNING: The compiled inference is deterministic, using the model for det=False")
+
         LOGGER.info(
             f"OK: Evaluating {self.config.model_name} model with det={self.deterministic} for"
             f" {self.total_timesteps} steps...\n"
         )
         episode_rewards, episode_lengths = evaluate_policy(
-            self.model,
+            policy,
             self.env,
             n_eval_episodes=self.episodes,
             deterministic=self.deterministic,
@@ -229,6 +257,15 @@ class DrlManager:
                     [{"episode_rewards": i, "episode_lengths": j} for i, j in zip(episode_rewards, episode_lengths)]
                 )
 
+    def _make_env(self, mdp: MDP, mqtts: MqttPair) -> DrlEnv:
+        return DrlEnv(
+            mdp=mdp,
+            mqtts=mqtts,
+            max_episodes=self.episodes,
+            state_update_interval=self.config.state_update_interval,
+            max_inactivity_time=self.config.state_max_inactivity_time,
+        )
+
     def _set_save_paths(self, save_log_path: str, save_model_path: str) -> None:
         assert save_log_path is not None and save_model_path is not None, "ERROR: save paths are not set!"
         timestamp = time.strftime("%Y%m%d-%H%M%S-%f")[:-3]
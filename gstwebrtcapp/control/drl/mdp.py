@@ -2,15 +2,62 @@ from abc import ABCMeta, abstractmethod
 import collections
 from gymnasium import spaces
 import numpy as np
-from typing import Any, Dict, OrderedDict, Tuple
+from typing import Any, Dict, List, OrderedDict, Tuple
 
 from control.drl.reward import RewardFunctionFactory
 from media.preset import VideoPresets
-from utils.base import LOGGER, scale, unscale, get_list_average, slice_list_in_intervals
-from utils.gst import GstWebRTCStatsType, find_stat, get_stat_diff, get_stat_diff_concat
+from utils.base import (
+    LOGGER,
+    scale,
+    scale_array,
+    unscale,
+    get_interval_averages,
+    get_safe_ratios,
+)
+from utils.gst import (
+    GstWebRTCStatsType,
+    StatsSchema,
+    find_stat,
+    find_stat_by_ssrc,
+    get_stat_diff,
+    get_stat_diff_array,
+    get_stat_diff_concat,
+)
+from utils.streaming import RunningStats, get_sliding_running_stats
 from utils.webrtc import clock_units_to_seconds, ntp_short_format_to_seconds
 
 
+# fields of the stats that are read by the viewer MDPs
+VIEWER_OBS_FIELDS = {
+    GstWebRTCStatsType.RTP_OUTBOUND_STREAM: [
+        "packets-sent",
+        "packets-received",
+        "bytes-sent",
+        "bytes-received",
+        "nack-count",
+        "pli-count",
+        "clock-rate",
+    ],
+    GstWebRTCStatsType.RTP_INBOUND_STREAM: ["rb-packetslost", "rb-round-trip", "rb-jitter"],
+    GstWebRTCStatsType.ICE_CANDIDATE_PAIR: ["bitrate-recv", "bitrate-sent"],
+}
+
+
+# merged stats read by the sequential viewer MDPs as rows of one 2-D array
+SEQ_OUTBOUND_COUNTERS = ["packets-sent", "packets-received", "nack-count", "pli-count"]
+SEQ_OUTBOUND_BYTES = ["timestamp", "bytes-received", "bytes-sent"]
+SEQ_INBOUND_STATS = ["rb-packetslost", "rb-round-trip", "rb-jitter"]
+# raw sequential features: fraction loss, loss, fraction nack, fraction pli, rtt, jitter, rx rate, tx rate
+SEQ_SKIP_ZEROES = np.array([False, False, False, False, False, False, True, True])
+
+
+def _get_loss_rates(lost: np.ndarray | List[int | float], sent: np.ndarray | List[int | float]) -> np.ndarray:
+    # lost / (sent + lost) per sample, 0 if nothing has been sent or lost
+    n = min(len(lost), len(sent))
+    lost = np.asarray(lost[:n], dtype=np.float64)
+    return get_safe_ratios(lost, np.asarray(sent[:n], dtype=np.float64) + lost)
+
+
 class MDP(metaclass=ABCMeta):
     '''
     MDP is an abstract class for Markov Decision Process. It defines the interface for the environment.
@@ -62,6 +109,7 @@ class MDP(metaclass=ABCMeta):
         self.max_rb_packetslost = 0
         self.first_ssrc = None
         self.obs_filter = None
+        self.obs_fields = None
 
     @abstractmethod
     def reset(self):
@@ -72,6 +120,7 @@ class MDP(metaclass=ABCMeta):
         self.last_stats = None
         self.last_states = collections.deque(maxlen=self.state_history_size + 1)
         self.last_actions = collections.deque(maxlen=self.state_history_size + 1)
+        self.max_rb_packetslost = 0
 
     @abstractmethod
     def create_observation_space(self) -> spaces.Dict:
@@ -133,19 +182,30 @@ class MDP(metaclass=ABCMeta):
                         return False
 
         # check that pl not smaller than last max seen packet lost
-        for rtp_inbound in rtp_inbounds:
-            # haven't seen any packet lost yet
-            if self.first_ssrc is None:
-                return True
-            else:
-                if rtp_inbound["ssrc"] == self.first_ssrc:
-                    rb_packetslost = rtp_inbound["rb-packetslost"]
-                    # assumed that packet lost increases more or less in the same manner
-                    if rb_packetslost < self.max_rb_packetslost:
-                        return False
-                    else:
-                        self.max_rb_packetslost = rb_packetslost
-                        return True
+        # haven't seen any packet lost yet
+        if self.first_ssrc is None:
+            return True
+        rtp_inbound = find_stat_by_ssrc(obs, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+        if rtp_inbound is None:
+            return False
+        rb_packetslost = rtp_inbound["rb-packetslost"]
+        # assumed that packet lost increases more or less in the same manner
+        if rb_packetslost < self.max_rb_packetslost:
+            return False
+        else:
+            self.max_rb_packetslost = rb_packetslost
+            return True
+
+    def get_stats_schema(self) -> StatsSchema | None:
+        # stats types from obs_filter with the fields from obs_fields (all fields if not given), None means all stats
+        if self.obs_filter is None:
+            return None
+        obs_fields = self.obs_fields or {}
+        stats = list(self.obs_filter)
+        if GstWebRTCStatsType.RTP_INBOUND_STREAM not in stats:
+            # always needed by check_observation
+            stats.append(GstWebRTCStatsType.RTP_INBOUND_STREAM)
+        return StatsSchema({stat: obs_fields.get(stat, None) for stat in stats})
 
     def is_terminated(self, step: int) -> bool:
         return False
@@ -186,12 +246,14 @@ class ViewerMDP(MDP):
             GstWebRTCStatsType.RTP_INBOUND_STREAM,
             GstWebRTCStatsType.ICE_CANDIDATE_PAIR,
         ]
+        self.obs_fields = VIEWER_OBS_FIELDS
 
         self.reset()
 
     def reset(self):
         super().reset()
-        self.rtts = []
+        # running min, mean and std of all rtts of the episode
+        self.rtts = RunningStats()
 
     def create_observation_space(self) -> spaces.Dict:
         # normalized to [0, 1]
@@ -263,123 +325,124 @@ class ViewerMDP(MDP):
         last_rtp_outbound = (
             find_stat(self.last_stats, GstWebRTCStatsType.RTP_OUTBOUND_STREAM) if self.last_stats is not None else None
         )
-        last_rtp_inbound = (
-            find_stat(self.last_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM) if self.last_stats is not None else None
-        )
+        last_stats = self.last_stats
         self.last_stats = stats
 
         if self.first_ssrc is None:
             # FIXME: make first ever ssrc to be the privileged one and take stats only from it
             self.first_ssrc = rtp_inbound[0]["ssrc"]
 
-        for i, rtp_inbound_ssrc in enumerate(rtp_inbound):
-            if rtp_inbound_ssrc["ssrc"] == self.first_ssrc:
-                last_rtp_inbound_ssrc = last_rtp_inbound[i] if last_rtp_inbound is not None else None
-                last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
-
-                # get needed stats
-                packets_sent_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
-                packets_recv_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-received")
-                ts_diff_sec = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp") / 1000
-
-                # loss rates
-                # 1. fraction loss rate
-                rb_packetslost_diff = get_stat_diff(rtp_inbound[i], last_rtp_inbound_ssrc, "rb-packetslost")
-                fraction_loss_rate = (
-                    rb_packetslost_diff / (packets_sent_diff + rb_packetslost_diff)
-                    if packets_sent_diff + rb_packetslost_diff > 0
-                    else 0
-                )
-                fraction_loss_rate = max(0, min(1, fraction_loss_rate))
-                # 7. global loss rate
-                loss_rate = (
-                    rtp_inbound[i]["rb-packetslost"]
-                    / (rtp_outbound[0]["packets-sent"] + rtp_inbound[i]["rb-packetslost"])
-                    if rtp_outbound[0]["packets-sent"] + rtp_inbound[i]["rb-packetslost"] > 0
-                    else 0.0
-                )
+        rtp_inbound_ssrc = find_stat_by_ssrc(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+        if rtp_inbound_ssrc is None:
+            LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
+            return self.make_default_state()
+        last_rtp_inbound_ssrc = (
+            find_stat_by_ssrc(last_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+            if last_stats is not None
+            else None
+        )
+        last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
+
+        # get needed stats
+        packets_sent_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
+        packets_recv_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-received")
+        ts_diff_sec = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp") / 1000
+
+        # loss rates
+        # 1. fraction loss rate
+        rb_packetslost_diff = get_stat_diff(rtp_inbound_ssrc, last_rtp_inbound_ssrc, "rb-packetslost")
+        fraction_loss_rate = (
+            rb_packetslost_diff / (packets_sent_diff + rb_packetslost_diff)
+            if packets_sent_diff + rb_packetslost_diff > 0
+            else 0
+        )
+        fraction_loss_rate = max(0, min(1, fraction_loss_rate))
+        # 7. global loss rate
+        loss_rate = (
+            rtp_inbound_ssrc["rb-packetslost"]
+            / (rtp_outbound[0]["packets-sent"] + rtp_inbound_ssrc["rb-packetslost"])
+            if rtp_outbound[0]["packets-sent"] + rtp_inbound_ssrc["rb-packetslost"] > 0
+            else 0.0
+        )
 
-                # 2. fraction nack rate
-                recv_nack_count_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "nack-count")
-                fraction_nack_rate = recv_nack_count_diff / packets_recv_diff if packets_recv_diff > 0 else 0.0
-
-                # 3. fraction pli rate
-                recv_pli_count_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "pli-count")
-                fraction_pli_rate = recv_pli_count_diff / packets_recv_diff if packets_recv_diff > 0 else 0.0
-
-                # rtts: RTT comes in NTP short format
-                rtt = ntp_short_format_to_seconds(rtp_inbound[i]["rb-round-trip"]) / self.CONSTANTS["MAX_DELAY_SEC"]
-                self.rtts.append(rtt)
-
-                # 4. fraction queueing rtt
-                fraction_queueing_rtt = rtt - min(self.rtts) if len(self.rtts) > 0 else 0.0
-                # 9. mean rtt
-                rtt_mean = np.mean(self.rtts) if len(self.rtts) > 0 else 0.0
-                # 10. std rtt
-                rtt_std = np.std(self.rtts) if len(self.rtts) > 0 else 0.0
-
-                # 6. jitter: comes in clock units
-                interarrival_jitter = (
-                    clock_units_to_seconds(rtp_inbound[i]["rb-jitter"], rtp_outbound[0]["clock-rate"])
-                    / self.CONSTANTS["MAX_DELAY_SEC"]
-                )
+        # 2. fraction nack rate
+        recv_nack_count_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "nack-count")
+        fraction_nack_rate = recv_nack_count_diff / packets_recv_diff if packets_recv_diff > 0 else 0.0
+
+        # 3. fraction pli rate
+        recv_pli_count_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "pli-count")
+        fraction_pli_rate = recv_pli_count_diff / packets_recv_diff if packets_recv_diff > 0 else 0.0
+
+        # rtts: RTT comes in NTP short format
+        rtt = ntp_short_format_to_seconds(rtp_inbound_ssrc["rb-round-trip"]) / self.CONSTANTS["MAX_DELAY_SEC"]
+        self.rtts.update(rtt)
+
+        # 4. fraction queueing rtt
+        fraction_queueing_rtt = rtt - self.rtts.min
+        # 9. mean rtt
+        rtt_mean = self.rtts.mean
+        # 10. std rtt
+        rtt_std = self.rtts.std
+
+        # 6. jitter: comes in clock units
+        interarrival_jitter = (
+            clock_units_to_seconds(rtp_inbound_ssrc["rb-jitter"], rtp_outbound[0]["clock-rate"])
+            / self.CONSTANTS["MAX_DELAY_SEC"]
+        )
 
-                # 11. rx rate
-                try:
-                    bitrate_recv = ice_candidate_pair[0]["bitrate-recv"]
-                    rx_rate = scale(
-                        bitrate_recv / 1000000,
-                        self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                        self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                    )
-                except KeyError:
-                    rx_bytes_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
-                    rx_mbits_diff = rx_bytes_diff * 8 / 1000000
-                    rx_rate = rx_mbits_diff / ts_diff_sec if ts_diff_sec > 0 else 0.0
-                    rx_rate = scale(
-                        rx_rate, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
-                    )
-
-                # 12. tx rate
-                try:
-                    bitrate_sent = ice_candidate_pair[0]["bitrate-sent"]
-                    tx_rate = scale(
-                        bitrate_sent / 1000000,
-                        self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                        self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                    )
-                except KeyError:
-                    tx_bytes_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-sent")
-                    tx_mbits_diff = tx_bytes_diff * 8 / 1000000
-                    tx_rate = tx_mbits_diff / ts_diff_sec if ts_diff_sec > 0 else 0.0
-                    tx_rate = scale(
-                        tx_rate, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
-                    )
-
-                # form the final state
-                state = collections.OrderedDict(
-                    {
-                        "bandwidth": bandwidth,
-                        "fractionLossRate": fraction_loss_rate,
-                        "fractionNackRate": fraction_nack_rate,
-                        "fractionPliRate": fraction_pli_rate,
-                        "fractionQueueingRtt": fraction_queueing_rtt,
-                        "fractionRtt": rtt,
-                        "interarrivalRttJitter": interarrival_jitter,
-                        "lossRate": loss_rate,
-                        "rttMean": rtt_mean,
-                        "rttStd": rtt_std,
-                        "rxGoodput": rx_rate,
-                        "txGoodput": tx_rate,
-                    }
-                )
+        # 11. rx rate
+        try:
+            bitrate_recv = ice_candidate_pair[0]["bitrate-recv"]
+            rx_rate = scale(
+                bitrate_recv / 1000000,
+                self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
+                self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
+            )
+        except KeyError:
+            rx_bytes_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
+            rx_mbits_diff = rx_bytes_diff * 8 / 1000000
+            rx_rate = rx_mbits_diff / ts_diff_sec if ts_diff_sec > 0 else 0.0
+            rx_rate = scale(
+                rx_rate, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
+            )
 
-                self.last_states.append(state)
-                self.update_reward_params()
-                return state
+        # 12. tx rate
+        try:
+            bitrate_sent = ice_candidate_pair[0]["bitrate-sent"]
+            tx_rate = scale(
+                bitrate_sent / 1000000,
+                self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
+                self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
+            )
+        except KeyError:
+            tx_bytes_diff = get_stat_diff(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-sent")
+            tx_mbits_diff = tx_bytes_diff * 8 / 1000000
+            tx_rate = tx_mbits_diff / ts_diff_sec if ts_diff_sec > 0 else 0.0
+            tx_rate = scale(
+                tx_rate, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
+            )
+
+        # form the final state
+        state = collections.OrderedDict(
+            {
+                "bandwidth": bandwidth,
+                "fractionLossRate": fraction_loss_rate,
+                "fractionNackRate": fraction_nack_rate,
+                "fractionPliRate": fraction_pli_rate,
+                "fractionQueueingRtt": fraction_queueing_rtt,
+                "fractionRtt": rtt,
+                "interarrivalRttJitter": interarrival_jitter,
+                "lossRate": loss_rate,
+                "rttMean": rtt_mean,
+                "rttStd": rtt_std,
+                "rxGoodput": rx_rate,
+                "txGoodput": tx_rate,
+            }
+        )
 
-        LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
-        return self.make_default_state()
+        self.last_states.append(state)
+        self.update_reward_params()
+        return state
 
     def convert_to_unscaled_state(self, state: OrderedDict[str, Any]) -> OrderedDict[str, Any]:
         return (
@@ -457,12 +520,14 @@ class ViewerSeqMDP(MDP):
             GstWebRTCStatsType.RTP_INBOUND_STREAM,
             GstWebRTCStatsType.ICE_CANDIDATE_PAIR,
         ]
+        self.obs_fields = VIEWER_OBS_FIELDS
 
         self.reset()
 
     def reset(self):
         super().reset()
-        self.rtts = []
+        # running min, mean and std of all rtts of the episode
+        self.rtts = RunningStats()
 
     def create_observation_space(self) -> spaces.Dict:
         # normalized to [0, 1]
@@ -545,179 +610,203 @@ class ViewerSeqMDP(MDP):
         last_rtp_outbound = (
             find_stat(stats, GstWebRTCStatsType.RTP_OUTBOUND_STREAM) if self.last_stats is not None else None
         )
-        last_rtp_inbound = (
-            find_stat(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM) if self.last_stats is not None else None
-        )
+        last_inbound_stats = stats if self.last_stats is not None else None
         self.last_stats = stats
 
         if self.first_ssrc is None:
             # FIXME: make first ever ssrc to be the privileged one and take stats only from it
             self.first_ssrc = rtp_inbound[0]["ssrc"][0]
 
-        for i, rtp_inbound_ssrc in enumerate(rtp_inbound):
-            if rtp_inbound_ssrc["ssrc"][0] == self.first_ssrc:
-                last_rtp_inbound_ssrc = last_rtp_inbound[i] if last_rtp_inbound is not None else None
-                last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
-
-                # get needed stats
-                packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
-                packets_recv_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-received")
-                ts_diff_sec = [
-                    ts / 1000 for ts in get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp")
-                ]
-
-                # loss rates
-                # 1. fraction loss rate
-                rb_packetslost_diff = get_stat_diff_concat(rtp_inbound[i], last_rtp_inbound_ssrc, "rb-packetslost")
-                fraction_loss_rates_raw = [
-                    lost / (sent + lost) if sent + lost > 0 else 0.0
-                    for lost, sent in zip(rb_packetslost_diff, packets_sent_diff)
-                ]
-                fraction_loss_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_loss_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 7. global loss rate
-                loss_rates_raw = [
-                    lost / (sent + lost) if sent + lost > 0 else 0.0
-                    for lost, sent in zip(rtp_inbound[i]["rb-packetslost"], rtp_outbound[0]["packets-sent"])
-                ]
-
-                loss_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(loss_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 2. fraction nack rate
-                recv_nack_count_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "nack-count")
-                fraction_nack_rates_raw = [
-                    nack / recv if recv > 0 else 0.0 for nack, recv in zip(recv_nack_count_diff, packets_recv_diff)
-                ]
-                fraction_nack_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_nack_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 3. fraction pli rate
-                recv_pli_count_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "pli-count")
-                fraction_pli_rates_raw = [
-                    pli / recv if recv > 0 else 0.0 for pli, recv in zip(recv_pli_count_diff, packets_recv_diff)
-                ]
-                fraction_pli_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_pli_rates_raw, self.num_observations_for_state)
-                ]
-
-                # rtts: RTT comes in NTP short format
-                rtts_raw = [
-                    scale(ntp_short_format_to_seconds(rtt), 0, self.CONSTANTS["MAX_DELAY_SEC"])
-                    for rtt in rtp_inbound[i]["rb-round-trip"]
-                ]
-                self.rtts.extend(rtts_raw)
-                rtts = [
-                    get_list_average(mi) for mi in slice_list_in_intervals(rtts_raw, self.num_observations_for_state)
-                ]
-
-                # 4. fraction queueing rtt
-                fraction_queueing_rtts = [rtt - min(self.rtts) if len(self.rtts) > 0 else 0.0 for rtt in rtts]
-                # 9. mean rtt
-                rtt_mean = np.mean(self.rtts) if len(self.rtts) > 0 else 0.0
-                # 10. std rtt
-                rtt_std = np.std(self.rtts) if len(self.rtts) > 0 else 0.0
-
-                # 6. jitter: comes in clock units
-                interarrival_jitters_raw = [
-                    scale(
-                        clock_units_to_seconds(j, rtp_outbound[0]["clock-rate"][0]), 0, self.CONSTANTS["MAX_DELAY_SEC"]
-                    )
-                    for j in rtp_inbound[i]["rb-jitter"]
-                ]
-                interarrival_jitters = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(interarrival_jitters_raw, self.num_observations_for_state)
-                ]
-
-                # 11. rx rate
-                try:
-                    bitrate_recvs = ice_candidate_pair[0]["bitrate-recv"]
-                    rx_rates_raw = [
-                        scale(
-                            b / 1000000,
-                            self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                            self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                        )
-                        for b in bitrate_recvs
-                    ]
-                    rx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(rx_rates_raw, self.num_observations_for_state)
-                    ]
-                except KeyError:
-                    rx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
-                    rx_mbits_diff = [r * 8 / 1000000 for r in rx_bytes_diff]
-                    rx_rates = [r / ts if ts > 0 else 0.0 for r, ts in zip(rx_mbits_diff, ts_diff_sec)]
-                    rx_rates_raw = [
-                        scale(r, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"])
-                        for r in rx_rates
-                    ]
-                    rx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(rx_rates_raw, self.num_observations_for_state)
-                    ]
-
-                # 12. tx rate
-                try:
-                    bitrate_sents = ice_candidate_pair[0]["bitrate-sent"]
-                    tx_rates_raw = [
-                        scale(
-                            b / 1000000,
-                            self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                            self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                        )
-                        for b in bitrate_sents
-                    ]
-                    tx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(tx_rates_raw, self.num_observations_for_state)
-                    ]
-                except KeyError:
-                    tx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-sent")
-                    tx_mbits_diff = [t * 8 / 1000000 for t in tx_bytes_diff]
-                    tx_rates = [t / ts if ts > 0 else 0.0 for t, ts in zip(tx_mbits_diff, ts_diff_sec)]
-                    tx_rates_raw = [
-                        scale(t, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"])
-                        for t in tx_rates
-                    ]
-                    tx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(tx_rates_raw, self.num_observations_for_state)
-                    ]
-
-                # form the final state
-                state = collections.OrderedDict(
-                    {
-                        "bandwidth": bandwidth,
-                        "fractionLossRate": fraction_loss_rates,
-                        "fractionNackRate": fraction_nack_rates,
-                        "fractionPliRate": fraction_pli_rates,
-                        "fractionQueueingRtt": fraction_queueing_rtts,
-                        "fractionRtt": rtts,
-                        "interarrivalRttJitter": interarrival_jitters,
-                        "lossRate": loss_rates,
-                        "rttMean": rtt_mean,
-                        "rttStd": rtt_std,
-                        "rxGoodput": rx_rates,
-                        "txGoodput": tx_rates,
-                    }
-                )
+        rtp_inbound_ssrc = find_stat_by_ssrc(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+        if rtp_inbound_ssrc is None:
+            LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
+            return self.make_default_state()
+        last_rtp_inbound_ssrc = (
+            find_stat_by_ssrc(last_inbound_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+            if last_inbound_stats is not None
+            else None
+        )
+        last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
+
+        # form the final state
+        state = collections.OrderedDict({"bandwidth": bandwidth})
+        state.update(
+            self.make_seq_features(
+                rtp_outbound[0],
+                last_rtp_outbound_ssrc,
+                rtp_inbound_ssrc,
+                last_rtp_inbound_ssrc,
+                ice_candidate_pair[0],
+            )
+        )
 
-                self.last_states.append(state)
-                self.update_reward_params()
-                return state
+        self.last_states.append(state)
+        self.update_reward_params()
+        return state
 
-        LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
-        return self.make_default_state()
+    def make_seq_features(
+        self,
+        rtp_outbound: Dict[str, Any],
+        last_rtp_outbound: Dict[str, Any] | None,
+        rtp_inbound: Dict[str, Any],
+        last_rtp_inbound: Dict[str, Any] | None,
+        ice_candidate_pair: Dict[str, Any],
+    ) -> OrderedDict[str, Any]:
+        """
+        Build the sequential features from the merged stats of one ssrc.
+
+        :param rtp_outbound: merged rtp outbound stats
+        :param last_rtp_outbound: merged rtp outbound stats of the previous step or None
+        :param rtp_inbound: merged rtp inbound stats of the privileged ssrc
+        :param last_rtp_inbound: merged rtp inbound stats of the privileged ssrc of the previous step or None
+        :param ice_candidate_pair: merged ice candidate pair stats
+        :return: features in the order of the observation space (except bandwidth)
+        """
+        n = self.num_observations_for_state
+        args = (rtp_outbound, last_rtp_outbound, rtp_inbound, last_rtp_inbound, ice_candidate_pair)
+        raw_features = self._make_aligned_seq_raw_features(*args)
+        if raw_features is not None:
+            features = get_interval_averages(raw_features, n, 'equidistant', SEQ_SKIP_ZEROES)
+        else:
+            features = [
+                get_interval_averages(raw, n, 'equidistant', is_skip_zeroes)
+                for raw, is_skip_zeroes in zip(self._make_seq_raw_features(*args), SEQ_SKIP_ZEROES)
+            ]
+        fraction_loss_rates, loss_rates, fraction_nack_rates, fraction_pli_rates = features[:4]
+        rtts, jitters, rx_rates, tx_rates = features[4:]
+
+        # 4. fraction queueing rtt
+        fraction_queueing_rtts = rtts - self.rtts.min
+        # 9. mean rtt
+        rtt_mean = self.rtts.mean
+        # 10. std rtt
+        rtt_std = self.rtts.std
+
+        return collections.OrderedDict(
+            {
+                "fractionLossRate": fraction_loss_rates.tolist(),
+                "fractionNackRate": fraction_nack_rates.tolist(),
+                "fractionPliRate": fraction_pli_rates.tolist(),
+                "fractionQueueingRtt": fraction_queueing_rtts.tolist(),
+                "fractionRtt": rtts.tolist(),
+                "interarrivalRttJitter": jitters.tolist(),
+                "lossRate": loss_rates.tolist(),
+                "rttMean": rtt_mean,
+                "rttStd": rtt_std,
+                "rxGoodput": rx_rates.tolist(),
+                "txGoodput": tx_rates.tolist(),
+            }
+        )
+
+    def _make_aligned_seq_raw_features(
+        self,
+        rtp_outbound: Dict[str, Any],
+        last_rtp_outbound: Dict[str, Any] | None,
+        rtp_inbound: Dict[str, Any],
+        last_rtp_inbound: Dict[str, Any] | None,
+        ice_candidate_pair: Dict[str, Any],
+    ) -> np.ndarray | None:
+        # fast path: all merged stats have the same number of samples, so they are processed as one 2-D array
+        is_bitrates = "bitrate-recv" in ice_candidate_pair and "bitrate-sent" in ice_candidate_pair
+        if not is_bitrates and ("bitrate-recv" in ice_candidate_pair or "bitrate-sent" in ice_candidate_pair):
+            return None
+        outbound_counters = SEQ_OUTBOUND_COUNTERS if is_bitrates else SEQ_OUTBOUND_COUNTERS + SEQ_OUTBOUND_BYTES
+        rows = [rtp_outbound[stat] for stat in outbound_counters] + [rtp_inbound[stat] for stat in SEQ_INBOUND_STATS]
+        if is_bitrates:
+            rows += [ice_candidate_pair["bitrate-recv"], ice_candidate_pair["bitrate-sent"]]
+        length = len(rows[0])
+        if length == 0 or any(len(row) != length for row in rows):
+            return None
+        stats = np.array(rows, dtype=np.float64)
+
+        # diffs of the counters: outbound counters, then rb-packetslost right after them
+        num_counters = len(outbound_counters) + 1
+        last_values = np.zeros((num_counters, 1), dtype=np.float64)
+        if last_rtp_outbound is not None:
+            last_values[:-1, 0] = [last_rtp_outbound[stat][-1] for stat in outbound_counters]
+        if last_rtp_inbound is not None:
+            last_values[-1, 0] = last_rtp_inbound["rb-packetslost"][-1]
+        counters = stats[:num_counters]
+        diffs = np.empty_like(counters)
+        np.subtract(counters[:, :1], last_values, out=diffs[:, :1])
+        np.subtract(counters[:, 1:], counters[:, :-1], out=diffs[:, 1:])
+        sent_diff, recv_diff, nack_diff, pli_diff = diffs[:4]
+        lost_diff = diffs[num_counters - 1]
+        sent, lost, rtts_ntp, jitters = stats[0], stats[num_counters - 1], stats[num_counters], stats[num_counters + 1]
+
+        # rows of the raw features, see SEQ_SKIP_ZEROES
+        raw_features = np.zeros((len(SEQ_SKIP_ZEROES), length), dtype=np.float64)
+
+        # 1. fraction loss rate, 7. global loss rate, 2. fraction nack rate, 3. fraction pli rate
+        numerators = raw_features[:4].copy()
+        numerators[0], numerators[1], numerators[2], numerators[3] = lost_diff, lost, nack_diff, pli_diff
+        denominators = np.empty_like(numerators)
+        np.add(sent_diff, lost_diff, out=denominators[0])
+        np.add(sent, lost, out=denominators[1])
+        denominators[2:] = recv_diff
+        np.divide(numerators, denominators, out=raw_features[:4], where=denominators > 0)
+
+        # rtts come in NTP short format, jitter comes in clock units
+        raw_features[4] = rtts_ntp // 2**16 + (rtts_ntp % 2**16) / 2**16
+        np.divide(jitters, rtp_outbound["clock-rate"][0], out=raw_features[5])
+        raw_features[4:6] = scale_array(raw_features[4:6], 0, self.CONSTANTS["MAX_DELAY_SEC"])
+
+        # 11. rx rate, 12. tx rate
+        if is_bitrates:
+            np.divide(stats[num_counters + 2 :], 1000000, out=raw_features[6:])
+        else:
+            ts_diff_sec = diffs[4] / 1000
+            np.divide(diffs[5:7] * 8 / 1000000, ts_diff_sec, out=raw_features[6:], where=ts_diff_sec > 0)
+        raw_features[6:] = scale_array(
+            raw_features[6:], self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
+        )
+
+        self.rtts.extend(raw_features[4])
+        return raw_features
+
+    def _make_seq_raw_features(
+        self,
+        rtp_outbound: Dict[str, Any],
+        last_rtp_outbound: Dict[str, Any] | None,
+        rtp_inbound: Dict[str, Any],
+        last_rtp_inbound: Dict[str, Any] | None,
+        ice_candidate_pair: Dict[str, Any],
+    ) -> List[np.ndarray]:
+        # slow path: the merged stats have different numbers of samples (e.g., some stats were missing), so every
+        # feature is computed separately and the sequences are truncated pairwise
+        min_rate, max_rate = self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"]
+        max_delay = self.CONSTANTS["MAX_DELAY_SEC"]
+
+        packets_sent_diff = get_stat_diff_array(rtp_outbound, last_rtp_outbound, "packets-sent")
+        packets_recv_diff = get_stat_diff_array(rtp_outbound, last_rtp_outbound, "packets-received")
+        rb_packetslost_diff = get_stat_diff_array(rtp_inbound, last_rtp_inbound, "rb-packetslost")
+        recv_nack_count_diff = get_stat_diff_array(rtp_outbound, last_rtp_outbound, "nack-count")
+        recv_pli_count_diff = get_stat_diff_array(rtp_outbound, last_rtp_outbound, "pli-count")
+
+        rtts_ntp = np.asarray(rtp_inbound["rb-round-trip"], dtype=np.int64)
+        rtts_raw = scale_array((rtts_ntp >> 16) + (rtts_ntp & 0xFFFF) / 2**16, 0, max_delay)
+        self.rtts.extend(rtts_raw)
+        jitters_sec = np.asarray(rtp_inbound["rb-jitter"], dtype=np.float64) / rtp_outbound["clock-rate"][0]
+
+        rates_mbps = []
+        for bitrate_stat, bytes_stat in (("bitrate-recv", "bytes-received"), ("bitrate-sent", "bytes-sent")):
+            if bitrate_stat in ice_candidate_pair:
+                rates_mbps.append(np.asarray(ice_candidate_pair[bitrate_stat], dtype=np.float64) / 1000000)
+            else:
+                ts_diff_sec = get_stat_diff_array(rtp_outbound, last_rtp_outbound, "timestamp") / 1000
+                mbits_diff = get_stat_diff_array(rtp_outbound, last_rtp_outbound, bytes_stat) * 8 / 1000000
+                rates_mbps.append(get_safe_ratios(mbits_diff, ts_diff_sec))
+
+        return [
+            _get_loss_rates(rb_packetslost_diff, packets_sent_diff),
+            _get_loss_rates(rtp_inbound["rb-packetslost"], rtp_outbound["packets-sent"]),
+            get_safe_ratios(recv_nack_count_diff, packets_recv_diff),
+            get_safe_ratios(recv_pli_count_diff, packets_recv_diff),
+            rtts_raw,
+            scale_array(jitters_sec, 0, max_delay),
+            scale_array(rates_mbps[0], min_rate, max_rate),
+            scale_array(rates_mbps[1], min_rate, max_rate),
+        ]
 
     def convert_to_unscaled_state(self, state: OrderedDict[str, Any]) -> OrderedDict[str, Any]:
         return (
@@ -834,178 +923,36 @@ class ViewerSeqNoBaselineMDP(ViewerSeqMDP):
         last_rtp_outbound = (
             find_stat(stats, GstWebRTCStatsType.RTP_OUTBOUND_STREAM) if self.last_stats is not None else None
         )
-        last_rtp_inbound = (
-            find_stat(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM) if self.last_stats is not None else None
-        )
+        last_inbound_stats = stats if self.last_stats is not None else None
         self.last_stats = stats
 
         if self.first_ssrc is None:
             # FIXME: make first ever ssrc to be the privileged one and take stats only from it
             self.first_ssrc = rtp_inbound[0]["ssrc"][0]
 
-        for i, rtp_inbound_ssrc in enumerate(rtp_inbound):
-            if rtp_inbound_ssrc["ssrc"][0] == self.first_ssrc:
-                last_rtp_inbound_ssrc = last_rtp_inbound[i] if last_rtp_inbound is not None else None
-                last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
-
-                # get needed stats
-                packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
-                packets_recv_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-received")
-                ts_diff_sec = [
-                    ts / 1000 for ts in get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp")
-                ]
-
-                # loss rates
-                # 1. fraction loss rate
-                rb_packetslost_diff = get_stat_diff_concat(rtp_inbound[i], last_rtp_inbound_ssrc, "rb-packetslost")
-                fraction_loss_rates_raw = [
-                    lost / (sent + lost) if sent + lost > 0 else 0.0
-                    for lost, sent in zip(rb_packetslost_diff, packets_sent_diff)
-                ]
-                fraction_loss_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_loss_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 7. global loss rate
-                loss_rates_raw = [
-                    lost / (sent + lost) if sent + lost > 0 else 0.0
-                    for lost, sent in zip(rtp_inbound[i]["rb-packetslost"], rtp_outbound[0]["packets-sent"])
-                ]
-
-                loss_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(loss_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 2. fraction nack rate
-                recv_nack_count_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "nack-count")
-                fraction_nack_rates_raw = [
-                    nack / recv if recv > 0 else 0.0 for nack, recv in zip(recv_nack_count_diff, packets_recv_diff)
-                ]
-                fraction_nack_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_nack_rates_raw, self.num_observations_for_state)
-                ]
-
-                # 3. fraction pli rate
-                recv_pli_count_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "pli-count")
-                fraction_pli_rates_raw = [
-                    pli / recv if recv > 0 else 0.0 for pli, recv in zip(recv_pli_count_diff, packets_recv_diff)
-                ]
-                fraction_pli_rates = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(fraction_pli_rates_raw, self.num_observations_for_state)
-                ]
-
-                # rtts: RTT comes in NTP short format
-                rtts_raw = [
-                    scale(ntp_short_format_to_seconds(rtt), 0, self.CONSTANTS["MAX_DELAY_SEC"])
-                    for rtt in rtp_inbound[i]["rb-round-trip"]
-                ]
-                self.rtts.extend(rtts_raw)
-                rtts = [
-                    get_list_average(mi) for mi in slice_list_in_intervals(rtts_raw, self.num_observations_for_state)
-                ]
-
-                # 4. fraction queueing rtt
-                fraction_queueing_rtts = [rtt - min(self.rtts) if len(self.rtts) > 0 else 0.0 for rtt in rtts]
-                # 9. mean rtt
-                rtt_mean = np.mean(self.rtts) if len(self.rtts) > 0 else 0.0
-                # 10. std rtt
-                rtt_std = np.std(self.rtts) if len(self.rtts) > 0 else 0.0
-
-                # 6. jitter: comes in clock units
-                interarrival_jitters_raw = [
-                    scale(
-                        clock_units_to_seconds(j, rtp_outbound[0]["clock-rate"][0]), 0, self.CONSTANTS["MAX_DELAY_SEC"]
-                    )
-                    for j in rtp_inbound[i]["rb-jitter"]
-                ]
-                interarrival_jitters = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(interarrival_jitters_raw, self.num_observations_for_state)
-                ]
-
-                # 11. rx rate
-                try:
-                    bitrate_recvs = ice_candidate_pair[0]["bitrate-recv"]
-                    rx_rates_raw = [
-                        scale(
-                            b / 1000000,
-                            self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                            self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                        )
-                        for b in bitrate_recvs
-                    ]
-                    rx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(rx_rates_raw, self.num_observations_for_state)
-                    ]
-                except KeyError:
-                    rx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
-                    rx_mbits_diff = [r * 8 / 1000000 for r in rx_bytes_diff]
-                    rx_rates = [r / ts if ts > 0 else 0.0 for r, ts in zip(rx_mbits_diff, ts_diff_sec)]
-                    rx_rates_raw = [
-                        scale(r, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"])
-                        for r in rx_rates
-                    ]
-                    rx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(rx_rates_raw, self.num_observations_for_state)
-                    ]
-
-                # 12. tx rate
-                try:
-                    bitrate_sents = ice_candidate_pair[0]["bitrate-sent"]
-                    tx_rates_raw = [
-                        scale(
-                            b / 1000000,
-                            self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"],
-                            self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"],
-                        )
-                        for b in bitrate_sents
-                    ]
-                    tx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(tx_rates_raw, self.num_observations_for_state)
-                    ]
-                except KeyError:
-                    tx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-sent")
-                    tx_mbits_diff = [t * 8 / 1000000 for t in tx_bytes_diff]
-                    tx_rates = [t / ts if ts > 0 else 0.0 for t, ts in zip(tx_mbits_diff, ts_diff_sec)]
-                    tx_rates_raw = [
-                        scale(t, self.CONSTANTS["MIN_BITRATE_STREAM_MBPS"], self.CONSTANTS["MAX_BITRATE_STREAM_MBPS"])
-                        for t in tx_rates
-                    ]
-                    tx_rates = [
-                        get_list_average(mi, is_skip_zeroes=True)
-                        for mi in slice_list_in_intervals(tx_rates_raw, self.num_observations_for_state)
-                    ]
-
-                # form the final state
-                state = collections.OrderedDict(
-                    {
-                        "fractionLossRate": fraction_loss_rates,
-                        "fractionNackRate": fraction_nack_rates,
-                        "fractionPliRate": fraction_pli_rates,
-                        "fractionQueueingRtt": fraction_queueing_rtts,
-                        "fractionRtt": rtts,
-                        "interarrivalRttJitter": interarrival_jitters,
-                        "lossRate": loss_rates,
-                        "rttMean": rtt_mean,
-                        "rttStd": rtt_std,
-                        "rxGoodput": rx_rates,
-                        "txGoodput": tx_rates,
-                    }
-                )
-
-                self.last_states.append(state)
-                self.update_reward_params()
-                return state
+        rtp_inbound_ssrc = find_stat_by_ssrc(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+        if rtp_inbound_ssrc is None:
+            LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
+            return self.make_default_state()
+        last_rtp_inbound_ssrc = (
+            find_stat_by_ssrc(last_inbound_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+            if last_inbound_stats is not None
+            else None
+        )
+        last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
+
+        # form the final state
+        state = self.make_seq_features(
+            rtp_outbound[0],
+            last_rtp_outbound_ssrc,
+            rtp_inbound_ssrc,
+            last_rtp_inbound_ssrc,
+            ice_candidate_pair[0],
+        )
 
-        LOGGER.warning("WARNING: Drl Agent: ViewerMDP: make_state: no ssrc stats found")
-        return self.make_default_state()
+        self.last_states.append(state)
+        self.update_reward_params()
+        return state
 
     def convert_to_unscaled_state(self, state: OrderedDict[str, Any]) -> OrderedDict[str, Any]:
         return (
@@ -1102,6 +1049,12 @@ class ViewerSeqOfflineMDP(MDP):
             GstWebRTCStatsType.RTP_INBOUND_STREAM,
             GstWebRTCStatsType.ICE_CANDIDATE_PAIR,
         ]
+        # ice candidate pair is only checked to be present
+        self.obs_fields = {
+            GstWebRTCStatsType.RTP_OUTBOUND_STREAM: ["packets-sent", "bytes-received", "clock-rate"],
+            GstWebRTCStatsType.RTP_INBOUND_STREAM: ["rb-packetslost", "rb-round-trip", "rb-jitter"],
+            GstWebRTCStatsType.ICE_CANDIDATE_PAIR: [],
+        }
 
         self.min_delay = 0.0
 
@@ -1109,7 +1062,8 @@ class ViewerSeqOfflineMDP(MDP):
 
     def reset(self):
         super().reset()
-        self.delays = []
+        # only the max delay of the episode is needed for the reward
+        self.delays = RunningStats()
 
     def create_observation_space(self) -> spaces.Dict:
         shape = (self.num_observations_for_state,)
@@ -1177,126 +1131,105 @@ class ViewerSeqOfflineMDP(MDP):
         last_rtp_outbound = (
             find_stat(stats, GstWebRTCStatsType.RTP_OUTBOUND_STREAM) if self.last_stats is not None else None
         )
-        last_rtp_inbound = (
-            find_stat(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM) if self.last_stats is not None else None
-        )
+        last_inbound_stats = stats if self.last_stats is not None else None
         self.last_stats = stats
 
         if self.first_ssrc is None:
             # FIXME: make first ever ssrc to be the privileged one and take stats only from it
             self.first_ssrc = rtp_inbound[0]["ssrc"][0]
 
-        for i, rtp_inbound_ssrc in enumerate(rtp_inbound):
-            if rtp_inbound_ssrc["ssrc"][0] == self.first_ssrc:
-                last_rtp_inbound_ssrc = last_rtp_inbound[i] if last_rtp_inbound is not None else None
-                last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
-
-                # get needed stats
-                packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
-                ts_diff_sec = [
-                    ts / 1000 for ts in get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp")
-                ]
-
-                # 00_RECV_RATE
-                rx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
-                rx_bits_diff = [r * 8 for r in rx_bytes_diff]
-                rx_rates = [r / ts if ts > 0 else 0.0 for r, ts in zip(rx_bits_diff, ts_diff_sec)]
-                # NOTE: it is important to reverse all the lists to get the correct order of observations
-                rx_rates.reverse()
-                rx_rates_final = [
-                    get_list_average(mi, is_skip_zeroes=True)
-                    for mi in slice_list_in_intervals(rx_rates, self.num_observations_for_state, 'sliding')
-                ]
-
-                # 04_DELAY
-                delays_raw_ms = [
-                    ntp_short_format_to_seconds(rtt) * 1000 / 2  # ms
-                    for rtt in rtp_inbound[i]["rb-round-trip"]  # roughly assuming d = rtt / 2
-                ]
-                delays_raw_ms.reverse()
-                self.delays.extend(delays_raw_ms)
-                delays_shifted = [d - 200 for d in delays_raw_ms]
-                delays_final = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(delays_shifted, self.num_observations_for_state, 'sliding')
-                ]
-
-                # 05_MIN_SEEN_DELAY
-                min_seen_delays = []
-                for d in delays_raw_ms:
-                    if self.min_delay == 0.0:
-                        self.min_delay = d
-                    if d < self.min_delay and d > 0:
-                        self.min_delay = d
-                    min_seen_delays.append(self.min_delay)
-
-                min_seen_delays_final = [
-                    min(mi)
-                    for mi in slice_list_in_intervals(min_seen_delays, self.num_observations_for_state, 'sliding')
-                ]
-
-                # 03_QUEUING_DELAY
-                av_delays_raw = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(delays_raw_ms, self.num_observations_for_state, 'sliding')
-                ]
-                queuing_delays_final = [
-                    av_delay - min_seen_delay for av_delay, min_seen_delay in zip(av_delays_raw, min_seen_delays_final)
-                ]
-
-                # 07_DELAY_MIN_DIFF
-                delay_min_diffs = [
-                    av_delay - min(delays_raw)
-                    for av_delay, delays_raw in zip(
-                        av_delays_raw,
-                        slice_list_in_intervals(delays_raw_ms, self.num_observations_for_state, 'sliding'),
-                    )
-                ]
-
-                # 09_PKT_JITTER
-                jitters_raw = [
-                    clock_units_to_seconds(j, rtp_outbound[0]["clock-rate"][0]) * 1000  # ms
-                    for j in rtp_inbound[i]["rb-jitter"]
-                ]
-                jitters_raw.reverse()
-                jitters_final = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(jitters_raw, self.num_observations_for_state, 'sliding')
-                ]
-
-                # 10_PKT_LOSS_RATIO
-                packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
-                rb_packetslost_diff = get_stat_diff_concat(rtp_inbound[i], last_rtp_inbound_ssrc, "rb-packetslost")
-                loss_rates = [
-                    lost / (sent + lost) if sent + lost > 0 else 0.0
-                    for lost, sent in zip(rb_packetslost_diff, packets_sent_diff)
-                ]
-                loss_rates.reverse()
-                loss_rates_final = [
-                    get_list_average(mi)
-                    for mi in slice_list_in_intervals(loss_rates, self.num_observations_for_state, 'sliding')
-                ]
-
-                # form the final state
-                state = collections.OrderedDict(
-                    {
-                        "00_RECV_RATE": rx_rates_final,
-                        "03_QUEUING_DELAY": queuing_delays_final,
-                        "04_DELAY": delays_final,
-                        "05_MIN_SEEN_DELAY": min_seen_delays_final,
-                        "07_DELAY_MIN_DIFF": delay_min_diffs,
-                        "09_PKT_JITTER": jitters_final,
-                        "10_PKT_LOSS_RATIO": loss_rates_final,
-                    }
-                )
+        rtp_inbound_ssrc = find_stat_by_ssrc(stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+        if rtp_inbound_ssrc is None:
+            LOGGER.warning("WARNING: Drl Agent.make_state: no ssrc stats found")
+            return self.make_default_state()
+        last_rtp_inbound_ssrc = (
+            find_stat_by_ssrc(last_inbound_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM, self.first_ssrc)
+            if last_inbound_stats is not None
+            else None
+        )
+        last_rtp_outbound_ssrc = last_rtp_outbound[0] if last_rtp_outbound is not None else None
 
-                self.last_states.append(state)
-                self.update_reward_params()
+        # get needed stats
+        packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
+        ts_diff_sec = [
+            ts / 1000 for ts in get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "timestamp")
+        ]
 
-                return state
+        # 00_RECV_RATE
+        rx_bytes_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "bytes-received")
+        rx_bits_diff = [r * 8 for r in rx_bytes_diff]
+        rx_rates = [r / ts if ts > 0 else 0.0 for r, ts in zip(rx_bits_diff, ts_diff_sec)]
+        # NOTE: it is important to reverse all the lists to get the correct order of observations
+        rx_rates.reverse()
+        # the sliding intervals grow from the start, the aggregates are updated incrementally per sample
+        rx_rates_final, _ = get_sliding_running_stats(rx_rates, self.num_observations_for_state, True)
+
+        # 04_DELAY
+        delays_raw_ms = [
+            ntp_short_format_to_seconds(rtt) * 1000 / 2  # ms
+            for rtt in rtp_inbound_ssrc["rb-round-trip"]  # roughly assuming d = rtt / 2
+        ]
+        delays_raw_ms.reverse()
+        self.delays.extend(delays_raw_ms)
+        av_delays_raw, min_delays_raw = get_sliding_running_stats(
+            delays_raw_ms, self.num_observations_for_state
+        )
+        delays_final = [d - 200 for d in av_delays_raw]
+
+        # 05_MIN_SEEN_DELAY
+        min_seen_delays = []
+        for d in delays_raw_ms:
+            if self.min_delay == 0.0:
+                self.min_delay = d
+            if d < self.min_delay and d > 0:
+                self.min_delay = d
+            min_seen_delays.append(self.min_delay)
+
+        _, min_seen_delays_final = get_sliding_running_stats(min_seen_delays, self.num_observations_for_state)
+
+        # 03_QUEUING_DELAY
+        queuing_delays_final = [
+            av_delay - min_seen_delay for av_delay, min_seen_delay in zip(av_delays_raw, min_seen_delays_final)
+        ]
 
-        LOGGER.warning("WARNING: Drl Agent.make_state: no ssrc stats found")
-        return self.make_default_state()
+        # 07_DELAY_MIN_DIFF
+        delay_min_diffs = [av_delay - min_delay for av_delay, min_delay in zip(av_delays_raw, min_delays_raw)]
+
+        # 09_PKT_JITTER
+        jitters_raw = [
+            clock_units_to_seconds(j, rtp_outbound[0]["clock-rate"][0]) * 1000  # ms
+            for j in rtp_inbound_ssrc["rb-jitter"]
+        ]
+        jitters_raw.reverse()
+        jitters_final, _ = get_sliding_running_stats(jitters_raw, self.num_observations_for_state)
+
+        # 10_PKT_LOSS_RATIO
+        packets_sent_diff = get_stat_diff_concat(rtp_outbound[0], last_rtp_outbound_ssrc, "packets-sent")
+        rb_packetslost_diff = get_stat_diff_concat(rtp_inbound_ssrc, last_rtp_inbound_ssrc, "rb-packetslost")
+        loss_rates = [
+            lost / (sent + lost) if sent + lost > 0 else 0.0
+            for lost, sent in zip(rb_packetslost_diff, packets_sent_diff)
+        ]
+        loss_rates.reverse()
+        loss_rates_final, _ = get_sliding_running_stats(loss_rates, self.num_observations_for_state)
+
+        # form the final state
+        state = collections.OrderedDict(
+            {
+                "00_RECV_RATE": rx_rates_final,
+                "03_QUEUING_DELAY": queuing_delays_final,
+                "04_DELAY": delays_final,
+                "05_MIN_SEEN_DELAY": min_seen_delays_final,
+                "07_DELAY_MIN_DIFF": delay_min_diffs,
+                "09_PKT_JITTER": jitters_final,
+                "10_PKT_LOSS_RATIO": loss_rates_final,
+            }
+        )
+
+        self.last_states.append(state)
+        self.update_reward_params()
+
+        return state
 
     def convert_to_unscaled_state(self, state: OrderedDict[str, Any]) -> OrderedDict[str, Any]:
         return state
@@ -1317,4 +1250,4 @@ class ViewerSeqOfflineMDP(MDP):
 
     def update_reward_params(self) -> None:
         super().update_reward_params()
-        self.reward_params["max_delay"] = max(self.delays) if self.delays else 0.0
+        self.reward_params["max_delay"] = self.delays.max
@@ -0,0 +1,165 @@
+import copy
+import math
+import secrets
+import time
+from typing import Any, Callable, Dict, List, OrderedDict
+
+from control.drl.env import DrlEnv
+from control.drl.mdp import MDP
+from control.recorder.stream import read_stats_stream
+from message.client import make_local_mqtt_pair
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+from utils.gst import StatsSnapshot
+
+
+class ReplayDrlEnv(DrlEnv):
+    """
+    DrlEnv that is driven by a stats recording (see StatsStreamRecorderAgent) instead of a live connector. Each step
+    consumes the frames of the next state_update_interval of the recorded time: the stats are passed to the MDP
+    as DrlEnv does, and the GCC estimates reach it via the local MQTT transport. The replay is open-loop, i.e.,
+    the actions do not affect the recorded stats, so it serves to benchmark and regression-test the MDPs and
+    the reward functions on the same inputs rather than to train. The env is finished when the recording ends.
+
+    :param mdp: The MDP instance
+    :param path: The path to the recording file
+    :param max_episodes: The maximal number of episodes, -1 means unlimited
+    :param state_update_interval: The recorded time in seconds between the steps
+    :param speed: The replay speed factor, 1.0 is real time. None or 0 replay at the maximal speed
+    :param topics: The names of the recorded topics to read. The frames of the topics other than stats and gcc
+        are not passed to the MDP but are kept in last_frames, e.g., the actions for building offline datasets
+    """
+
+    def __init__(
+        self,
+        mdp: MDP,
+        path: str,
+        max_episodes: int = -1,
+        state_update_interval: float = 1.0,
+        speed: float | None = None,
+        topics: List[str] = ["stats", "gcc"],
+    ):
+        if state_update_interval <= 0:
+            raise GSTWEBRTCAPP_EXCEPTION("ReplayDrlEnv: the state update interval should be positive")
+
+        # gcc estimates are delivered to the MDP in the same process, each env gets its own topics
+        mqtts = make_local_mqtt_pair(f"replay_{secrets.token_hex(4)}", ["gcc"])
+        mdp.mqtts = mqtts
+
+        super().__init__(mdp, mqtts, max_episodes, state_update_interval, math.inf)
+        self.path = path
+        self.speed = speed if speed else None
+        self.frames = read_stats_stream(path, topics)
+        self.next_frame = next(self.frames, None)
+        if self.next_frame is None:
+            raise GSTWEBRTCAPP_EXCEPTION(f"ReplayDrlEnv: no frames in {path}")
+        self.window_end = self.next_frame["timestamp"] + state_update_interval
+        self.last_step_time = None
+        # the frames consumed on the last step
+        self.last_frames = []
+        LOGGER.info(f"OK: ReplayDrlEnv: replaying {path}")
+
+    def close(self) -> None:
+        self.mqtts.stop()
+
+    def get_next_observation(self) -> Dict[str, Any] | None:
+        """
+        Consume the frames of the next steps until the MDP gets enough observations for a state, without an action.
+
+        :return: the selected observations for make_state or None if the recording has ended
+        """
+        return self._get_observation()
+
+    def _apply_action(self, action: Any) -> None:
+        # open-loop: the recorded stats do not depend on the actions
+        pass
+
+    def _get_observation(self) -> Dict[str, Any] | None:
+        self.mqtts.subscriber.clean_message_queue(self.mqtts.subscriber.topics.gcc)
+        self.observation_buffer.clear()
+        self.last_frames = []
+        # take the windows until the MDP gets enough observations or the recording ends
+        while len(self.observation_buffer) < self.mdp.num_observations_for_state and not self.is_finished:
+            frames = self._next_window()
+            self.last_frames.extend(frames)
+            for frame in frames:
+                topic = frame["topic"].split("/")[-1]
+                if topic == "gcc":
+                    self.mqtts.publisher.publish(self.mqtts.subscriber.topics.gcc, frame["msg"])
+                elif topic == "stats":
+                    stats = StatsSnapshot.wrap(frame["msg"])
+                    if self.mdp.check_observation(stats):
+                        self.observation_buffer.append(stats)
+            if self.next_frame is None:
+                self.is_finished = True
+        self._wait_for_speed()
+        if len(self.observation_buffer) < self.mdp.num_observations_for_state:
+            # the tail of the recording is too short for a state
+            self._on_finish()
+            return None
+        return self._select_observations()
+
+    def _next_window(self) -> List[Dict[str, Any]]:
+        frames = []
+        while self.next_frame is not None and self.next_frame["timestamp"] < self.window_end:
+            frames.append(self.next_frame)
+            self.next_frame = next(self.frames, None)
+        self.window_end += self.state_update_interval
+        return frames
+
+    def _wait_for_speed(self) -> None:
+        if self.speed is None:
+            return
+        now = time.monotonic()
+        if self.last_step_time is not None:
+            delay = self.state_update_interval / self.speed - (now - self.last_step_time)
+            if delay > 0:
+                time.sleep(delay)
+        self.last_step_time = time.monotonic()
+
+
+def replay_mdp(
+    mdp: MDP,
+    path: str,
+    action: Any | Callable[[OrderedDict[str, Any]], Any],
+    state_update_interval: float = 1.0,
+    max_steps: int = -1,
+) -> Dict[str, Any]:
+    """
+    Run make_state and calculate_reward of the MDP over a stats recording at the maximal speed and measure them.
+    The same recording and actions give the same states and rewards, so the results could be compared between
+    the versions of the MDP and the reward functions.
+
+    :param mdp: The MDP instance
+    :param path: The path to the recording file
+    :param action: The action passed to make_state on each step or a policy that maps the last state to the action
+    :param state_update_interval: The recorded time in seconds between the steps
+    :param max_steps: The maximal number of steps, -1 means until the recording ends
+    :return: dict with the states, the rewards and the mean times of make_state and calculate_reward in seconds
+    """
+    env = ReplayDrlEnv(mdp, path, state_update_interval=state_update_interval)
+    mdp.reset()
+    state = mdp.make_default_state()
+    states, rewards = [], []
+    state_time, reward_time = 0.0, 0.0
+    try:
+        while max_steps < 0 or len(states) < max_steps:
+            stats = env.get_next_observation()
+            if stats is None:
+                break
+            start = time.perf_counter()
+            state = mdp.make_state(stats, action(state) if callable(action) else action)
+            state_time += time.perf_counter() - start
+            start = time.perf_counter()
+            reward, _ = mdp.calculate_reward()
+            reward_time += time.perf_counter() - start
+            states.append(copy.deepcopy(state))
+            rewards.append(reward)
+    finally:
+        env.close()
+    num_steps = max(1, len(states))
+    return {
+        "states": states,
+        "rewards": rewards,
+        "make_state_time": state_time / num_steps,
+        "calculate_reward_time": reward_time / num_steps,
+    }
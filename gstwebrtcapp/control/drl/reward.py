@@ -1,11 +1,99 @@
 from abc import ABCMeta, abstractmethod
+import collections
+import functools
 import numpy as np
-from typing import Any, Deque, Dict, OrderedDict, Tuple
+from typing import Any, Deque, Dict, List, OrderedDict, Sequence, Tuple
 
 from utils.base import get_list_average, get_decay_weights, get_min_diff_in_list
 
 
+# BATCHED STATES: dict[key, array of shape (T,) or (T, N)] of T consecutive states of one episode
+def stack_states(states: Sequence[OrderedDict[str, Any]], keys: Sequence[str] | None = None) -> Dict[str, np.ndarray]:
+    """
+    Stack the states (e.g., the MDP's last_states deque or the recorded states of an episode) into the batched states.
+
+    :param states: the consecutive states
+    :param keys: the keys to stack. If None, all keys of the first state
+    :return: dict[key, array of shape (T, ...)]
+    """
+    if keys is None:
+        keys = list(states[0].keys()) if len(states) > 0 else []
+    return {key: np.asarray([state[key] for state in states], dtype=np.float64) for key in keys}
+
+
+def _get_rows(states: Dict[str, np.ndarray], key: str) -> np.ndarray:
+    # (T, N) float array of the key, scalars per state give N = 1
+    values = np.asarray(states[key], dtype=np.float64)
+    return values.reshape(len(values), -1)
+
+
+def _get_column(states: Dict[str, np.ndarray], key: str) -> np.ndarray:
+    # (T,) float array of the key that holds one value per state
+    return _get_rows(states, key)[:, 0]
+
+
+def _get_rows_average(rows: np.ndarray, is_skip_zeroes: bool = False) -> np.ndarray:
+    # get_list_average for each row: 0 for the empty rows (or the rows of zeroes if they are skipped)
+    if not is_skip_zeroes:
+        return rows.sum(axis=1) / rows.shape[1] if rows.shape[1] > 0 else np.zeros(len(rows))
+    counts = np.count_nonzero(rows, axis=1)
+    return np.divide(rows.sum(axis=1), counts, out=np.zeros(len(rows)), where=counts > 0)
+
+
+def _get_prev(values: np.ndarray) -> np.ndarray:
+    # values of the previous states, 0 for the first one
+    prev = np.zeros_like(values)
+    prev[1:] = values[:-1]
+    return prev
+
+
+def _get_history_average(values: np.ndarray, state_history_size: int | None) -> np.ndarray:
+    # average over the previous states within the history (except the current one), the current value for the first
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(len(values))
+    starts = np.maximum(0, ends - state_history_size) if state_history_size is not None else np.zeros_like(ends)
+    counts = ends - starts
+    averages = np.divide(sums[ends] - sums[starts], counts, out=np.zeros(len(values)), where=counts > 0)
+    return np.where(counts > 0, averages, values)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_penalty_table(labels: Tuple[str, ...]) -> np.ndarray:
+    # all combinations of the labels indexed by the bit codes of the conditions
+    return np.array(
+        ["".join(label for i, label in enumerate(labels) if code >> i & 1) for code in range(1 << len(labels))],
+        dtype=object,
+    )
+
+
+def _get_penalties(conditions: List[Tuple[np.ndarray, str]], length: int) -> np.ndarray:
+    # object array of the concatenated penalty labels per state
+    codes = np.zeros(length, dtype=np.int64)
+    for i, (condition, _) in enumerate(conditions):
+        codes |= np.asarray(condition, dtype=np.int64) << i
+    return _get_penalty_table(tuple(label for _, label in conditions))[codes]
+
+
+def _get_actions(actions: Sequence[Any], length: int) -> np.ndarray:
+    # the first value of each action aligned with the last states, 0 for the missing ones
+    values = [float(np.ravel(a)[0]) if a is not None else 0.0 for a in list(actions)[-length:]]
+    return np.array([0.0] * (length - len(values)) + values)
+
+
 class RewardFunction(metaclass=ABCMeta):
+    """
+    Reward function of the MDPs. The subclasses implement the per-step calculate_reward called by the MDP with
+    the last_states deque and may override the batched calculate_rewards with a version vectorized over the states.
+    The batched one serves the offline use cases (e.g., labeling of the datasets or the reward shaping over
+    the recorded states), by default it replays the states through calculate_reward.
+
+    The batched params are the per-step ones with the arrays over the states where the values change per step:
+    e.g., "max_delay" of shape (T,) and "actions" (the actions passed to make_state) instead of "last_actions".
+    """
+
+    # the keys of the states used by the batched reward, None means all
+    state_keys: List[str] | None = None
+
     def __init__(self, *args, **kwargs) -> None:
         self.state = None
         self.prev_state = None
@@ -24,6 +112,42 @@ class RewardFunction(metaclass=ABCMeta):
             self.state = states[-1]
             self.prev_state = states[-2]
 
+    def calculate_rewards(
+        self,
+        states: Dict[str, np.ndarray],
+        params: Dict[str, Any] | None = None,
+        state_history_size: int | None = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Calculate the rewards of T consecutive states of one episode at once. The reward of each state is the one
+        calculate_reward gives for it with the previous states within the history.
+
+        :param states: batched states dict[key, array of shape (T, ...)], see stack_states
+        :param params: batched reward params
+        :param state_history_size: the number of the previous states in the history (MDP.state_history_size).
+            None means all previous states of the batch
+        :return: rewards of shape (T,) and dict of the reward parts of shape (T,) each
+        """
+        # fallback: replay the states through the history deque
+        length = len(next(iter(states.values())))
+        history = collections.deque(maxlen=state_history_size + 1 if state_history_size is not None else None)
+        rewards = np.zeros(length)
+        parts = {part: np.zeros(length, dtype=object) for part in self.reward_parts}
+        params = params or {}
+        for t in range(length):
+            history.append(collections.OrderedDict((key, values[t]) for key, values in states.items()))
+            step_params = {
+                key: (value[t] if isinstance(value, np.ndarray) and value.ndim > 0 and len(value) == length else value)
+                for key, value in params.items()
+                if key != "actions"
+            }
+            if "actions" in params:
+                step_params["last_actions"] = list(params["actions"])[max(0, t - len(history) + 1) : t + 1]
+            rewards[t], step_parts = self.calculate_reward(history, step_params)
+            for part, value in step_parts.items():
+                parts[part][t] = value
+        return rewards, parts
+
 
 class QoePaper(RewardFunction):
     def __init__(self, *args, **kwargs) -> None:
@@ -96,6 +220,16 @@ class QoePaper(RewardFunction):
 
 
 class QoeAhoy(RewardFunction):
+    state_keys = [
+        "fractionLossRate",
+        "fractionNackRate",
+        "fractionPliRate",
+        "fractionRtt",
+        "interarrivalRttJitter",
+        "rxGoodput",
+        "txGoodput",
+    ]
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.reward_parts = ["rew", "rate", "rtt", "plr", "jit", "smt", "pli", "nack"]
@@ -189,8 +323,111 @@ class QoeAhoy(RewardFunction):
             )
         )
 
+    def calculate_rewards(
+        self,
+        states: Dict[str, np.ndarray],
+        params: Dict[str, Any] | None = None,
+        state_history_size: int | None = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        rx_rate = _get_column(states, "rxGoodput")
+        is_prev = np.arange(len(rx_rate)) > 0
+
+        # 1. rate: 0...0.2
+        reward_rate = np.log((np.exp(1) - 1) * rx_rate + 1)
+        reward_rate *= 0.2
+
+        # 2. rtt: 0...0.2
+        # 2.1. mean for the last N states - current rtt
+        # calculate mean rtt for the last states except the current one
+        fraction_rtt = _get_column(states, "fractionRtt")
+        sub_reward_avg_curr_diff_rtt = _get_history_average(fraction_rtt, state_history_size) - fraction_rtt
+        # 2.2. prev - current rtt
+        sub_reward_prev_curr_diff_rtt = 2 * np.where(is_prev, _get_prev(fraction_rtt) - fraction_rtt, 0.0)
+        # final
+        sub_sum_rtt = sub_reward_avg_curr_diff_rtt + sub_reward_prev_curr_diff_rtt
+        # if >= 0 then it is perfect and give the max reward 0, if less then penalize until -0.4.
+        # final reward is bw 0..0.2
+        final_sum_rtt = np.where(sub_sum_rtt >= 0, 0.0, np.maximum(-0.4, sub_sum_rtt))
+        reward_rtt = 0.4 + final_sum_rtt
+        reward_rtt *= 0.5
+
+        # 3. plr: 0...0.2
+        # plr is not so often but very deadly, so penalize more. Set 20% to be the most critical
+        fraction_loss_rate = _get_column(states, "fractionLossRate")
+        reward_plr = np.maximum(0, 1 - 5 * fraction_loss_rate)
+        reward_plr *= 0.2
+
+        # 4. jitter: 0...0.1
+        # max 250 ms, more than that is very bad, 10 ms jitter is considered to be acceptable
+        jitter = _get_column(states, "interarrivalRttJitter")
+        thresholded_jitter = np.maximum(0, jitter - 0.01)
+        reward_jitter = np.maximum(0, 0.5 - np.sqrt(thresholded_jitter))
+        reward_jitter *= 0.2
+
+        # 5. smooth: take rate of change: 0...0.1
+        rate_prev = np.where(is_prev, _get_prev(rx_rate), 0.0)
+        rate_of_change = np.abs(rx_rate - rate_prev)
+        # don't penalize if bitrate changes less than 10% or if it's the first state
+        reward_smooth = np.where((rate_of_change <= 0.1) | (rate_prev == 0.0), 1.0, 1 - rate_of_change)
+        reward_smooth *= 0.1
+
+        # 6. pli rate should not be higher than 0.1%: 0..0.05
+        pli_rate = _get_column(states, "fractionPliRate")
+        reward_pli = np.maximum(0, 1 - (pli_rate * 1000))
+        reward_pli *= 0.05
+
+        # 7. nack rate should not be higher than 5%: 0..0.05
+        reward_nack = np.maximum(0, 1 - (_get_column(states, "fractionNackRate") * 20))
+        reward_nack *= 0.05
+
+        # final
+        reward = reward_rate + reward_rtt + reward_plr + reward_jitter + reward_smooth + reward_pli + reward_nack
+        reward = np.clip(reward, 0, 1)
+        # ! extra cases:
+        # 1. if plr > 20% then reward = 0
+        # 2. if rtt > 500ms then reward = 0
+        # 3. if rxRate / txRate < 0.2 then reward = 0
+        # 4. if jitter > 250ms then reward = 0
+        # 5. if plir > 1% then reward = 0
+        tx_rate = _get_column(states, "txGoodput")
+        is_zero = (
+            (fraction_loss_rate > 0.2)
+            | (fraction_rtt > 0.5)
+            | ((tx_rate > 0) & (rx_rate < 0.2 * tx_rate))
+            | (jitter > 0.25)
+            | (pli_rate > 0.01)
+        )
+        reward = np.where(is_zero, 0.0, reward)
+
+        return reward, dict(
+            zip(
+                self.reward_parts,
+                [
+                    reward,
+                    reward_rate,
+                    reward_rtt,
+                    reward_plr,
+                    reward_jitter,
+                    reward_smooth,
+                    reward_pli,
+                    reward_nack,
+                ],
+            )
+        )
+
 
 class QoeAhoySeq(RewardFunction):
+    state_keys = [
+        "fractionLossRate",
+        "fractionNackRate",
+        "fractionPliRate",
+        "fractionRtt",
+        "interarrivalRttJitter",
+        "rttMean",
+        "rxGoodput",
+        "txGoodput",
+    ]
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.reward_parts = ["rew", "rate", "rtt", "plr", "jit", "smt", "pli", "nack", "pen"]
@@ -293,8 +530,118 @@ class QoeAhoySeq(RewardFunction):
             )
         )
 
+    def calculate_rewards(
+        self,
+        states: Dict[str, np.ndarray],
+        params: Dict[str, Any] | None = None,
+        state_history_size: int | None = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        rx_goodputs = _get_rows(states, "rxGoodput")
+        is_prev = np.arange(len(rx_goodputs)) > 0
+
+        # 1. rate: 0...0.25
+        reward_rate = np.log((np.exp(1) - 1) * _get_rows_average(rx_goodputs, is_skip_zeroes=True) + 1)
+        reward_rate *= 0.25
+
+        # 2. rtt: 0...0.2
+        # 2.1. mean for the last N states - current rtt
+        # calculate mean rtt for the last states except the current one
+        fraction_rtt = _get_rows_average(_get_rows(states, "fractionRtt"))
+        sub_reward_avg_curr_diff_rtt = _get_column(states, "rttMean") - fraction_rtt
+        # 2.2. prev - current rtt
+        sub_reward_prev_curr_diff_rtt = 2 * np.where(is_prev, _get_prev(fraction_rtt) - fraction_rtt, 0.0)
+        # final
+        sub_sum_rtt = sub_reward_avg_curr_diff_rtt + sub_reward_prev_curr_diff_rtt
+        # if >= 0 then it is perfect and give the max reward 0, if less then penalize until -0.4.
+        # final reward is bw 0..0.2
+        final_sum_rtt = np.where(sub_sum_rtt >= 0, 0.0, np.maximum(-0.4, sub_sum_rtt))
+        reward_rtt = 0.4 + final_sum_rtt
+        reward_rtt *= 0.5
+
+        # 3. plr: 0...0.25
+        # plr is not so often but very deadly, so penalize more. Set 20% to be the most critical
+        fraction_loss_rate = _get_rows_average(_get_rows(states, "fractionLossRate"))
+        reward_plr = np.maximum(0, 1 - 5 * fraction_loss_rate)
+        reward_plr *= 0.25
+
+        # 4. jitter: 0...0.1
+        # max 250 ms, more than that is very bad, 10 ms jitter is considered to be acceptable
+        jitter = _get_rows(states, "interarrivalRttJitter").max(axis=1)
+        thresholded_jitter = np.maximum(0, jitter - 0.01)
+        reward_jitter = np.maximum(0, 0.5 - np.sqrt(thresholded_jitter))
+        reward_jitter *= 0.2
+
+        # 5. smooth: take rate of change: 0...0.1
+        rx_rate = _get_rows_average(rx_goodputs)
+        rx_rate_prev = np.where(is_prev, _get_prev(rx_rate), 0.0)
+        rate_of_change = np.abs(rx_rate - rx_rate_prev)
+        # don't penalize if bitrate changes less than 10% or if it's the first state
+        reward_smooth = np.where((rate_of_change <= 0.1) | (rx_rate_prev == 0.0), 1.0, 1 - rate_of_change)
+        reward_smooth *= 0.1
+
+        # 6. pli rate should not be higher than 0.01%: 0..0.05
+        pli_rate = _get_rows_average(_get_rows(states, "fractionPliRate"))
+        reward_pli = np.maximum(0, 1 - (pli_rate * 10000))
+        reward_pli *= 0.05
+
+        # 7. nack rate should not be higher than 1%: 0..0.05
+        nack_rate = _get_rows_average(_get_rows(states, "fractionNackRate"))
+        reward_nack = np.maximum(0, 1 - (nack_rate * 100))
+        reward_nack *= 0.05
+
+        # final
+        reward = reward_rate + reward_rtt + reward_plr + reward_jitter + reward_smooth + reward_pli + reward_nack
+        reward = np.clip(reward, 0, 1)
+        # ! extra cases:
+        # 1. if plr > 25% then reward = 0
+        # 2. if rtt > 750ms then reward = 0
+        # 3. if rxRate / txRate < 0.2 then reward = 0
+        # 4. if jitter > 250ms then reward = 0
+        # 5. if plir > 1% then reward = 0
+        tx_rate = _get_rows_average(_get_rows(states, "txGoodput"))
+        penalty = _get_penalties(
+            [
+                (fraction_loss_rate > 0.25, "plr "),
+                (fraction_rtt > 0.75, "rtt "),
+                ((tx_rate > 0) & (rx_rate < 0.2 * tx_rate), "rate "),
+                (jitter > 0.25, "jit "),
+                (pli_rate > 0.01, "pli "),
+            ],
+            len(reward),
+        )
+        reward = np.where(penalty != "", 0.0, reward)
+
+        return reward, dict(
+            zip(
+                self.reward_parts,
+                [
+                    reward,
+                    reward_rate,
+                    reward_rtt,
+                    reward_plr,
+                    reward_jitter,
+                    reward_smooth,
+                    reward_pli,
+                    reward_nack,
+                    penalty,
+                ],
+            )
+        )
+
 
 class QoeAhoySeqSensible(RewardFunction):
+    state_keys = [
+        "bandwidth",
+        "fractionLossRate",
+        "fractionNackRate",
+        "fractionPliRate",
+        "fractionRtt",
+        "interarrivalRttJitter",
+        "rttMean",
+        "rxGoodput",
+        "txGoodput",
+    ]
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.reward_parts = ["rew", "rate", "rtt", "plr", "jit", "smt", "pli", "nack", "pen"]
@@ -413,8 +760,120 @@ class QoeAhoySeqSensible(RewardFunction):
             )
         )
 
+    def calculate_rewards(
+        self,
+        states: Dict[str, np.ndarray],
+        params: Dict[str, Any] | None = None,
+        state_history_size: int | None = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        rx_goodputs = _get_rows(states, "rxGoodput")
+        is_prev = np.arange(len(rx_goodputs)) > 0
+
+        # 1. rate: 0...0.25
+        reward_rate = np.log((np.exp(1) - 1) * _get_rows_average(rx_goodputs, is_skip_zeroes=True) + 1)
+        reward_rate *= 0.25
+
+        # 2. rtt: 0...0.2
+        fraction_rtt = _get_rows_average(_get_rows(states, "fractionRtt"))
+        # 2.1. mean - current rtt
+        sub_reward_avg_curr_diff_rtt = _get_column(states, "rttMean") - fraction_rtt
+        # 2.2. prev - current rtt
+        sub_reward_prev_curr_diff_rtt = 2 * np.where(is_prev, _get_prev(fraction_rtt) - fraction_rtt, 0.0)
+        # final
+        sub_sum_rtt = sub_reward_avg_curr_diff_rtt + sub_reward_prev_curr_diff_rtt
+        # if >= 0 then it is perfect and give the max reward 0, if less then penalize until -0.4.
+        # final reward is bw 0..0.2
+        final_sum_rtt = np.where(sub_sum_rtt >= 0, 0.0, np.maximum(-0.4, sub_sum_rtt))
+        # if rtt > 200 ms but lower than 750 ms give stricter directer reward starting from 60% till 0%
+        reward_rtt = np.where(
+            fraction_rtt <= 0.2,
+            (0.4 + final_sum_rtt) * 0.5,
+            np.maximum(0, 0.6 - 0.6 * (fraction_rtt - 0.2) / 0.55) * 0.2,
+        )
+
+        # 3. plr: 0...0.25
+        # almost no loss policy: avoid it at any cost as it means the freezing of the video
+        fraction_loss_rate = _get_rows_average(_get_rows(states, "fractionLossRate"))
+        reward_plr = np.power(np.maximum(0, 1 - 10 * fraction_loss_rate), 2)
+        reward_plr *= 0.25
+
+        # 4. jitter: 0...0.1
+        # max 250 ms, more than that is very bad, 10 ms jitter is considered to be acceptable
+        jitter = _get_rows(states, "interarrivalRttJitter").max(axis=1)
+        thresholded_jitter = np.maximum(0, jitter - 0.01)
+        reward_jitter = np.maximum(0, 0.5 - np.sqrt(thresholded_jitter))
+        reward_jitter *= 0.2
+
+        # 5. smooth: take rate of change: 0...0.1
+        rx_rate = _get_rows_average(rx_goodputs)
+        rx_rate_prev = np.where(is_prev, _get_prev(rx_rate), 0.0)
+        rate_of_change = np.abs(rx_rate - rx_rate_prev)
+        # don't penalize if bitrate changes less than 10% or if it's the first state
+        reward_smooth = np.where((rate_of_change <= 0.1) | (rx_rate_prev == 0.0), 1.0, 1 - rate_of_change)
+        reward_smooth *= 0.1
+
+        # 6. pli rate should not be higher than 0.01%: 0..0.05
+        pli_rate = _get_rows_average(_get_rows(states, "fractionPliRate"))
+        reward_pli = np.maximum(0, 1 - (pli_rate * 10000))
+        reward_pli *= 0.05
+
+        # 7. nack rate should not be higher than 1%: 0..0.05
+        nack_rate = _get_rows_average(_get_rows(states, "fractionNackRate"))
+        reward_nack = np.maximum(0, 1 - (nack_rate * 100))
+        reward_nack *= 0.05
+
+        # final
+        reward = reward_rate + reward_rtt + reward_plr + reward_jitter + reward_smooth + reward_pli + reward_nack
+        reward = np.clip(reward, 0, 1)
+
+        # ! extra cases:
+        # 1. if plr > 10% then reward = 0
+        # 2. if rtt > 750ms then reward = 0
+        # 3. if rxRate / txRate < 0.2 then reward = 0
+        # 4. if jitter > 250ms then reward = 0
+        # 5. if plir > 0.1% then reward = 0
+        # 6. if there is a drop (min_diff <= -0.3) in previous gcc estimations and the last action has ignored it
+        tx_rate = _get_rows_average(_get_rows(states, "txGoodput"))
+        prev_bws = _get_prev(_get_rows(states, "bandwidth"))
+        # > 1 means was a change in the previous state
+        is_gcc_drop = is_prev & (np.diff(prev_bws, axis=1).min(axis=1) <= -0.3 if prev_bws.shape[1] > 1 else False)
+        if np.any(is_gcc_drop):
+            # more than half of the possible bitrate was allocated
+            is_gcc_drop &= _get_actions(params["actions"], len(reward)) > 0
+        penalty = _get_penalties(
+            [
+                (fraction_loss_rate > 0.1, "plr "),
+                (fraction_rtt > 0.75, "rtt "),
+                ((tx_rate > 0) & (rx_rate < 0.2 * tx_rate), "rate "),
+                (jitter > 0.25, "jit "),
+                (pli_rate > 0.001, "pli "),
+                (is_gcc_drop, "gcc "),
+            ],
+            len(reward),
+        )
+        reward = np.where(penalty != "", 0.0, reward)
+
+        return reward, dict(
+            zip(
+                self.reward_parts,
+                [
+                    reward,
+                    reward_rate,
+                    reward_rtt,
+                    reward_plr,
+                    reward_jitter,
+                    reward_smooth,
+                    reward_pli,
+                    reward_nack,
+                    penalty,
+                ],
+            )
+        )
+
 
 class QoeOffline(RewardFunction):
+    state_keys = ["00_RECV_RATE", "04_DELAY", "05_MIN_SEEN_DELAY", "09_PKT_JITTER", "10_PKT_LOSS_RATIO"]
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.reward_parts = ["rew"]
@@ -469,6 +928,44 @@ class QoeOffline(RewardFunction):
 
         return reward, dict(zip(self.reward_parts, [reward]))
 
+    def calculate_rewards(
+        self,
+        states: Dict[str, np.ndarray],
+        params: Dict[str, Any] | None = None,
+        state_history_size: int | None = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        # 1. rate: 0...0.3
+        max_rate = params["constants"]["MAX_BITRATE_STREAM_MBPS"] * 1e6  # bps
+        rewards_rate = np.log((np.exp(1) - 1) * (np.minimum(1, _get_rows(states, "00_RECV_RATE") / max_rate) + 1))
+
+        # 2. delay: 0...0.3
+        # add a substracted base delay of 200 ms to have an absolute value
+        delays = _get_rows(states, "04_DELAY") + 200
+        min_seen_delays = _get_rows(states, "05_MIN_SEEN_DELAY")
+        # d_max - d / d_max - d_min, max delay is either one for all states or per state
+        max_delay = np.asarray(params["max_delay"], dtype=np.float64).reshape(-1, 1)
+        delay_range = max_delay - min_seen_delays
+        rewards_delay = np.divide(
+            max_delay - delays, delay_range, out=np.ones_like(delays), where=delay_range != 0
+        )
+
+        # 3. plr: 0...0.3
+        # plr is not so often but very deadly, so penalize more. Set 20% to be the most critical
+        rewards_plr = 1 - _get_rows(states, "10_PKT_LOSS_RATIO")
+
+        # 4. jitter: 0...0.1
+        rewards_jitter = -0.04 * np.sqrt(np.minimum(625, _get_rows(states, "09_PKT_JITTER"))) + 1
+
+        # combine with weights 0.3, 0.3, 0.3, 0.1
+        rewards = 0.3 * rewards_rate + 0.3 * rewards_delay + 0.3 * rewards_plr + 0.1 * rewards_jitter
+
+        # get decay weights
+        decay_weights = get_decay_weights(5)  # num obs = 5
+        reward = rewards @ decay_weights[: rewards.shape[1]]
+        reward *= 5
+
+        return reward, dict(zip(self.reward_parts, [reward]))
+
 
 class RewardFunctionFactory:
     reward_functions = {
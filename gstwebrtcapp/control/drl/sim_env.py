@@ -0,0 +1,100 @@
+import math
+import secrets
+from gymnasium.utils import seeding
+from typing import Any, Dict, List
+
+from control.drl.env import DrlEnv
+from control.drl.mdp import MDP
+from media.preset import get_video_preset
+from message.client import make_local_mqtt_pair
+from network.simulation import SimulatedLink, SimulatedLinkConfig
+from network.trace import NetworkTrace, load_network_traces
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+
+class SimulatedDrlEnv(DrlEnv):
+    """
+    DrlEnv that runs against a trace-driven simulated link instead of a live GStreamer pipeline. The stats and
+    the GCC estimates are generated in simulated time, so the steps run much faster than real time. Any MDP
+    could be used: the stats have the GStreamer shape, and the estimates reach the MDP via the local MQTT transport.
+    Actions are applied to the simulated encoder the same way the connectors apply them to the pipeline.
+
+    :param mdp: The MDP instance
+    :param traces: The bandwidth traces or a folder with the csv trace files (see load_network_traces)
+    :param max_episodes: The maximal number of episodes, -1 means unlimited
+    :param state_update_interval: The simulated time in seconds between the steps
+    :param stats_interval: The simulated time in seconds between two stats collections
+    :param link_config: The params of the simulated link
+    :param seed: The seed of the simulation, reset(seed=...) reseeds it and restarts the traces
+    :param is_curriculum_learning: Sort the traces loaded from a folder by complexity
+    """
+
+    def __init__(
+        self,
+        mdp: MDP,
+        traces: List[NetworkTrace] | str,
+        max_episodes: int = -1,
+        state_update_interval: float = 1.0,
+        stats_interval: float = 0.1,
+        link_config: SimulatedLinkConfig = SimulatedLinkConfig(),
+        seed: int | None = None,
+        is_curriculum_learning: bool = False,
+    ):
+        if isinstance(traces, str):
+            traces = load_network_traces(traces, is_curriculum_learning)
+        if stats_interval <= 0 or state_update_interval <= 0:
+            raise GSTWEBRTCAPP_EXCEPTION("SimulatedDrlEnv: the intervals should be positive")
+
+        # gcc estimates are delivered to the MDP in the same process, each env gets its own topics
+        mqtts = make_local_mqtt_pair(f"sim_{secrets.token_hex(4)}", ["gcc"])
+        mdp.mqtts = mqtts
+
+        super().__init__(mdp, mqtts, max_episodes, state_update_interval, math.inf)
+        self.stats_interval = stats_interval
+        # the same number of stats collections per step as the stats scheduler delivers in real time
+        self.num_observations_per_step = max(
+            self.mdp.num_observations_for_state, round(state_update_interval / stats_interval)
+        )
+
+        self._np_random, _ = seeding.np_random(seed)
+        self.link = SimulatedLink(traces, link_config, self.np_random)
+        LOGGER.info(
+            f"OK: SimulatedDrlEnv: {len(self.link.traces)} traces, {self.num_observations_per_step} stats per step"
+        )
+
+    def reset(self, seed=None, options={}):
+        state, info = super().reset(seed=seed, options=options)
+        if seed is not None:
+            self.link.reset(self.np_random)
+        return state, info
+
+    def close(self) -> None:
+        self.mqtts.stop()
+
+    def _apply_action(self, action: Any) -> None:
+        controller_action = self.mdp.pack_action_for_controller(action)
+        if "bitrate" in controller_action:
+            bitrate = controller_action["bitrate"]
+        elif "preset" in controller_action:
+            bitrate = get_video_preset(controller_action["preset"]).bitrate
+        else:
+            return
+        # the same 10% policy as in the connectors: the bitrate is changed only if it differs by more than 10%
+        current = self.link.target_bitrate / 1000
+        if current <= 0 or abs(current - bitrate) / current > 0.1:
+            self.link.set_target_bitrate(bitrate * 1000)
+
+    def _get_observation(self) -> Dict[str, Any] | None:
+        if self.is_finished:
+            self._on_finish()
+            return None
+
+        # the estimates not consumed by the MDP on the last step (e.g., it does not use them) are dropped
+        self.mqtts.subscriber.clean_message_queue(self.mqtts.subscriber.topics.gcc)
+        self.observation_buffer.clear()
+        for _ in range(self.num_observations_per_step):
+            stats = self.link.advance(self.stats_interval)
+            self.mqtts.publisher.publish(self.mqtts.subscriber.topics.gcc, self.link.gcc_estimate)
+            if self.mdp.check_observation(stats):
+                self.observation_buffer.append(stats)
+        return self._select_observations()
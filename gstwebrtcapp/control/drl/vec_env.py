@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import gymnasium
+import numpy as np
+from typing import Callable, List
+
+from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+
+class ThreadedVecEnv(DummyVecEnv):
+    """
+    Vectorized env that steps all its envs in parallel threads. The DRL envs spend the steps waiting for the stats
+    of their feeds (wall-clock bounded by the state update interval), so N feeds give N transitions per interval.
+    Unlike SubprocVecEnv, the envs stay in the agent's process and keep sharing its MQTT connection (or local hub).
+
+    :param env_fns: list of functions that create the envs
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gymnasium.Env]]):
+        super().__init__(env_fns)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_envs, thread_name_prefix="drl_env")
+
+    def step_wait(self) -> VecEnvStepReturn:
+        # each env writes only its own slots of the buffers
+        list(self.executor.map(self._step_env, range(self.num_envs)))
+        return (self._obs_from_buf(), np.copy(self.buf_rews), np.copy(self.buf_dones), copy.deepcopy(self.buf_infos))
+
+    def reset(self) -> VecEnvObs:
+        list(self.executor.map(self._reset_env, range(self.num_envs)))
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs_from_buf()
+
+    def close(self) -> None:
+        super().close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _step_env(self, env_idx: int) -> None:
+        obs, self.buf_rews[env_idx], terminated, truncated, self.buf_infos[env_idx] = self.envs[env_idx].step(
+            self.actions[env_idx]
+        )
+        self.buf_dones[env_idx] = terminated or truncated
+        self.buf_infos[env_idx]["TimeLimit.truncated"] = truncated and not terminated
+        if self.buf_dones[env_idx]:
+            self.buf_infos[env_idx]["terminal_observation"] = obs
+            obs, self.reset_infos[env_idx] = self.envs[env_idx].reset()
+        self._save_obs(env_idx, obs)
+
+    def _reset_env(self, env_idx: int) -> None:
+        maybe_options = {"options": self._options[env_idx]} if self._options[env_idx] else {}
+        obs, self.reset_infos[env_idx] = self.envs[env_idx].reset(seed=self._seeds[env_idx], **maybe_options)
+        self._save_obs(env_idx, obs)
@@ -9,7 +9,9 @@ import torch
 from control.agent import Agent, AgentType
 from control.drl.mdp import MDP
 from control.drl.env import DrlEnv
+from control.drl.inference import BatchedPolicyServer, PolicyInferenceEngine
 from control.drl_offline.config import DrlOfflineConfig
+from control.drl_offline.dataset import to_d3rlpy_observation
 from message.client import MqttConfig
 from utils.base import LOGGER
 
@@ -21,15 +23,21 @@ class DrlOfflineAgent(Agent):
         mdp: MDP,
         mqtt_config: MqttConfig,
         warmup: float = 20.0,
+        policy_server: BatchedPolicyServer | None = None,
     ) -> None:
         super().__init__(mqtt_config)
 
         self.drl_offline_config = drl_offline_config
         self.mdp = mdp
         self.warmup = warmup
+        # a started server shared by the agents of many feeds, then the model file is not loaded
+        self.policy_server = policy_server
         self.type = AgentType.DRL_OFFLINE
+        self.stats_schema = self.mdp.get_stats_schema()
+        self.stats_interval = self.drl_offline_config.state_update_interval / self.mdp.num_observations_for_state
 
         self.model = None
+        self.engine = None
         self.env = None
         self.is_episode_done = False
         self.is_running = False
@@ -45,13 +53,12 @@ class DrlOfflineAgent(Agent):
             for _ in (
                 range(self.drl_offline_config.episodes) if self.drl_offline_config.episodes != -1 else iter(int, 1)
             ):
-                state = self._to_d3rlpy_state(self.env.reset()[0])
+                state_gym = self.env.reset()[0]
                 reward = 0.0
                 # TODO: add logging
                 while not self.is_episode_done:
-                    action = self.model.predict(state, reward)
+                    action = self._predict(state_gym, reward)
                     state_gym, reward, term, trunc, _ = self.env.step(action)
-                    state = self._to_d3rlpy_state(state_gym)
                     self.is_episode_done = term or trunc
 
     def stop(self) -> None:
@@ -61,8 +68,15 @@ class DrlOfflineAgent(Agent):
         LOGGER.info("INFO: stopping DrlOffline agent...")
 
     def _setup(self) -> None:
-        if not os.path.isfile(self.drl_offline_config.model_file):
+        if self.policy_server is not None:
+            pass
+        elif not os.path.isfile(self.drl_offline_config.model_file):
             raise FileNotFoundError(f"DrlOfflineAgent: Model file {self.drl_offline_config.model_file} not found!")
+        elif self.drl_offline_config.model_file.endswith(".pt"):
+            # TorchScript policy exported by d3rlpy save_policy(): the flat observations are written into the inputs
+            self.engine = PolicyInferenceEngine.load(
+                self.drl_offline_config.model_file, self.mdp.create_observation_space(), max_batch_size=1
+            )
         else:
             m = d3rlpy.load_learnable(
                 self.drl_offline_config.model_file,
@@ -84,7 +98,14 @@ class DrlOfflineAgent(Agent):
 
         self.is_running = True
 
+    def _predict(self, state: OrderedDict[str, Any], reward: float) -> np.ndarray:
+        if self.policy_server is not None:
+            return self.policy_server.predict(state)
+        elif self.engine is not None:
+            return self.engine.predict_batch([state])[0]
+        else:
+            return self.model.predict(self._to_d3rlpy_state(state), reward)
+
     def _to_d3rlpy_state(self, state: OrderedDict[str, Any]) -> np.ndarray:
-        concatenated_values = np.array([v for values_list in state.values() for v in values_list])
-        # return np.expand_dims(concatenated_values, axis=0).astype(np.float32)
-        return concatenated_values.astype(np.float32)
+        # the same layout as in the datasets built by build_offline_dataset
+        return to_d3rlpy_observation(state)
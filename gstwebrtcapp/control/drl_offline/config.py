@@ -6,7 +6,7 @@ class DrlOfflineConfig:
     """
     A data class to hold DRL config.
 
-    :param model_file: The file containing the D3RLPY model. Nullable
+    :param model_file: The file containing the D3RLPY model or a TorchScript policy (.pt) exported by its save_policy. Nullable
     :param episodes: The number of episodes to run. -1 means run indefinitely
     :param episode_length: The number of steps per episode
     :param state_update_interval: The interval between the state updates in seconds
@@ -22,3 +22,21 @@ class DrlOfflineConfig:
     state_max_inactivity_time: float = 60.0
     save_log_path: str = './logs'
     device: str | None = None
+
+
+@dataclass
+class DrlOfflineDatasetConfig:
+    """
+    A data class to hold the config of the offline dataset builder.
+
+    :param state_update_interval: The recorded time in seconds between the states (as in the online DRL config)
+    :param action_source: The source of the behavior actions: "gcc" (recorded GCC estimates), "actions" (recorded
+        actions of DrlAgent or any other controller) or "tx_rate" (the sending bitrate from the stats)
+    :param min_episode_length: The episodes shorter than this number of transitions are dropped
+    :param num_workers: The number of processes to build the sessions with. None means the number of CPUs
+    """
+
+    state_update_interval: float = 3.0
+    action_source: str = "gcc"
+    min_episode_length: int = 2
+    num_workers: int | None = None
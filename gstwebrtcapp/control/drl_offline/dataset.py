@@ -0,0 +1,249 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import copy
+import glob
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, OrderedDict
+
+import numpy as np
+
+from control.drl.mdp import MDP, ViewerSeqOfflineMDP
+from control.drl.replay import ReplayDrlEnv
+from control.drl_offline.config import DrlOfflineDatasetConfig
+from media.preset import get_video_preset
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+from utils.gst import GstWebRTCStatsType, StatsSnapshot, find_stat
+
+# arrays of one chunk, each stored in its own .npy file to be memory-mapped on loading
+DATASET_ARRAYS = ("observations", "actions", "rewards", "terminals", "timeouts")
+
+
+def to_d3rlpy_observation(state: OrderedDict[str, Any]) -> np.ndarray:
+    # flat float32 vector of the state values in the order of the observation space keys
+    return np.concatenate([np.atleast_1d(np.asarray(v, dtype=np.float32)).ravel() for v in state.values()])
+
+
+def get_behavior_action(frames: List[Dict[str, Any]], action_source: str) -> float | None:
+    """
+    Get the behavior action (bitrate in bps) that was in effect within the recorded frames of one step.
+
+    :param frames: the recorded frames of the step (see ReplayDrlEnv.last_frames)
+    :param action_source: "gcc", "actions" or "tx_rate" (see DrlOfflineDatasetConfig)
+    :return: the bitrate in bps or None if the frames have no action
+    """
+    values = []
+    for frame in frames:
+        topic = frame["topic"].split("/")[-1]
+        if action_source == "gcc" and topic == "gcc":
+            values.append(float(frame["msg"]))
+        elif action_source == "actions" and topic == "actions":
+            # the actions are published as the controller ones, the last one is in effect
+            msg = frame["msg"]
+            if "bitrate" in msg:
+                values = [float(msg["bitrate"]) * 1000]
+            elif "preset" in msg:
+                values = [float(get_video_preset(msg["preset"]).bitrate) * 1000]
+        elif action_source == "tx_rate" and topic == "stats":
+            ice_candidate_pair = find_stat(StatsSnapshot.wrap(frame["msg"]), GstWebRTCStatsType.ICE_CANDIDATE_PAIR)
+            if ice_candidate_pair and "bitrate-sent" in ice_candidate_pair[0]:
+                values.append(float(ice_candidate_pair[0]["bitrate-sent"]))
+    return float(np.mean(values)) if values else None
+
+
+def build_session_chunk(
+    path: str,
+    chunk_folder: str,
+    mdp: MDP,
+    config: DrlOfflineDatasetConfig = DrlOfflineDatasetConfig(),
+) -> Dict[str, Any]:
+    """
+    Convert one recorded session (see StatsStreamRecorderAgent) into the offline RL transitions and save them as
+    a chunk of .npy files. The recording is replayed into the MDP step by step as DrlEnv does. The transition of
+    step t is (s_t, a_t, r_t), where a_t is the behavior action in effect within the next step and r_t is the reward
+    of the MDP for the state made after it. The episodes are split by the MDP's episode length.
+
+    :param path: path to the recording
+    :param chunk_folder: folder to save the chunk to
+    :param mdp: the MDP to make the states and rewards with, e.g., ViewerSeqOfflineMDP with QoeOffline reward
+    :param config: the dataset config
+    :return: dict with the chunk folder and the number of transitions and episodes
+    """
+    if config.action_source not in ("gcc", "actions", "tx_rate"):
+        raise GSTWEBRTCAPP_EXCEPTION(f"build_session_chunk: unknown action source {config.action_source}")
+    env = ReplayDrlEnv(
+        mdp,
+        path,
+        state_update_interval=config.state_update_interval,
+        topics=["stats", "gcc", "actions"],
+    )
+    arrays = {name: [] for name in DATASET_ARRAYS}
+    num_episodes = 0
+    episode_start = 0
+
+    def end_episode() -> None:
+        nonlocal num_episodes, episode_start
+        if len(arrays["rewards"]) - episode_start < max(1, config.min_episode_length):
+            for values in arrays.values():
+                del values[episode_start:]
+        else:
+            arrays["timeouts"][-1] = not arrays["terminals"][-1]
+            num_episodes += 1
+        episode_start = len(arrays["rewards"])
+        mdp.reset()
+
+    try:
+        mdp.reset()
+        state = None
+        action = None
+        while True:
+            stats = env.get_next_observation()
+            if stats is None:
+                break
+            behavior_action = get_behavior_action(env.last_frames, config.action_source)
+            # the last known action stays in effect if there is no new one within the step
+            action = behavior_action if behavior_action is not None else action
+            next_state = mdp.make_state(stats, np.array([action], dtype=np.float32) if action is not None else None)
+            if state is not None and action is not None:
+                reward, _ = mdp.calculate_reward()
+                arrays["observations"].append(to_d3rlpy_observation(state))
+                arrays["actions"].append([action])
+                arrays["rewards"].append(reward)
+                steps = len(arrays["rewards"]) - episode_start
+                arrays["terminals"].append(mdp.is_terminated(steps))
+                arrays["timeouts"].append(False)
+                if arrays["terminals"][-1] or mdp.is_truncated(steps):
+                    end_episode()
+                    next_state = None
+            state = next_state
+        if len(arrays["rewards"]) > episode_start:
+            end_episode()
+    finally:
+        env.close()
+
+    num_transitions = len(arrays["rewards"])
+    if num_transitions > 0:
+        # written to a temporary folder first, so the loader never sees a partial chunk
+        tmp_folder = chunk_folder + ".tmp"
+        os.makedirs(tmp_folder, exist_ok=True)
+        np.save(os.path.join(tmp_folder, "observations.npy"), np.stack(arrays["observations"]))
+        np.save(os.path.join(tmp_folder, "actions.npy"), np.asarray(arrays["actions"], dtype=np.float32))
+        np.save(os.path.join(tmp_folder, "rewards.npy"), np.asarray(arrays["rewards"], dtype=np.float32))
+        np.save(os.path.join(tmp_folder, "terminals.npy"), np.asarray(arrays["terminals"], dtype=np.float32))
+        np.save(os.path.join(tmp_folder, "timeouts.npy"), np.asarray(arrays["timeouts"], dtype=np.float32))
+        if os.path.isdir(chunk_folder):
+            shutil.rmtree(chunk_folder)
+        os.replace(tmp_folder, chunk_folder)
+    return {"chunk": chunk_folder, "transitions": num_transitions, "episodes": num_episodes}
+
+
+def build_offline_dataset(
+    sessions: List[str] | str,
+    output_folder: str,
+    mdp: MDP | None = None,
+    config: DrlOfflineDatasetConfig = DrlOfflineDatasetConfig(),
+) -> Dict[str, Any]:
+    """
+    Build an offline RL dataset from many recorded sessions in parallel processes, one chunk per session.
+    Load it with load_offline_dataset.
+
+    :param sessions: paths to the recordings or a folder with the .jsonl.gz recordings
+    :param output_folder: folder to save the chunks to
+    :param mdp: the MDP to make the states and rewards with, each session gets its own copy.
+        If None, ViewerSeqOfflineMDP with QoeOffline reward is used
+    :param config: the dataset config
+    :return: dict with the number of the built chunks, transitions, episodes and the failed sessions
+    """
+    if isinstance(sessions, str):
+        sessions = sorted(glob.glob(os.path.join(sessions, "*.jsonl.gz")))
+    if not sessions:
+        raise GSTWEBRTCAPP_EXCEPTION("build_offline_dataset: no sessions to build the dataset from")
+    if mdp is None:
+        mdp = ViewerSeqOfflineMDP(
+            reward_function_name="qoe_offline",
+            episode_length=256,
+            num_observations_for_state=5,
+        )
+    os.makedirs(output_folder, exist_ok=True)
+
+    summary = {"chunks": 0, "transitions": 0, "episodes": 0, "failed": []}
+    num_workers = min(config.num_workers or os.cpu_count() or 1, len(sessions))
+    # the index keeps the chunks of the sessions with the same file name apart and in the order of the sessions
+    chunk_folders = [
+        os.path.join(output_folder, f"{i:05d}_{os.path.basename(path).split('.')[0]}")
+        for i, path in enumerate(sessions)
+    ]
+    if num_workers == 1:
+        results = {}
+        for path, chunk_folder in zip(sessions, chunk_folders):
+            try:
+                results[path] = build_session_chunk(path, chunk_folder, copy.deepcopy(mdp), config)
+            except Exception as e:
+                results[path] = e
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(build_session_chunk, path, chunk_folder, mdp, config): path
+                for path, chunk_folder in zip(sessions, chunk_folders)
+            }
+            results = {}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+
+    for path, result in results.items():
+        if isinstance(result, Exception):
+            LOGGER.error(f"ERROR: build_offline_dataset: failed to build the session {path}: {result}")
+            summary["failed"].append(path)
+        elif result["transitions"] > 0:
+            summary["chunks"] += 1
+            summary["transitions"] += result["transitions"]
+            summary["episodes"] += result["episodes"]
+    LOGGER.info(
+        f"OK: build_offline_dataset: {summary['chunks']} chunks, {summary['episodes']} episodes,"
+        f" {summary['transitions']} transitions from {len(sessions)} sessions saved to {output_folder}"
+    )
+    return summary
+
+
+def iter_offline_dataset_chunks(folder: str, is_mmap: bool = True) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Iterate over the chunks of the dataset built by build_offline_dataset in the order of the sessions.
+
+    :param folder: the dataset folder
+    :param is_mmap: whether to memory-map the arrays instead of reading them into memory
+    :return: generator of dicts with the arrays of DATASET_ARRAYS
+    """
+    for chunk_folder in sorted(glob.glob(os.path.join(folder, "*"))):
+        if not os.path.isdir(chunk_folder) or chunk_folder.endswith(".tmp"):
+            continue
+        yield {
+            name: np.load(os.path.join(chunk_folder, f"{name}.npy"), mmap_mode="r" if is_mmap else None)
+            for name in DATASET_ARRAYS
+        }
+
+
+def load_offline_dataset(folder: str, is_mmap: bool = True) -> Any:
+    """
+    Load the dataset built by build_offline_dataset as d3rlpy MDPDataset. With memory mapping, the chunks are
+    concatenated straight from the page cache, so only the final arrays are allocated.
+
+    :param folder: the dataset folder
+    :param is_mmap: whether to memory-map the chunks
+    :return: d3rlpy.dataset.MDPDataset
+    """
+    # imported here to keep the torch import out of the builder processes
+    import d3rlpy
+
+    chunks = list(iter_offline_dataset_chunks(folder, is_mmap))
+    if not chunks:
+        raise GSTWEBRTCAPP_EXCEPTION(f"load_offline_dataset: no chunks in {folder}")
+    arrays = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in DATASET_ARRAYS}
+    return d3rlpy.dataset.MDPDataset(
+        observations=arrays["observations"],
+        actions=arrays["actions"],
+        rewards=arrays["rewards"],
+        terminals=arrays["terminals"],
+        timeouts=arrays["timeouts"],
+    )
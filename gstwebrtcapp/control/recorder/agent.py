@@ -1,14 +1,13 @@
 import csv
 from datetime import datetime
-import json
 import os
 import time
 from typing import Any, Dict, List
 
 from control.agent import Agent, AgentType
-from message.client import MqttConfig, MqttMessage
+from message.client import MqttConfig, MqttMessage, format_mqtt_timestamp, unpack_mqtt_msg
 from utils.base import LOGGER
-from utils.gst import GstWebRTCStatsType, find_stat, get_stat_diff, is_same_rtcp
+from utils.gst import GstWebRTCStatsType, StatsSchema, StatsSnapshot, find_stat, get_stat_diff, is_same_rtcp
 from utils.webrtc import clock_units_to_seconds, ntp_short_format_to_seconds
 
 
@@ -24,11 +23,33 @@ class CsvViewerRecorderAgent(Agent):
     ) -> None:
         super().__init__(mqtt_config)
         self.stats_update_interval = stats_update_interval
+        self.stats_interval = stats_update_interval
         self.warmup = warmup
         self.log_path = log_path
         self.max_inactivity_time = max_inactivity_time
         self.verbose = min(verbose, 2)
         self.type = AgentType.RECORDER
+        self.stats_schema = StatsSchema(
+            {
+                GstWebRTCStatsType.RTP_OUTBOUND_STREAM: [
+                    "packets-sent",
+                    "packets-received",
+                    "bytes-sent",
+                    "bytes-received",
+                    "recv-nack-count",
+                    "recv-pli-count",
+                    "clock-rate",
+                ],
+                GstWebRTCStatsType.RTP_INBOUND_STREAM: [
+                    "rb-fractionlost",
+                    "rb-packetslost",
+                    "rb-exthighestseq",
+                    "rb-round-trip",
+                    "rb-jitter",
+                ],
+                GstWebRTCStatsType.ICE_CANDIDATE_PAIR: ["bitrate-recv", "bitrate-sent"],
+            }
+        )
 
         # cooked stats
         self.stats = []
@@ -61,23 +82,26 @@ class CsvViewerRecorderAgent(Agent):
                             self._save_stats_to_csv()
 
     def _fetch_stats(self) -> List[MqttMessage] | None:
-        time_inactivity_starts = time.time()
-        stats = []
-        while not self.mqtts.subscriber.message_queues[self.mqtts.subscriber.topics.stats].empty():
-            gst_stats = self.mqtts.subscriber.get_message(self.mqtts.subscriber.topics.stats)
-            if gst_stats is None:
-                if time.time() - time_inactivity_starts > self.max_inactivity_time:
-                    LOGGER.warning(
-                        "WARNING: No stats were pulled from the observation queue after"
-                        f" {self.max_inactivity_time} sec"
-                    )
-                    return None
-            else:
-                stats.append(gst_stats)
-        return stats or None
+        # block until the first stats arrive (or the subscriber is stopped), then take all the rest pending ones
+        gst_stats = self.mqtts.subscriber.get_message(
+            self.mqtts.subscriber.topics.stats,
+            timeout=self.max_inactivity_time,
+        )
+        if gst_stats is None:
+            if self.is_running:
+                LOGGER.warning(
+                    "WARNING: No stats were pulled from the observation queue after"
+                    f" {self.max_inactivity_time} sec"
+                )
+            return None
+        stats = [gst_stats]
+        while (gst_stats := self.mqtts.subscriber.get_message(self.mqtts.subscriber.topics.stats)) is not None:
+            stats.append(gst_stats)
+        return stats
 
     def _select_stats(self, gst_stats_mqtt: MqttMessage) -> bool:
-        gst_stats = json.loads(gst_stats_mqtt.msg)
+        # indexed once, the same snapshot is looked up again as the last stats
+        gst_stats = StatsSnapshot.wrap(unpack_mqtt_msg(gst_stats_mqtt.msg))
         rtp_outbound = find_stat(gst_stats, GstWebRTCStatsType.RTP_OUTBOUND_STREAM)
         rtp_inbound = find_stat(gst_stats, GstWebRTCStatsType.RTP_INBOUND_STREAM)
         ice_candidate_pair = find_stat(gst_stats, GstWebRTCStatsType.ICE_CANDIDATE_PAIR)
@@ -146,7 +170,7 @@ class CsvViewerRecorderAgent(Agent):
 
             # opened to extensions
             final_stats = {
-                "timestamp": gst_stats_mqtt.timestamp,
+                "timestamp": format_mqtt_timestamp(gst_stats_mqtt.timestamp),
                 "ssrc": ssrc,
                 "fraction_packets_lost": rtp_inbound_ssrc["rb-fractionlost"],
                 "packets_lost": rtp_inbound_ssrc["rb-packetslost"],
@@ -186,9 +210,10 @@ class CsvViewerRecorderAgent(Agent):
             self.stats = []
 
     def stop(self) -> None:
+        # set before stopping the subscriber to leave the stats loop once the blocked fetch is interrupted
+        self.is_running = False
         super().stop()
         LOGGER.info("INFO: stopping Csv Viewer Recorder agent...")
-        self.is_running = False
         if self.csv_handler is not None:
             self.csv_handler.close()
             self.csv_handler = None
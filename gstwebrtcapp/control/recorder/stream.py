@@ -0,0 +1,203 @@
+import gzip
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+from control.agent import Agent, AgentType
+from message.client import MqttConfig, MqttMessage, MqttPublisher, parse_mqtt_timestamp, unpack_mqtt_msg
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+
+class StatsStreamWriter:
+    '''
+    Append-only writer of the raw MQTT frames (e.g., the GStreamer stats and the GCC estimates) to a gzip file with
+    one JSON frame per line: {"timestamp": epoch seconds, "topic": topic name, "msg": message}. Each open appends a
+    new gzip member, so a recording could be continued and a file cut by a crash is readable up to the last flush.
+
+    :param str path: The path to the file, conventionally with .jsonl.gz extension
+    :param int flush_every: The number of frames after which the file is flushed
+    '''
+
+    def __init__(self, path: str, flush_every: int = 100) -> None:
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.num_frames = 0
+        self._file = gzip.open(path, "ab")
+
+    def write(self, timestamp: float, topic: str, msg: Any) -> None:
+        frame = {"timestamp": timestamp, "topic": topic, "msg": msg}
+        self._file.write(json.dumps(frame, separators=(",", ":"), default=str).encode() + b"\n")
+        self.num_frames += 1
+        if self.num_frames % self.flush_every == 0:
+            self._file.flush()
+
+    def write_message(self, message: MqttMessage) -> None:
+        self.write(parse_mqtt_timestamp(message.timestamp), message.topic, unpack_mqtt_msg(message.msg))
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self) -> 'StatsStreamWriter':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def read_stats_stream(path: str, topics: List[str] | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Read the frames recorded by StatsStreamWriter in the recorded order. A truncated last member
+    (e.g., the recorder was killed) ends the stream without an error.
+
+    :param path: path to the file
+    :param topics: the names of the topics to keep (the last part of the topic, e.g., 'stats'), None means all
+    :return: generator of the frames {"timestamp": float, "topic": str, "msg": Any}
+    """
+    with gzip.open(path, "rb") as file:
+        try:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    frame = json.loads(line)
+                except json.JSONDecodeError:
+                    LOGGER.warning(f"WARNING: read_stats_stream: skipping a corrupted frame in {path}")
+                    continue
+                if topics is None or frame["topic"].split("/")[-1] in topics or frame["topic"] in topics:
+                    yield frame
+        except (EOFError, gzip.BadGzipFile):
+            LOGGER.warning(f"WARNING: read_stats_stream: {path} is truncated, stopping at the last complete frame")
+
+
+class StatsStreamRecorderAgent(Agent):
+    '''
+    Recorder agent that captures the raw stats (and the GCC estimates) published by a connector and appends them
+    to a file with StatsStreamWriter. The recordings could be replayed to the MDPs with StatsStreamReplayer or
+    ReplayDrlEnv, e.g., to benchmark or regression-test make_state and calculate_reward on the same inputs.
+
+    :param MqttConfig mqtt_config: The config of the MQTT connection to the connector
+    :param str path: The path to the recording file
+    :param List[str] topics: The names of the topics to record
+    :param float warmup: The time in seconds to wait before recording
+    :param float max_inactivity_time: The time in seconds to wait for the stats before warning
+    '''
+
+    def __init__(
+        self,
+        mqtt_config: MqttConfig,
+        path: str = "./logs/stats.jsonl.gz",
+        topics: List[str] = ["stats", "gcc"],
+        warmup: float = 0.0,
+        max_inactivity_time: float = 5.0,
+    ) -> None:
+        super().__init__(mqtt_config)
+        self.type = AgentType.RECORDER
+        self.path = path
+        self.topics = [getattr(self.mqtt_config.topics, topic) for topic in topics]
+        self.warmup = warmup
+        self.max_inactivity_time = max_inactivity_time
+        self.writer = None
+        self.is_running = False
+
+    def run(self, _) -> None:
+        super().run()
+        for topic in self.topics:
+            if topic not in (self.mqtt_config.topics.gcc, self.mqtt_config.topics.stats):
+                self.mqtts.subscriber.subscribe([topic])
+        time.sleep(self.warmup)
+        for topic in self.topics:
+            self.mqtts.subscriber.clean_message_queue(topic)
+        self.writer = StatsStreamWriter(self.path)
+        self.is_running = True
+        LOGGER.info(f"INFO: Stats Stream Recorder agent is recording to {self.path}...")
+
+        # the stats pace the loop, the rest of the topics are drained after each stats frame
+        pacing_topic = self.mqtt_config.topics.stats if self.mqtt_config.topics.stats in self.topics else self.topics[0]
+        try:
+            while self.is_running:
+                message = self.mqtts.subscriber.get_message(pacing_topic, timeout=self.max_inactivity_time)
+                if message is None:
+                    if self.is_running:
+                        LOGGER.warning(
+                            f"WARNING: Stats Stream Recorder agent: no messages after {self.max_inactivity_time} sec"
+                        )
+                    continue
+                messages = [message]
+                for topic in self.topics:
+                    while (message := self.mqtts.subscriber.get_message(topic)) is not None:
+                        messages.append(message)
+                # the frames of different topics are recorded in the order they were published
+                messages.sort(key=lambda m: parse_mqtt_timestamp(m.timestamp))
+                for message in messages:
+                    self.writer.write_message(message)
+        finally:
+            # the writer is owned by the loop, so the last frames are written before it is closed
+            self.writer.close()
+            LOGGER.info(f"OK: Stats Stream Recorder agent has recorded {self.writer.num_frames} frames to {self.path}")
+
+    def stop(self) -> None:
+        # the loop exits after the current frames (or the inactivity timeout) and closes the writer
+        self.is_running = False
+        super().stop()
+
+
+class StatsStreamReplayer:
+    '''
+    Publishes the recorded frames to the topics of the given MQTT config as the connector did, so the agents
+    (or DrlEnv) could run on a recording without a pipeline. The frames keep their recorded topic names
+    (the last part of the topic), so a recording could be replayed to another namespace.
+
+    :param str path: The path to the recording file
+    :param MqttPublisher publisher: The started publisher to publish the frames with
+    :param float speed: The replay speed factor, 1.0 is real time. None or 0 replay at the maximal speed
+    :param List[str] topics: The names of the topics to replay, None means all recorded ones
+    '''
+
+    def __init__(
+        self,
+        path: str,
+        publisher: MqttPublisher,
+        speed: float | None = 1.0,
+        topics: List[str] | None = None,
+    ) -> None:
+        if not os.path.isfile(path):
+            raise GSTWEBRTCAPP_EXCEPTION(f"StatsStreamReplayer: no such file {path}")
+        self.path = path
+        self.publisher = publisher
+        self.speed = speed if speed else None
+        self.topics = topics
+        self.is_running = False
+
+    def run(self) -> int:
+        """
+        Replay the recording until it ends or stop() is called.
+
+        :return: the number of the published frames
+        """
+        self.is_running = True
+        num_frames = 0
+        start_time = time.monotonic()
+        first_timestamp = None
+        for frame in read_stats_stream(self.path, self.topics):
+            if not self.is_running:
+                break
+            if self.speed is not None:
+                if first_timestamp is None:
+                    first_timestamp = frame["timestamp"]
+                delay = (frame["timestamp"] - first_timestamp) / self.speed - (time.monotonic() - start_time)
+                if delay > 0:
+                    time.sleep(delay)
+            topic = getattr(self.publisher.config.topics, frame["topic"].split("/")[-1], frame["topic"])
+            self.publisher.publish(topic, frame["msg"])
+            num_frames += 1
+        self.is_running = False
+        LOGGER.info(f"OK: StatsStreamReplayer has replayed {num_frames} frames from {self.path}")
+        return num_frames
+
+    def stop(self) -> None:
+        self.is_running = False
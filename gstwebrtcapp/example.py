@@ -10,6 +10,7 @@ import threading
 
 from apps.app import GstWebRTCAppConfig
 from apps.ahoyapp.connector import AhoyConnector
+from apps.feed_manager import FeedConfig, FeedManager
 from apps.pipelines import DEFAULT_BIN_PIPELINE, DEFAULT_BIN_CUDA_PIPELINE, DEFAULT_SINK_PIPELINE
 from apps.sinkapp.connector import SinkConnector
 from control.drl.agent import DrlAgent
@@ -240,6 +241,36 @@ async def test_sink_app():
         return
 
 
+async def test_feed_manager():
+    # run it to stream several feeds from one process, each feed publishes to gstwebrtcapp/<feed>/{stats,gcc,actions}
+    try:
+        broker = MosquittoBroker()
+        broker_thread = threading.Thread(target=broker.run, daemon=True)
+        broker_thread.start()
+
+        manager = FeedManager(mqtt_config=MQTT_CFG)
+        feeds = [
+            FeedConfig(
+                name=f"camera_{i}",
+                pipeline_config=APP_CFG,
+                connector="ahoy",
+                connector_kwargs={"server": AHOY_DIRECTOR_URL, "api_key": API_KEY},
+                agents_factory=lambda mqtt_config: [
+                    CsvViewerRecorderAgent(mqtt_config=mqtt_config, stats_update_interval=1.0, log_path="./logs")
+                ],
+            )
+            for i in range(4)
+        ]
+        await manager.run(feeds, health_interval=30.0)
+
+        broker.stop()
+        broker_thread.join()
+
+    except KeyboardInterrupt:
+        LOGGER.info("KeyboardInterrupt received, exiting...")
+        return
+
+
 async def default():
     try:
         broker = MosquittoBroker()
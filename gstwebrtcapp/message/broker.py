@@ -24,10 +24,12 @@ class MosquittoBroker:
             stderr=subprocess.DEVNULL,
         )
 
-        while self.process.poll() is None:
-            if not self.is_running:
-                self.is_running = True
-                LOGGER.info(f"INFO: Mosquitto broker has been started")
+        if self.process.poll() is None:
+            self.is_running = True
+            LOGGER.info(f"INFO: Mosquitto broker has been started")
+        # block until the broker exits (e.g., on stop() call)
+        self.process.wait()
+        self.is_running = False
 
         self.stop()
 
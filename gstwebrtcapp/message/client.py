@@ -1,14 +1,17 @@
 from abc import ABCMeta
-import asyncio
+import dataclasses
 from dataclasses import dataclass, field, fields
 from datetime import datetime
-import json
 import secrets
+import threading
 import time
 import paho.mqtt.client as mqtt
-from typing import Dict, List
+from typing import Any, Dict, List
 
-from utils.base import LOGGER, wait_for_condition
+from message.codec import get_mqtt_codec, decode_mqtt_payload, unpack_mqtt_msg
+from message.hub import acquire_message_hub
+from message.queue import MqttMessageQueue, QUEUE_POLICY_DROP_OLDEST
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION, wait_for_condition
 
 
 @dataclass
@@ -24,6 +27,36 @@ class MqttExternalEstimationTopics:
     rtt: str = ""
 
 
+@dataclass
+class MqttQueueConfig:
+    """
+    A data class to hold the subscriber's queue config.
+
+    :param int maxsize: The maximal number of the queued messages. 0 means unbounded
+    :param str policy: The overflow policy. One of 'drop_oldest', 'drop_newest', 'conflate' (keeps only the latest message)
+    """
+
+    maxsize: int = 1000
+    policy: str = QUEUE_POLICY_DROP_OLDEST
+
+
+@dataclass
+class MqttBatchConfig:
+    """
+    A data class to hold the publisher's batching config of a topic.
+
+    :param int max_size: The maximal number of the messages in a batch, the batch is published once it is reached
+    :param float max_delay: The maximal time in seconds the first message of a batch waits before the batch is published
+    :param bool is_coalesce: If True, only the latest message within the batch window is published
+    :param int qos: QoS of the published batches
+    """
+
+    max_size: int = 10
+    max_delay: float = 1.0
+    is_coalesce: bool = False
+    qos: int = 0
+
+
 @dataclass
 class MqttConfig:
     id: str = ""
@@ -35,16 +68,69 @@ class MqttConfig:
     is_tls: bool = False
     topics: MqttGstWebrtcAppTopics = field(default_factory=lambda: MqttGstWebrtcAppTopics)
     external_topics: MqttExternalEstimationTopics | None = None
+    codec: str = "json"
+    # share one broker connection per process among all clients (see MqttHub). Always shared for the local transport
+    is_shared_connection: bool = True
+    # 'mqtt' for the broker or 'local' for the in-process delivery by reference if all clients are in one process
+    transport: str = "mqtt"
+    # per-topic queue configs, the topics that are not listed here get the default_queue config.
+    # NOTE: gcc is not conflated by default since the MDPs read all estimates collected between the steps
+    default_queue: MqttQueueConfig = field(default_factory=MqttQueueConfig)
+    queues: Dict[str, MqttQueueConfig] = field(default_factory=dict)
+    # per-topic batching configs of the publisher, the topics that are not listed here are published immediately.
+    # Ignored for the local transport
+    batches: Dict[str, MqttBatchConfig] = field(default_factory=dict)
+
+
+def make_namespaced_mqtt_config(config: MqttConfig, namespace: str) -> MqttConfig:
+    """
+    Copy the MQTT config with the gstwebrtcapp topics moved under the given namespace, which is inserted after
+    the root level of the topics (e.g., gstwebrtcapp/stats -> gstwebrtcapp/feed_1/stats), so that several feeds
+    could share one broker or hub. The per-topic queue and batch configs are moved together with their topics.
+
+    :param config: MqttConfig of a feed
+    :param namespace: namespace of the feed (e.g., its name)
+    :return: new MqttConfig with the namespaced topics
+    """
+    namespace = namespace.strip('/')
+    topics = {f.name: getattr(config.topics, f.name) for f in fields(MqttGstWebrtcAppTopics)}
+    renamed = {}
+    for topic in topics.values():
+        root, *rest = topic.split("/", 1)
+        renamed[topic] = "/".join([root, namespace, *rest])
+    return dataclasses.replace(
+        config,
+        topics=MqttGstWebrtcAppTopics(**{name: renamed[topic] for name, topic in topics.items()}),
+        queues={renamed.get(topic, topic): queue for topic, queue in config.queues.items()},
+        batches={renamed.get(topic, topic): batch for topic, batch in config.batches.items()},
+    )
 
 
 @dataclass
 class MqttMessage:
-    timestamp: str
+    timestamp: str | float  # float (epoch seconds) for the messages delivered in batches
     id: str
-    msg: str
+    msg: Any
     topic: str
 
 
+MQTT_TIMESTAMP_FORMAT = "%Y-%m-%d-%H_%M_%S_%f"
+
+
+def format_mqtt_timestamp(timestamp: str | float) -> str:
+    # the same string format for both immediate and batched (epoch) timestamps
+    if isinstance(timestamp, str):
+        return timestamp
+    return datetime.fromtimestamp(timestamp).strftime(MQTT_TIMESTAMP_FORMAT)[:-3]
+
+
+def parse_mqtt_timestamp(timestamp: str | float) -> float:
+    # epoch seconds for both immediate (string) and batched (epoch) timestamps
+    if isinstance(timestamp, str):
+        return datetime.strptime(timestamp, MQTT_TIMESTAMP_FORMAT).timestamp()
+    return float(timestamp)
+
+
 class MqttClient(metaclass=ABCMeta):
     def __init__(
         self,
@@ -59,31 +145,70 @@ class MqttClient(metaclass=ABCMeta):
         self.is_tls = config.is_tls
         self.topics = config.topics
         self.external_topics = config.external_topics
+        self.codec = get_mqtt_codec(config.codec)
+        self.config = config
 
         self.message_queue = None
         self.client = None
+        self.hub = None
+        # False if the paho client (and its network loop) is borrowed from another MqttClient, e.g., within MqttPair
+        self.is_client_owner = True
 
         self.is_running = False
+        self._stop_event = threading.Event()
 
-    def run(self) -> None:
-        # this method should be called in a separate thread/process
-        self._spawn()
-        self.client.loop_start()
+    def start(self, client: mqtt.Client | None = None) -> bool:
+        """
+        Connect to the broker and start the paho network loop in its own thread. Returns once connected.
+
+        :param client: already started paho client to share the connection and the network loop with. Nullable
+        :return: True if the client is connected, False otherwise
+        """
+        if client is None and (self.config.is_shared_connection or self.config.transport != "mqtt"):
+            self.is_client_owner = False
+            self.hub = acquire_message_hub(self.config)
+            if self.hub is None:
+                LOGGER.error(f"ERROR: MQTT client {self.id} has not been started, {self.config.transport} is unavailable")
+                return False
+            # paho client of the shared connection, None for the local transport
+            self.client = self.hub.client
+            self.is_running = True
+            LOGGER.info(f"OK: MQTT client {self.id} has been started")
+            return True
+        elif client is None:
+            self.is_client_owner = True
+            self._spawn()
+            self.client.loop_start()
+        else:
+            self.is_client_owner = False
+            self.client = client
         try:
             wait_for_condition(lambda: self.client.is_connected(), 10)
             LOGGER.info(f"OK: MQTT client {self.id} has been started")
         except TimeoutError:
             LOGGER.error(f"ERROR: MQTT client {self.id} has not been started")
-            return
+            return False
         self.is_running = True
-        while self.is_running:
-            time.sleep(0.1)
+        return True
+
+    def run(self) -> None:
+        # blocks the calling thread until stop() is called, prefer non-blocking start() if no thread is needed
+        self._stop_event.clear()
+        if self.start():
+            self._stop_event.wait()
 
     def stop(self) -> None:
         self.is_running = False
-        self.client.loop_stop()
-        if self.client.is_connected():
-            _ = self.client.disconnect()
+        self._stop_event.set()
+        if self.hub is not None:
+            self.hub.release()
+            self.hub = None
+        elif self.client is None:
+            return
+        elif self.is_client_owner:
+            self.client.loop_stop()
+            if self.client.is_connected():
+                _ = self.client.disconnect()
         LOGGER.info(f"INFO: MQTT client {self.id} has been stopped")
 
     def _spawn(self) -> None:
@@ -101,22 +226,77 @@ class MqttPublisher(MqttClient):
         config: MqttConfig = MqttConfig(""),
     ) -> None:
         super().__init__(config)
+        self.batch_configs = config.batches
+        self._batches: Dict[str, List[List[Any]]] = {}
+        self._batch_timers: Dict[str, threading.Timer] = {}
+        self._batch_lock = threading.Lock()
 
-    def publish(self, topic: str, msg: str, id: str = "") -> None:
+    def publish(self, topic: str, msg: Any, id: str = "") -> None:
         if not self.is_running:
             wait_for_condition(lambda: self.is_running, 10)
-        self.client.publish(
+        batch_config = self.batch_configs.get(topic, None)
+        if batch_config is not None and self.config.transport == "mqtt":
+            self._add_to_batch(topic, msg, id, batch_config)
+            return
+        self._publish_envelope(
             topic,
-            json.dumps(
-                {
-                    'timestamp': datetime.now().strftime("%Y-%m-%d-%H_%M_%S_%f")[:-3],
-                    'id': id or self.id,
-                    'msg': msg,
-                }
-            ),
+            {
+                'timestamp': datetime.now().strftime(MQTT_TIMESTAMP_FORMAT)[:-3],
+                'id': id or self.id,
+                'msg': msg,
+            },
         )
         LOGGER.debug(f"INFO: MQTT publisher {self.id} has published message: {msg} to {topic}")
 
+    def flush(self, topic: str | None = None) -> None:
+        """
+        Publish the pending batches immediately.
+
+        :param topic: topic to flush. If None, all topics are flushed
+        """
+        topics = [topic] if topic is not None else list(self._batches.keys())
+        for t in topics:
+            with self._batch_lock:
+                batch = self._batches.pop(t, None)
+                timer = self._batch_timers.pop(t, None)
+            if timer is not None:
+                timer.cancel()
+            if batch:
+                # one frame with several messages, the subscribers unpack them transparently
+                self._publish_envelope(
+                    t,
+                    {'timestamp': time.time(), 'id': self.id, 'msg': batch, 'batch': True},
+                    self.batch_configs[t].qos,
+                )
+                LOGGER.debug(f"INFO: MQTT publisher {self.id} has published a batch of {len(batch)} messages to {t}")
+
+    def stop(self) -> None:
+        if self.is_running:
+            self.flush()
+        super().stop()
+
+    def _add_to_batch(self, topic: str, msg: Any, id: str, batch_config: MqttBatchConfig) -> None:
+        item = [time.time(), id or self.id, msg]
+        with self._batch_lock:
+            batch = self._batches.setdefault(topic, [])
+            if batch_config.is_coalesce:
+                batch.clear()
+            batch.append(item)
+            is_full = len(batch) >= batch_config.max_size
+            if not is_full and topic not in self._batch_timers:
+                timer = threading.Timer(batch_config.max_delay, self.flush, args=(topic,))
+                timer.daemon = True
+                self._batch_timers[topic] = timer
+                timer.start()
+        if is_full:
+            self.flush(topic)
+
+    def _publish_envelope(self, topic: str, envelope: Dict[str, Any], qos: int = 0) -> None:
+        if self.hub is not None:
+            self.hub.publish(topic, envelope, self.codec, qos)
+        else:
+            self.client.publish(topic, self.codec.encode(envelope), qos=qos)
+
 
 class MqttSubscriber(MqttClient):
     def __init__(
@@ -124,53 +304,127 @@ class MqttSubscriber(MqttClient):
         config: MqttConfig = MqttConfig(""),
     ) -> None:
         super().__init__(config)
-        self.message_queues: Dict[str, asyncio.Queue] = {}
+        self.default_queue_config = config.default_queue
+        self.queue_configs = config.queues
+        self.message_queues: Dict[str, MqttMessageQueue] = {}
         for f in fields(self.topics):
-            self.message_queues[getattr(self.topics, f.name)] = asyncio.Queue()
+            self.message_queues[getattr(self.topics, f.name)] = self._make_queue(getattr(self.topics, f.name))
         if self.external_topics:
             for f in fields(self.external_topics):
                 ext_topic = getattr(self.external_topics, f.name)
                 if ext_topic:
-                    self.message_queues[ext_topic] = asyncio.Queue()
+                    self.message_queues[ext_topic] = self._make_queue(ext_topic)
 
     def on_message(self, _, __, msg) -> None:
-        payload = json.loads(msg.payload.decode('utf8'))
-        mqtt_message = MqttMessage(
-            timestamp=payload['timestamp'],
-            id=payload['id'],
-            msg=payload['msg'],
-            topic=msg.topic,
-        )
-        if msg.topic not in self.message_queues:
-            self.message_queues[msg.topic] = asyncio.Queue()
-        self.message_queues[msg.topic].put_nowait(mqtt_message)
+        self.put_message(msg.topic, decode_mqtt_payload(msg.payload, self.codec))
+
+    def put_message(self, topic: str, payload: Dict[str, Any]) -> None:
+        # called in the paho network thread, the queues deliver the message to the consumers in a thread-safe manner
+        queue = self.message_queues.get(topic, None)
+        if queue is None:
+            queue = self.message_queues.setdefault(topic, self._make_queue(topic))
+        if payload.get('batch', False):
+            for timestamp, id, msg in payload['msg']:
+                queue.put(MqttMessage(timestamp=timestamp, id=id, msg=msg, topic=topic))
+        else:
+            queue.put(
+                MqttMessage(
+                    timestamp=payload['timestamp'],
+                    id=payload['id'],
+                    msg=payload['msg'],
+                    topic=topic,
+                )
+            )
         LOGGER.debug(f"Received message: {payload}")
 
     def subscribe(self, topics: List[str], qos: int = 1) -> None:
         if not self.is_running:
             wait_for_condition(lambda: self.is_running, 10)
         for topic in topics:
-            self.client.subscribe(topic, qos=qos)
-            self.client.on_message = self.on_message
+            if self.hub is not None:
+                self.hub.subscribe(topic, self, qos=qos)
+            else:
+                self.client.subscribe(topic, qos=qos)
+                self.client.on_message = self.on_message
             LOGGER.info(f"OK: MQTT subscriber {self.id} has successfully subscribed to {topic}")
 
-    def get_message(self, topic: str) -> MqttMessage | None:
+    def get_message(self, topic: str, timeout: float = 0.0) -> MqttMessage | None:
+        """
+        Get the next message of the topic. Could be called from any thread.
+
+        :param topic: topic name
+        :param timeout: time in seconds to block waiting for a message. 0 means no waiting, None means waiting forever
+        :return: message or None if there is no message after the timeout or the subscriber has been stopped
+        """
         queue = self.message_queues.get(topic, None)
         if queue is None:
             LOGGER.error(f"ERROR: No message queue for topic {topic}")
-        if self.is_running and not queue.empty():
-            return queue.get_nowait()
-        return None
+            return None
+        if not self.is_running:
+            return None
+        return queue.get(timeout)
+
+    async def async_get_message(self, topic: str) -> MqttMessage:
+        queue = self.message_queues.get(topic, None)
+        if queue is None:
+            queue = self.message_queues.setdefault(topic, self._make_queue(topic))
+        return await queue.async_get()
+
+    def get_dropped_messages(self) -> Dict[str, int]:
+        return {topic: queue.dropped for topic, queue in self.message_queues.items()}
+
+    def _make_queue(self, topic: str) -> MqttMessageQueue:
+        queue_config = self.queue_configs.get(topic, self.default_queue_config)
+        return MqttMessageQueue(queue_config.maxsize, queue_config.policy, topic)
 
     def clean_message_queue(self, topic: str) -> None:
         queue = self.message_queues.get(topic, None)
         if queue is None:
             LOGGER.error(f"ERROR: No message queue for topic {topic}")
-        while not queue.empty():
-            _ = queue.get_nowait()
+            return
+        queue.clear()
+
+    def stop(self) -> None:
+        if self.hub is not None:
+            self.hub.unsubscribe_all(self)
+        super().stop()
+        # wake up the consumers blocked in get_message
+        for queue in list(self.message_queues.values()):
+            queue.interrupt()
 
 
 @dataclass
 class MqttPair:
     publisher: MqttPublisher
     subscriber: MqttSubscriber
+
+    def start(self) -> bool:
+        # both clients share one connection and one paho network loop (of the hub if shared), no extra threads are needed
+        if not self.subscriber.start():
+            return False
+        return self.publisher.start(self.subscriber.client if self.subscriber.hub is None else None)
+
+    def stop(self) -> None:
+        # the publisher borrows the subscriber's client, so it is stopped first
+        self.publisher.stop()
+        self.subscriber.stop()
+
+
+def make_local_mqtt_pair(namespace: str, topics: List[str] | None = None) -> MqttPair:
+    """
+    Start a publisher/subscriber pair on the in-process local transport with the topics under gstwebrtcapp/<namespace>/.
+    Used by the in-process stats sources (e.g., simulated or replayed feeds) to deliver the messages to the MDPs.
+
+    :param namespace: namespace of the topics, should be unique per source
+    :param topics: topics to subscribe to. If None, all gstwebrtcapp topics are subscribed
+    :return: started MqttPair
+    """
+    config = make_namespaced_mqtt_config(dataclasses.replace(MqttConfig(), transport="local"), namespace)
+    mqtts = MqttPair(publisher=MqttPublisher(config), subscriber=MqttSubscriber(config))
+    if not mqtts.start():
+        raise GSTWEBRTCAPP_EXCEPTION(f"Failed to start the local MQTT transport for {namespace}")
+    for f in fields(MqttGstWebrtcAppTopics):
+        topic = getattr(config.topics, f.name)
+        if topics is None or f.name in topics or topic in topics:
+            mqtts.subscriber.subscribe([topic])
+    return mqtts
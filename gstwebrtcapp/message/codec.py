@@ -0,0 +1,98 @@
+"""
+codec.py
+
+Description: Codecs that encode the MQTT message envelope ({timestamp, id, msg}) to the payload and back.
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+from abc import ABCMeta, abstractmethod
+import json
+from typing import Any, Dict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from utils.base import GSTWEBRTCAPP_EXCEPTION
+
+
+class MqttCodec(metaclass=ABCMeta):
+    """
+    Encodes the message envelope ({timestamp, id, msg}) to the MQTT payload and back.
+    The msg is a native object (dict, list, number, str) and is encoded only once together with the envelope.
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    def encode(self, envelope: Dict[str, Any]) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        pass
+
+
+class JsonMqttCodec(MqttCodec):
+    name = "json"
+
+    def encode(self, envelope: Dict[str, Any]) -> bytes:
+        return json.dumps(envelope, separators=(',', ':')).encode('utf8')
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload.decode('utf8'))
+
+
+class MsgpackMqttCodec(MqttCodec):
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise GSTWEBRTCAPP_EXCEPTION("msgpack codec is requested but msgpack is not installed")
+
+    def encode(self, envelope: Dict[str, Any]) -> bytes:
+        return msgpack.packb(envelope, use_bin_type=True)
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(payload, raw=False)
+
+
+MQTT_CODECS = {
+    JsonMqttCodec.name: JsonMqttCodec,
+    MsgpackMqttCodec.name: MsgpackMqttCodec,
+}
+
+
+def get_mqtt_codec(name: str) -> MqttCodec:
+    codec_class = MQTT_CODECS.get(name, None)
+    if codec_class is None:
+        raise GSTWEBRTCAPP_EXCEPTION(f"Unknown MQTT codec: {name}, available codecs: {list(MQTT_CODECS.keys())}")
+    return codec_class()
+
+
+def decode_mqtt_payload(payload: bytes, codec: MqttCodec | None = None) -> Dict[str, Any]:
+    """
+    Decode the MQTT payload with automatic detection of the codec: a JSON envelope always starts with '{',
+    a msgpack envelope (a map) never does. Hence, the subscribers can read the messages from the publishers with any codec.
+
+    :param payload: raw MQTT payload
+    :param codec: codec to use for non-JSON payloads. If None, msgpack is used
+    :return: decoded envelope
+    """
+    if payload[:1] == b'{':
+        return json.loads(payload.decode('utf8'))
+    if codec is None or isinstance(codec, JsonMqttCodec):
+        codec = get_mqtt_codec(MsgpackMqttCodec.name)
+    return codec.decode(payload)
+
+
+def unpack_mqtt_msg(msg: Any) -> Any:
+    # legacy publishers (and external tools) send the msg as a JSON string, the codecs deliver it as it is
+    return json.loads(msg) if isinstance(msg, (str, bytes)) else msg
@@ -0,0 +1,223 @@
+"""
+hub.py
+
+Description: Process-wide message hubs (transports) that fan out the messages to all in-process subscribers by topic.
+MqttHub keeps a single broker connection per broker and decodes each message only once. LocalHub passes the messages
+by reference between the publishers and subscribers living in the same process (no broker, no encoding).
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+from abc import ABCMeta, abstractmethod
+import secrets
+import threading
+import paho.mqtt.client as mqtt
+from typing import Any, Dict, List
+
+from message.codec import MqttCodec, decode_mqtt_payload
+from utils.base import LOGGER, wait_for_condition
+
+
+class MessageHub(metaclass=ABCMeta):
+    """
+    Shared transport. Use acquire_message_hub(config) to get the hub for the given MqttConfig and release() once
+    it is not needed anymore. The subscriptions are reference-counted: a topic is subscribed on the transport
+    by the first in-process subscriber and unsubscribed after the last one leaves.
+
+    Subscribers should implement put_message(topic: str, envelope: Dict[str, Any]).
+    """
+
+    _hubs: Dict[tuple, 'MessageHub'] = {}
+    _hubs_lock = threading.Lock()
+
+    def __init__(self, config: Any) -> None:
+        self.broker_host = config.broker_host
+        self.broker_port = config.broker_port
+        self.keepalive = config.keepalive
+        self.username = config.username
+        self.password = config.password
+        self.is_tls = config.is_tls
+
+        self.id = "hub_" + secrets.token_hex(4)
+        self.client = None
+        self.refs = 0
+        self.subscriptions: Dict[str, List[Any]] = {}
+        self.qos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def acquire(cls, config: Any) -> 'MessageHub | None':
+        key = cls._make_key(config)
+        with cls._hubs_lock:
+            hub = MessageHub._hubs.get(key, None)
+            if hub is None:
+                hub = cls(config)
+                if not hub._start():
+                    return None
+                MessageHub._hubs[key] = hub
+            hub.refs += 1
+            return hub
+
+    def release(self) -> None:
+        with self._hubs_lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            MessageHub._hubs.pop(self._make_key(self), None)
+        self._stop()
+
+    def subscribe(self, topic: str, subscriber: Any, qos: int = 1) -> None:
+        with self._lock:
+            subscribers = self.subscriptions.setdefault(topic, [])
+            if subscriber in subscribers:
+                return
+            subscribers.append(subscriber)
+            is_first = len(subscribers) == 1
+            if is_first:
+                self.qos[topic] = qos
+        if is_first:
+            self._subscribe_topic(topic, qos)
+            LOGGER.info(f"OK: {self.__class__.__name__} {self.id} has subscribed to {topic}")
+
+    def unsubscribe(self, topic: str, subscriber: Any) -> None:
+        with self._lock:
+            subscribers = self.subscriptions.get(topic, [])
+            if subscriber not in subscribers:
+                return
+            subscribers.remove(subscriber)
+            is_last = len(subscribers) == 0
+            if is_last:
+                del self.subscriptions[topic]
+                del self.qos[topic]
+        if is_last:
+            self._unsubscribe_topic(topic)
+            LOGGER.info(f"INFO: {self.__class__.__name__} {self.id} has unsubscribed from {topic}")
+
+    def unsubscribe_all(self, subscriber: Any) -> None:
+        with self._lock:
+            topics = [topic for topic, subscribers in self.subscriptions.items() if subscriber in subscribers]
+        for topic in topics:
+            self.unsubscribe(topic, subscriber)
+
+    @abstractmethod
+    def publish(self, topic: str, envelope: Dict[str, Any], codec: MqttCodec, qos: int = 0) -> None:
+        pass
+
+    def _get_subscribers(self, topic: str) -> List[Any]:
+        with self._lock:
+            subscribers = list(self.subscriptions.get(topic, []))
+            # wildcard subscriptions
+            for sub_topic, topic_subscribers in self.subscriptions.items():
+                if ('#' in sub_topic or '+' in sub_topic) and mqtt.topic_matches_sub(sub_topic, topic):
+                    subscribers.extend(s for s in topic_subscribers if s not in subscribers)
+        return subscribers
+
+    def _subscribe_topic(self, topic: str, qos: int) -> None:
+        pass
+
+    def _unsubscribe_topic(self, topic: str) -> None:
+        pass
+
+    def _start(self) -> bool:
+        return True
+
+    def _stop(self) -> None:
+        LOGGER.info(f"INFO: {self.__class__.__name__} {self.id} has been stopped")
+
+    @classmethod
+    def _make_key(cls, config: Any) -> tuple:
+        return (cls.__name__, config.broker_host, config.broker_port, config.username, config.is_tls)
+
+
+class MqttHub(MessageHub):
+    """
+    Shared MQTT connection to the broker: one paho client and one network loop for the whole process.
+    """
+
+    def publish(self, topic: str, envelope: Dict[str, Any], codec: MqttCodec, qos: int = 0) -> None:
+        self.client.publish(topic, codec.encode(envelope), qos=qos)
+
+    def on_message(self, _, __, msg) -> None:
+        subscribers = self._get_subscribers(msg.topic)
+        if not subscribers:
+            return
+        envelope = decode_mqtt_payload(msg.payload)
+        for subscriber in subscribers:
+            subscriber.put_message(msg.topic, envelope)
+
+    def on_connect(self, _, __, ___, rc) -> None:
+        # restore the subscriptions after reconnection
+        if rc == 0:
+            with self._lock:
+                topics = list(self.qos.items())
+            for topic, qos in topics:
+                self.client.subscribe(topic, qos=qos)
+
+    def _subscribe_topic(self, topic: str, qos: int) -> None:
+        self.client.subscribe(topic, qos=qos)
+
+    def _unsubscribe_topic(self, topic: str) -> None:
+        if self.client.is_connected():
+            self.client.unsubscribe(topic)
+
+    def _start(self) -> bool:
+        self.client = mqtt.Client(self.id)
+        if self.username and self.password:
+            self.client.username_pw_set(self.username, self.password)
+        if self.is_tls:
+            self.client.tls_set()
+        self.client.on_message = self.on_message
+        self.client.on_connect = self.on_connect
+        _ = self.client.connect(self.broker_host, self.broker_port, self.keepalive)
+        self.client.loop_start()
+        try:
+            wait_for_condition(lambda: self.client.is_connected(), 10)
+            LOGGER.info(f"OK: MQTT hub {self.id} has been connected to {self.broker_host}:{self.broker_port}")
+            return True
+        except TimeoutError:
+            LOGGER.error(f"ERROR: MQTT hub {self.id} has not been connected to {self.broker_host}:{self.broker_port}")
+            self.client.loop_stop()
+            return False
+
+    def _stop(self) -> None:
+        self.client.loop_stop()
+        if self.client.is_connected():
+            _ = self.client.disconnect()
+        super()._stop()
+
+
+class LocalHub(MessageHub):
+    """
+    In-process transport for the co-located publishers and subscribers. The envelopes (and the msg objects inside)
+    are passed by reference to the subscribers' bounded queues in the publisher's thread w/o any encoding.
+    NOTE: all subscribers of a topic get the same msg object, so the consumers must not modify it.
+    """
+
+    def publish(self, topic: str, envelope: Dict[str, Any], _: MqttCodec, __: int = 0) -> None:
+        for subscriber in self._get_subscribers(topic):
+            subscriber.put_message(topic, envelope)
+
+
+MESSAGE_HUBS = {
+    "mqtt": MqttHub,
+    "local": LocalHub,
+}
+
+
+def acquire_message_hub(config: Any) -> MessageHub | None:
+    """
+    Get the process-wide hub for the transport given by config.transport. Release it with hub.release().
+
+    :param config: MqttConfig
+    :return: hub or None if the hub could not be started (e.g., no connection to the broker)
+    """
+    hub_class = MESSAGE_HUBS.get(config.transport, None)
+    if hub_class is None:
+        LOGGER.error(f"ERROR: Unknown transport: {config.transport}, available transports: {list(MESSAGE_HUBS.keys())}")
+        return None
+    return hub_class.acquire(config)
@@ -0,0 +1,144 @@
+"""
+queue.py
+
+Description: A thread-safe message queue that bridges the paho network thread with the consumers running either
+in other threads (blocking get with timeout) or in asyncio event loops (awaitable get).
+
+Author:
+    - Nikita Smirnov <nsm@informatik.uni-kiel.de>
+
+License:
+    GPLv3 License
+
+"""
+
+import asyncio
+import collections
+import threading
+import time
+from typing import Any
+
+from utils.base import LOGGER, GSTWEBRTCAPP_EXCEPTION
+
+
+# overflow policies of the bounded queues
+QUEUE_POLICY_DROP_OLDEST = "drop_oldest"
+QUEUE_POLICY_DROP_NEWEST = "drop_newest"
+QUEUE_POLICY_CONFLATE = "conflate"  # keep only the latest value
+QUEUE_POLICIES = [QUEUE_POLICY_DROP_OLDEST, QUEUE_POLICY_DROP_NEWEST, QUEUE_POLICY_CONFLATE]
+
+
+class MqttMessageQueue:
+    """
+    FIFO queue that could be safely filled from one thread and consumed from the others.
+    The threads block on a condition variable, the coroutines are woken up via loop.call_soon_threadsafe.
+
+    :param int maxsize: The maximal number of the queued messages. 0 means unbounded. Ignored for the conflate policy
+    :param str policy: The overflow policy. One of 'drop_oldest', 'drop_newest', 'conflate'
+    :param str name: The name of the queue (e.g., a topic) used in logs
+    """
+
+    def __init__(self, maxsize: int = 0, policy: str = QUEUE_POLICY_DROP_OLDEST, name: str = "") -> None:
+        if policy not in QUEUE_POLICIES:
+            raise GSTWEBRTCAPP_EXCEPTION(f"Unknown queue overflow policy: {policy}, available policies: {QUEUE_POLICIES}")
+        self.maxsize = 1 if policy == QUEUE_POLICY_CONFLATE else max(0, maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._async_waiters = collections.deque()
+        self._interrupts = 0
+
+    def put(self, item: Any) -> None:
+        with self._cond:
+            if self.maxsize > 0 and len(self._queue) >= self.maxsize:
+                self._on_overflow()
+                if self.policy == QUEUE_POLICY_DROP_NEWEST:
+                    return
+                self._queue.popleft()
+            self._queue.append(item)
+            self._cond.notify()
+            waiters = list(self._async_waiters)
+            self._async_waiters.clear()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_future_result, future)
+            except RuntimeError:
+                # the loop is closed
+                pass
+
+    # asyncio.Queue compatible alias
+    put_nowait = put
+
+    def get(self, timeout: float | None = None) -> Any | None:
+        """
+        Get the first item from the queue.
+
+        :param timeout: time in seconds to block waiting for an item. 0 means no waiting, None means waiting forever
+        :return: the item or None if the queue is empty after the timeout or the waiters have been interrupted
+        """
+        with self._cond:
+            if not self._queue and timeout != 0:
+                interrupts = self._interrupts
+                deadline = time.time() + timeout if timeout is not None else None
+                while not self._queue and interrupts == self._interrupts:
+                    remaining = deadline - time.time() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            return self._queue.popleft() if self._queue else None
+
+    def get_nowait(self) -> Any | None:
+        return self.get(0)
+
+    async def async_get(self) -> Any:
+        """
+        Wait for the first item in the queue within the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._queue:
+                    return self._queue.popleft()
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                await future
+            finally:
+                with self._cond:
+                    try:
+                        self._async_waiters.remove((loop, future))
+                    except ValueError:
+                        pass
+
+    def interrupt(self) -> None:
+        # wake up all threads blocked in get(), they return None if the queue is empty
+        with self._cond:
+            self._interrupts += 1
+            self._cond.notify_all()
+
+    def _on_overflow(self) -> None:
+        self.dropped += 1
+        # conflation is the expected behavior, so warn only for the real overflows and not on each of them
+        if self.policy != QUEUE_POLICY_CONFLATE and self.dropped % 1000 == 1:
+            LOGGER.warning(
+                f"WARNING: MqttMessageQueue {self.name} is full ({self.maxsize} messages), {self.dropped} messages"
+                f" have been dropped so far by the {self.policy} policy"
+            )
+
+    def clear(self) -> None:
+        with self._cond:
+            self._queue.clear()
+
+    def empty(self) -> bool:
+        return not self._queue
+
+    def qsize(self) -> int:
+        return len(self._queue)
+
+
+def _set_future_result(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
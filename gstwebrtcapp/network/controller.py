@@ -8,8 +8,8 @@ import shlex
 import random
 from typing import List, Tuple
 
-from network.trace import NetworkTrace
-from utils.base import LOGGER, extract_network_traces_from_csv
+from network.trace import load_network_traces
+from utils.base import LOGGER
 
 
 class NetworkScenario(enum.Enum):
@@ -94,19 +94,7 @@ class NetworkController:
         LOGGER.info(f"NetworkController: {count} rules with weights {weights} generated")
 
     def generate_rules_from_traces(self, trace_folder: str, is_curriculum_learning: bool = False) -> None:
-        network_traces: List[NetworkTrace] = []
-        for filename in os.listdir(trace_folder):
-            if filename.endswith('.csv'):
-                filepath = os.path.join(trace_folder, filename)
-                bw_values, ooc_rate = extract_network_traces_from_csv(filepath)
-                size = len(bw_values)
-                av_value = sum(bw_values) / size if size > 0 else 0
-                network_trace = NetworkTrace(size=size, av_value=av_value, ooc_rate=ooc_rate, values=bw_values)
-                network_traces.append(network_trace)
-
-        if is_curriculum_learning:
-            # sort by complexity (ooc_rate is when the bw lower than 1 mbps)
-            network_traces = sorted(network_traces, key=lambda x: x.ooc_rate)
+        network_traces = load_network_traces(trace_folder, is_curriculum_learning)
 
         self.rules = []
         for network_trace in network_traces:
@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+import math
+import numpy as np
+from typing import List
+
+from network.trace import NetworkTrace
+from utils.gst import DEFAULT_GCC_SETTINGS, GstWebRTCStatsType, StatsSnapshot
+
+
+@dataclass
+class SimulatedLinkConfig:
+    """
+    A data class to hold the params of the simulated link.
+
+    :param float base_rtt: The propagation round-trip time in seconds
+    :param float max_queue_delay: The size of the bottleneck queue in seconds at the current bandwidth (tail drop)
+    :param float loss_rate: The random (non-congestion) packet loss rate
+    :param float jitter: The std of the delay variation in seconds
+    :param float encoder_response_time: The time constant in seconds of the encoder rate adaptation to the target
+    :param float encoder_rate_noise: The relative std of the encoder output rate (frame sizes variation)
+    :param float initial_bitrate: The initial target bitrate of the encoder in kbps
+    :param float gcc_overuse_delay: The queueing delay in seconds above which the GCC estimate is decreased
+    :param float pli_loss_rate: The loss rate within a stats interval above which the receiver sends a PLI
+    :param int packet_size: The average RTP packet size in bytes
+    :param int clock_rate: The RTP clock rate
+    """
+
+    base_rtt: float = 0.04
+    max_queue_delay: float = 0.5
+    loss_rate: float = 0.001
+    jitter: float = 0.002
+    encoder_response_time: float = 0.5
+    encoder_rate_noise: float = 0.1
+    initial_bitrate: float = 1000.0
+    gcc_overuse_delay: float = 0.025
+    pli_loss_rate: float = 0.1
+    packet_size: int = 1200
+    clock_rate: int = 90000
+
+
+class SimulatedLink:
+    '''
+    Trace-driven model of a video stream over a bottleneck link. The bandwidth follows the traces (one value per
+    second in mbps, e.g. loaded with load_network_traces), the sender is an encoder that follows the target bitrate
+    with a first-order response, and the bottleneck is a fluid tail-drop queue. Each advance() returns the webrtc
+    stats of the stream in the same shape as delivered by GStreamer (cumulative counters, NTP RTT, jitter in clock
+    units) together with a GCC-like bandwidth estimate.
+
+    :param traces: The bandwidth traces, played one after another in a loop
+    :param config: The link params
+    :param rng: NumPy random generator, the simulation is reproducible for the same seed and actions
+    '''
+
+    def __init__(
+        self,
+        traces: List[NetworkTrace],
+        config: SimulatedLinkConfig = SimulatedLinkConfig(),
+        rng: np.random.Generator | None = None,
+    ) -> None:
+        self.traces = [trace for trace in traces if trace.values]
+        if not self.traces:
+            raise ValueError("SimulatedLink: no bandwidth values in the given traces")
+        self.config = config
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.ssrc = int(self.rng.integers(1, 2**32))
+
+        # cumulative counters keep growing over the link resets as in a live session
+        self.packets_sent = 0.0
+        self.packets_received = 0.0
+        self.packets_lost = 0
+        self.bytes_sent = 0.0
+        self.bytes_received = 0.0
+        self.nack_count = 0
+        self.pli_count = 0
+        self.time = 0.0
+        self.reset()
+
+    def reset(self, rng: np.random.Generator | None = None) -> None:
+        if rng is not None:
+            self.rng = rng
+        self.trace_index = 0
+        self.trace_time = 0.0
+        self.queue_bits = 0.0
+        self.target_bitrate = self.config.initial_bitrate * 1000
+        self.encoder_bitrate = self.target_bitrate
+        self.jitter = 0.0
+        self.last_delay = self.config.base_rtt / 2
+        self.gcc_estimate = float(DEFAULT_GCC_SETTINGS["min-bitrate"])
+
+    def set_target_bitrate(self, bitrate: float) -> None:
+        # in bps
+        self.target_bitrate = max(0.0, bitrate)
+
+    def get_bandwidth(self) -> float:
+        # in bps, the same lower bound as in NetworkController.generate_rules_from_traces
+        values = self.traces[self.trace_index].values
+        return max(values[min(int(self.trace_time), len(values) - 1)], 8e-6) * 1e6
+
+    def advance(self, dt: float) -> StatsSnapshot:
+        """
+        Advance the simulation for dt seconds.
+
+        :param dt: time in seconds (the stats interval)
+        :return: stats at the end of the interval
+        """
+        cfg = self.config
+        bandwidth = self.get_bandwidth()
+
+        # encoder: first-order response to the target bitrate with the frame sizes noise
+        response = 1 - math.exp(-dt / cfg.encoder_response_time)
+        self.encoder_bitrate += (self.target_bitrate - self.encoder_bitrate) * response
+        send_rate = max(0.0, self.encoder_bitrate * (1 + cfg.encoder_rate_noise * self.rng.standard_normal()))
+        sent_bits = send_rate * dt
+
+        # bottleneck: fluid queue drained at the bandwidth, the overflow is dropped
+        queue_bits = self.queue_bits + sent_bits
+        delivered_bits = min(queue_bits, bandwidth * dt)
+        queue_bits -= delivered_bits
+        dropped_bits = max(0.0, queue_bits - bandwidth * cfg.max_queue_delay)
+        self.queue_bits = queue_bits - dropped_bits
+        queue_delay = self.queue_bits / bandwidth
+
+        # packets: congestion drops and random losses of the delivered packets
+        bits_per_packet = cfg.packet_size * 8
+        sent_packets = sent_bits / bits_per_packet
+        delivered_packets = delivered_bits / bits_per_packet
+        random_lost = int(self.rng.binomial(int(delivered_packets), cfg.loss_rate)) if delivered_packets >= 1 else 0
+        lost = int(round(dropped_bits / bits_per_packet)) + random_lost
+        self.packets_sent += sent_packets
+        self.packets_received += max(0.0, delivered_packets - random_lost)
+        self.packets_lost += lost
+        self.bytes_sent += sent_bits / 8
+        self.bytes_received += max(0.0, delivered_bits - random_lost * bits_per_packet) / 8
+        self.nack_count += lost
+        if sent_packets > 0 and lost / sent_packets > cfg.pli_loss_rate:
+            self.pli_count += 1
+
+        # delays: rtt = base rtt + queueing delay (+ noise), jitter is smoothed as in RFC 3550
+        delay = cfg.base_rtt / 2 + queue_delay + abs(cfg.jitter * self.rng.standard_normal())
+        self.jitter += (abs(delay - self.last_delay) - self.jitter) / 16
+        self.last_delay = delay
+        rtt = cfg.base_rtt + queue_delay + abs(cfg.jitter * self.rng.standard_normal())
+
+        # GCC-like estimate: decrease on delay overuse or heavy loss, otherwise increase by ~8% per second
+        recv_rate = delivered_bits / dt
+        loss = lost / sent_packets if sent_packets > 0 else 0.0
+        if queue_delay > cfg.gcc_overuse_delay:
+            self.gcc_estimate = min(self.gcc_estimate, 0.85 * recv_rate)
+        elif loss > 0.1:
+            self.gcc_estimate *= 1 - 0.5 * loss
+        else:
+            self.gcc_estimate *= 1.08**dt
+        self.gcc_estimate = min(
+            max(self.gcc_estimate, DEFAULT_GCC_SETTINGS["min-bitrate"]), DEFAULT_GCC_SETTINGS["max-bitrate"]
+        )
+
+        self.time += dt
+        self.trace_time += dt
+        if self.trace_time >= len(self.traces[self.trace_index].values):
+            self.trace_index = (self.trace_index + 1) % len(self.traces)
+            self.trace_time = 0.0
+
+        return self._make_stats(send_rate, recv_rate, rtt)
+
+    def _make_stats(self, send_rate: float, recv_rate: float, rtt: float) -> StatsSnapshot:
+        timestamp = self.time * 1000  # ms
+        ssrc = self.ssrc
+        return StatsSnapshot(
+            {
+                f"{GstWebRTCStatsType.RTP_OUTBOUND_STREAM.value}_{ssrc}": {
+                    "id": f"{GstWebRTCStatsType.RTP_OUTBOUND_STREAM.value}_{ssrc}",
+                    "timestamp": timestamp,
+                    "ssrc": ssrc,
+                    "packets-sent": int(self.packets_sent),
+                    "packets-received": int(self.packets_received),
+                    "bytes-sent": int(self.bytes_sent),
+                    "bytes-received": int(self.bytes_received),
+                    "nack-count": self.nack_count,
+                    "pli-count": self.pli_count,
+                    "clock-rate": self.config.clock_rate,
+                },
+                f"{GstWebRTCStatsType.RTP_INBOUND_STREAM.value}_{ssrc}": {
+                    "id": f"{GstWebRTCStatsType.RTP_INBOUND_STREAM.value}_{ssrc}",
+                    "timestamp": timestamp,
+                    "ssrc": ssrc,
+                    "rb-packetslost": self.packets_lost,
+                    "rb-round-trip": int(rtt * 2**16),  # NTP short format
+                    "rb-jitter": int(self.jitter * self.config.clock_rate),  # clock units
+                },
+                f"{GstWebRTCStatsType.ICE_CANDIDATE_PAIR.value}_sim": {
+                    "id": f"{GstWebRTCStatsType.ICE_CANDIDATE_PAIR.value}_sim",
+                    "timestamp": timestamp,
+                    "bitrate-sent": int(send_rate),
+                    "bitrate-recv": int(recv_rate),
+                },
+            }
+        )
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
+import os
 from typing import List
 
+from utils.base import extract_network_traces_from_csv
+
 
 @dataclass
 class NetworkTrace:
@@ -8,3 +11,27 @@ class NetworkTrace:
     av_value: float
     ooc_rate: float
     values: List[float]
+
+
+def load_network_traces(trace_folder: str, is_curriculum_learning: bool = False) -> List[NetworkTrace]:
+    """
+    Load the bandwidth traces (in mbps, one value per second) from all csv files in the folder.
+
+    :param trace_folder: folder with the csv files, see extract_network_traces_from_csv for the format
+    :param is_curriculum_learning: sort the traces by complexity (the rate of values lower than 1 mbps)
+    :return: list of traces sorted by the filename or by complexity
+    """
+    network_traces: List[NetworkTrace] = []
+    for filename in sorted(os.listdir(trace_folder)):
+        if filename.endswith('.csv'):
+            filepath = os.path.join(trace_folder, filename)
+            bw_values, ooc_rate = extract_network_traces_from_csv(filepath)
+            size = len(bw_values)
+            av_value = sum(bw_values) / size if size > 0 else 0
+            network_trace = NetworkTrace(size=size, av_value=av_value, ooc_rate=ooc_rate, values=bw_values)
+            network_traces.append(network_trace)
+
+    if is_curriculum_learning:
+        # sort by complexity (ooc_rate is when the bw lower than 1 mbps)
+        network_traces = sorted(network_traces, key=lambda x: x.ooc_rate)
+    return network_traces
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import logging
 import numpy as np
 import pandas as pd
@@ -120,6 +121,21 @@ def unscale(scaled_val: int | float, min: int | float, max: int | float) -> int
         return scaled_val * (max - min) + min if min < max else min
 
 
+def scale_array(values: np.ndarray | List[int | float], min: int | float, max: int | float) -> np.ndarray:
+    """
+    Vectorized scale: scale values to 0,1 range
+
+    :param values: values to scale
+    :param min: minimum value
+    :param max: maximum value
+    :return: array of scaled values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if min < max:
+        return np.clip((values - min) / (max - min), 0.0, 1.0)
+    return np.where(values < min, 0.0, np.where(values > max, 1.0, 0.0))
+
+
 # LIST OPERATIONS
 def merge_observations(observations: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, List[Any]]]:
     """
@@ -224,6 +240,83 @@ def slice_list_in_intervals(
     return intervals
 
 
+@functools.lru_cache(maxsize=256)
+def get_interval_bounds(
+    length: int,
+    num_intervals: int,
+    intervals_type: str = 'equidistant',
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the start and end indices of the intervals the same way as slice_list_in_intervals does.
+    The results are cached and read-only.
+
+    :param length: length of the sliced sequence
+    :param num_intervals: number of intervals
+    :param intervals_type: type of intervals. One of 'equidistant', 'sliding'
+    :return: start indices and end indices (exclusive) of the intervals
+    """
+    sizes = np.full(num_intervals, length // num_intervals, dtype=np.int64)
+    sizes[: length % num_intervals] += 1
+    ends = np.cumsum(sizes)
+    starts = np.zeros(num_intervals, dtype=np.int64) if intervals_type == 'sliding' else ends - sizes
+    starts.setflags(write=False)
+    ends.setflags(write=False)
+    return starts, ends
+
+
+def get_interval_averages(
+    values: np.ndarray | List[int | float],
+    num_intervals: int,
+    intervals_type: str = 'equidistant',
+    is_skip_zeroes: bool | np.ndarray = False,
+) -> np.ndarray:
+    """
+    Vectorized equivalent of [get_list_average(i, is_skip_zeroes) for i in slice_list_in_intervals(values, ...)].
+    Several sequences of the same length could be processed at once by passing them as the rows of a 2-D array.
+
+    :param values: 1-D array of values or 2-D array with one sequence per row
+    :param num_intervals: number of intervals
+    :param intervals_type: type of intervals. One of 'equidistant', 'sliding'
+    :param is_skip_zeroes: skip zeroes in the intervals. Could be given per row for 2-D values
+    :return: array of the averages per interval (per row for 2-D values), 0 for the empty intervals
+    """
+    values = np.asarray(values, dtype=np.float64)
+    starts, ends = get_interval_bounds(values.shape[-1], num_intervals, intervals_type)
+    pad = np.zeros(values.shape[:-1] + (1,), dtype=np.float64)
+    if intervals_type == 'sliding':
+        sums = np.cumsum(np.concatenate((pad, values), axis=-1), axis=-1)[..., ends]
+    else:
+        # the padding keeps the last start index valid for the empty intervals, these are masked out below
+        sums = np.add.reduceat(np.concatenate((values, pad), axis=-1), starts, axis=-1)
+    counts = ends - starts
+    if np.any(is_skip_zeroes):
+        nonzero_counts = np.cumsum(np.concatenate((pad, values != 0.0), axis=-1), axis=-1)
+        skip_mask = np.reshape(is_skip_zeroes, (-1, 1)) if np.ndim(is_skip_zeroes) > 0 else is_skip_zeroes
+        counts = np.where(skip_mask, nonzero_counts[..., ends] - nonzero_counts[..., starts], counts)
+    averages = np.zeros_like(sums)
+    np.divide(sums, counts, out=averages, where=counts > 0)
+    return averages
+
+
+def get_safe_ratios(
+    numerators: np.ndarray | List[int | float], denominators: np.ndarray | List[int | float]
+) -> np.ndarray:
+    """
+    Get element-wise ratios of two sequences, 0 where the denominator is not positive.
+    The sequences are truncated to the shortest one as zip does.
+
+    :param numerators: numerators
+    :param denominators: denominators
+    :return: array of ratios
+    """
+    n = min(len(numerators), len(denominators))
+    numerators = np.asarray(numerators[:n], dtype=np.float64)
+    denominators = np.asarray(denominators[:n], dtype=np.float64)
+    ratios = np.zeros(n, dtype=np.float64)
+    np.divide(numerators, denominators, out=ratios, where=denominators > 0)
+    return ratios
+
+
 def get_decay_weights(num_weights: int, start_weight: float = 0.4, ratio: float = 0.5) -> np.ndarray:
     """
     Get decay weights for the given number of weights, start weight and ratio. Sum of weights is 1.
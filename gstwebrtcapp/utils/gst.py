@@ -1,6 +1,8 @@
 from enum import Enum
+import functools
+import numpy as np
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
 
 
 # encoder
@@ -94,7 +96,205 @@ def _cast_stat_dict(data_dict: Dict[str, Any]) -> Dict[str, Any]:
     return cast_dict
 
 
+def _cast_stat_string(value: str | None) -> str:
+    # mimic the characters dropped by _parse_stat_string to keep the outputs identical
+    if value is None:
+        return "NULL"
+    return value.replace(">", '').replace(";", '').replace('"', '').replace("\\", '')
+
+
+# GType names of the fields kept by _cast_stat_dict mapped to their casts, all other fields are skipped
+_STAT_FIELD_CASTS = {
+    "gchararray": _cast_stat_string,
+    "gdouble": float,
+    "gint": int,
+    "guint": int,
+    "guint64": int,
+    "gboolean": bool,
+    "GstWebRTCStatsType": lambda value: value.value_nick,
+}
+
+
+def stats_structure_to_dict(stats_structure: Any, fields: FrozenSet[str] | None = None) -> Dict[str, Any]:
+    """
+    Convert a Gst.Structure with webrtc stats to a flat dict by walking its fields directly (w/o serialization).
+    Nested structures are flattened in place. The output is the same as of stats_to_dict(stats_structure.to_string()).
+
+    :param stats_structure: Gst.Structure with stats (e.g., a value of the webrtcbin's get-stats reply)
+    :param fields: names of the fields to extract (e.g., from StatsSchema.get_fields). None means all fields
+    :return: dict with stats
+    """
+    stats = {}
+    _walk_stats_structure(stats_structure, stats, fields)
+    return stats
+
+
+def _walk_stats_structure(stats_structure: Any, stats: Dict[str, Any], fields: FrozenSet[str] | None) -> None:
+    for i in range(stats_structure.n_fields()):
+        name = stats_structure.nth_field_name(i)
+        type_name = stats_structure.get_field_type(name).name
+        if type_name == "GstStructure":
+            _walk_stats_structure(stats_structure.get_value(name), stats, fields)
+        elif fields is None or name in fields:
+            cast = _STAT_FIELD_CASTS.get(type_name, None)
+            if cast is not None:
+                stats[name] = cast(stats_structure.get_value(name))
+
+
+class StatsSchema:
+    """
+    A declarative selection of the webrtc stats the consumers (MDPs, recorders) actually read.
+    Maps a stats type to the names of its fields that should be extracted, None for a type means all of its fields.
+    Stats types that are not in the schema are skipped completely. The identification fields are always kept.
+
+    :param fields: dict of the stats type and the iterable of field names (or None for all fields)
+    """
+
+    ALWAYS_KEPT_FIELDS = frozenset(["id", "type", "timestamp", "ssrc"])
+
+    def __init__(self, fields: Dict[GstWebRTCStatsType, Iterable[str] | None]) -> None:
+        self.fields = {
+            stat: (frozenset(stat_fields) | self.ALWAYS_KEPT_FIELDS if stat_fields is not None else None)
+            for stat, stat_fields in fields.items()
+        }
+        # stat names (e.g., rtp-inbound-stream_1234) are stable during the session, so cache the lookups by name
+        self._cache = {}
+
+    def merge(self, other: 'StatsSchema') -> 'StatsSchema':
+        merged = dict(self.fields)
+        for stat, stat_fields in other.fields.items():
+            if stat not in merged:
+                merged[stat] = stat_fields
+            elif merged[stat] is None or stat_fields is None:
+                merged[stat] = None
+            else:
+                merged[stat] = merged[stat] | stat_fields
+        return StatsSchema(merged)
+
+    def is_selected(self, stat_name: str) -> bool:
+        return self._lookup(stat_name)[0]
+
+    def get_fields(self, stat_name: str) -> FrozenSet[str] | None:
+        return self._lookup(stat_name)[1]
+
+    def _lookup(self, stat_name: str) -> Tuple[bool, FrozenSet[str] | None]:
+        res = self._cache.get(stat_name, None)
+        if res is None:
+            res = (False, None)
+            for stat, stat_fields in self.fields.items():
+                if stat_name.startswith(stat.value):
+                    res = (True, stat_fields)
+                    break
+            self._cache[stat_name] = res
+        return res
+
+    @staticmethod
+    def compile(schemas: List['StatsSchema | None']) -> 'StatsSchema | None':
+        """
+        Compile the schemas of all consumers into a single one. If any consumer needs all stats (None), returns None.
+
+        :param schemas: list of the consumers' schemas
+        :return: merged schema or None if all stats should be extracted
+        """
+        if not schemas or any(schema is None for schema in schemas):
+            return None
+        compiled = schemas[0]
+        for schema in schemas[1:]:
+            compiled = compiled.merge(schema)
+        return compiled
+
+
+@functools.lru_cache(maxsize=1024)
+def get_stat_type(stat_name: str) -> GstWebRTCStatsType | None:
+    # stat names (e.g., rtp-inbound-stream_1234) are stable during the session, none of the types is a prefix of another
+    for stat in GstWebRTCStatsType:
+        if stat_name.startswith(stat.value):
+            return stat
+    return None
+
+
+class StatsSnapshot(dict):
+    """
+    Stats dict (stat name -> stat) indexed by GstWebRTCStatsType and ssrc. The index is built lazily on the first
+    typed lookup and reset on any modification, so the snapshots kept as the last stats are looked up in O(1).
+    The stats lists returned by the accessors are shared with the index and must not be modified.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._index = None
+        self._ssrc_index = {}
+
+    @classmethod
+    def wrap(cls, stats: Dict[str, Any]) -> 'StatsSnapshot':
+        return stats if isinstance(stats, cls) else cls(stats)
+
+    def get_stats(self, stat: GstWebRTCStatsType) -> List[Dict[str, Any]]:
+        index = self._index
+        if index is None:
+            index = {}
+            for stat_name, value in self.items():
+                stat_type = get_stat_type(stat_name)
+                if stat_type is not None:
+                    index.setdefault(stat_type, []).append(value)
+            self._index = index
+        return index.get(stat, [])
+
+    def get_stat_by_ssrc(self, stat: GstWebRTCStatsType, ssrc: int) -> Dict[str, Any] | None:
+        """
+        Get the stat of the given type by its ssrc. The merged stats (lists of values) are identified by the first ssrc.
+        """
+        ssrc_index = self._ssrc_index.get(stat, None)
+        if ssrc_index is None:
+            ssrc_index = {}
+            for value in self.get_stats(stat):
+                stat_ssrc = _get_first_ssrc(value)
+                if stat_ssrc is not None:
+                    ssrc_index.setdefault(stat_ssrc, value)
+            self._ssrc_index[stat] = ssrc_index
+        return ssrc_index.get(ssrc, None)
+
+    def _invalidate(self) -> None:
+        self._index = None
+        self._ssrc_index = {}
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._invalidate()
+
+    def __ior__(self, other: Any) -> 'StatsSnapshot':
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self._invalidate()
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self._invalidate()
+        return super().setdefault(key, default)
+
+    def pop(self, *args) -> Any:
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self) -> Tuple[str, Any]:
+        self._invalidate()
+        return super().popitem()
+
+    def clear(self) -> None:
+        super().clear()
+        self._invalidate()
+
+
 def find_stat(stats: Dict[str, Any], stat: GstWebRTCStatsType) -> List[Dict[str, Any]]:
+    if isinstance(stats, StatsSnapshot):
+        return stats.get_stats(stat)
     res = []
     for key in stats:
         if key.startswith(stat.value):
@@ -102,6 +302,23 @@ def find_stat(stats: Dict[str, Any], stat: GstWebRTCStatsType) -> List[Dict[str,
     return res
 
 
+def find_stat_by_ssrc(stats: Dict[str, Any], stat: GstWebRTCStatsType, ssrc: int) -> Dict[str, Any] | None:
+    if isinstance(stats, StatsSnapshot):
+        return stats.get_stat_by_ssrc(stat, ssrc)
+    for value in find_stat(stats, stat):
+        if _get_first_ssrc(value) == ssrc:
+            return value
+    return None
+
+
+def _get_first_ssrc(stat: Dict[str, Any]) -> int | None:
+    # the merged stats (lists of values) are identified by the first ssrc
+    ssrc = stat.get("ssrc", None)
+    if isinstance(ssrc, (list, tuple, np.ndarray)):
+        ssrc = ssrc[0] if len(ssrc) > 0 else None
+    return int(ssrc) if ssrc is not None else None
+
+
 def get_stat_diff(stats: Dict[str, Any], last_stats: Dict[str, Any] | None, stat: str) -> float | int:
     return stats[stat] - last_stats[stat] if last_stats is not None else stats[stat]
 
@@ -116,6 +333,18 @@ def get_stat_diff_concat(
     return res
 
 
+def get_stat_diff_array(
+    stats: Dict[str, List[Any]], last_stats: Dict[str, List[Any]] | None, stat: str
+) -> np.ndarray:
+    # vectorized get_stat_diff_concat
+    values = np.asarray(stats[stat], dtype=np.float64)
+    diffs = np.empty_like(values)
+    if len(values) > 0:
+        diffs[0] = values[0] - (last_stats[stat][-1] if last_stats is not None else 0.0)
+        np.subtract(values[1:], values[:-1], out=diffs[1:])
+    return diffs
+
+
 def is_same_rtcp(rtp_inbound: Dict[str, Any], last_rtp_inbound: Dict[str, Any] | None) -> bool:
     if last_rtp_inbound is None:
         return False
@@ -0,0 +1,106 @@
+import math
+import numpy as np
+from typing import Iterable, List, Tuple
+
+from utils.base import get_interval_bounds
+
+
+# STREAMING STATISTICS: O(1) (amortized) updates per sample w/o keeping the history
+class RunningStats:
+    """
+    Running count, mean, variance (Welford), min and max over all samples seen so far.
+
+    :param bool is_skip_zeroes: Whether to ignore the zero samples
+    """
+
+    def __init__(self, is_skip_zeroes: bool = False) -> None:
+        self.is_skip_zeroes = is_skip_zeroes
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def update(self, value: float) -> None:
+        if self.is_skip_zeroes and value == 0.0:
+            return
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def extend(self, values: Iterable[float] | np.ndarray) -> None:
+        """
+        Update the stats with a batch of samples. The batch is reduced with NumPy and merged (Chan et al.).
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if self.is_skip_zeroes:
+            values = values[values != 0.0]
+        if values.size == 0:
+            return
+        n = values.size
+        mean = values.mean()
+        m2 = np.square(values - mean).sum()
+        total = self.count + n
+        delta = mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.count > 0 else 0.0
+
+    @property
+    def var(self) -> float:
+        # population variance as np.var
+        return self._m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    @property
+    def min(self) -> float:
+        return self._min if self.count > 0 else 0.0
+
+    @property
+    def max(self) -> float:
+        return self._max if self.count > 0 else 0.0
+
+
+def get_sliding_running_stats(
+    values: List[float] | np.ndarray,
+    num_intervals: int,
+    is_skip_zeroes: bool = False,
+) -> Tuple[List[float], List[float]]:
+    """
+    Get means and minima over the sliding intervals of slice_list_in_intervals(values, num_intervals, 'sliding')
+    in one pass: the intervals grow from the start, so the running stats are updated by the new samples only
+    and read at the end of each interval.
+
+    :param values: list of values
+    :param num_intervals: number of intervals
+    :param is_skip_zeroes: skip zeroes in the intervals
+    :return: means and minima per interval, 0 for the empty intervals
+    """
+    _, ends = get_interval_bounds(len(values), num_intervals, 'sliding')
+    stats = RunningStats(is_skip_zeroes)
+    means, mins = [], []
+    i = 0
+    for end in ends.tolist():
+        while i < end:
+            stats.update(values[i])
+            i += 1
+        means.append(stats.mean)
+        mins.append(stats.min)
+    return means, mins
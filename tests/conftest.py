@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the package modules import each other from the package root (e.g., "from utils.base import LOGGER")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gstwebrtcapp"))
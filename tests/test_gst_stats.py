@@ -0,0 +1,103 @@
+import json
+import os
+import time
+
+import pytest
+
+gi = pytest.importorskip("gi")
+try:
+    gi.require_version("Gst", "1.0")
+    gi.require_version("GstWebRTC", "1.0")
+except ValueError:
+    pytest.skip("GStreamer is not available", allow_module_level=True)
+from gi.repository import GObject, Gst, GstWebRTC
+
+from utils.gst import stats_structure_to_dict, stats_to_dict
+
+SAMPLES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "gstwebrtcapp",
+    "control",
+    "drl",
+    "samples",
+    "browser_stats_samples.json",
+)
+# webrtcbin nests the rtpsource stats of the rtp streams starting with this field into the gst-rtpsource-stats field
+RTPSOURCE_STATS_FIRST_FIELD = "internal"
+
+
+def _make_value(value):
+    if isinstance(value, bool):
+        return GObject.Value(GObject.TYPE_BOOLEAN, value)
+    elif isinstance(value, int):
+        if value < 0:
+            return GObject.Value(GObject.TYPE_INT, value)
+        return GObject.Value(GObject.TYPE_UINT if value < 2**32 else GObject.TYPE_UINT64, value)
+    elif isinstance(value, float):
+        return GObject.Value(GObject.TYPE_DOUBLE, value)
+    return GObject.Value(GObject.TYPE_STRING, value)
+
+
+def _make_stats_type_value(nick):
+    for stats_type in GstWebRTC.WebRTCStatsType.__enum_values__.values():
+        if stats_type.value_nick == nick:
+            return GObject.Value(GstWebRTC.WebRTCStatsType.__gtype__, stats_type)
+    raise ValueError(f"unknown stats type {nick}")
+
+
+def _make_stat_structure(name, stat):
+    # rebuild the structure of a recorded stat as webrtcbin's get-stats reply carries it
+    structure = Gst.Structure.new_empty(name)
+    rtpsource_structure = None
+    for field, value in stat.items():
+        if field == RTPSOURCE_STATS_FIRST_FIELD:
+            rtpsource_structure = Gst.Structure.new_empty("application/x-rtp-source-stats")
+        target = rtpsource_structure if rtpsource_structure is not None else structure
+        target.set_value(field, _make_stats_type_value(value) if field == "type" else _make_value(value))
+    if rtpsource_structure is not None:
+        structure.set_value("gst-rtpsource-stats", GObject.Value(Gst.Structure.__gtype__, rtpsource_structure))
+    return structure
+
+
+@pytest.fixture(scope="module")
+def samples():
+    Gst.init(None)
+    with open(SAMPLES_PATH) as file:
+        return [
+            {name: (_make_stat_structure(name, stat), stat) for name, stat in sample.items()}
+            for sample in json.load(file)
+        ]
+
+
+def test_stats_structure_to_dict_matches_string_parsing(samples):
+    for sample in samples:
+        for structure, recorded_stat in sample.values():
+            stats = stats_structure_to_dict(structure)
+            assert stats == stats_to_dict(structure.to_string())
+            assert stats == recorded_stat
+
+
+def test_stats_structure_to_dict_extracts_selected_fields(samples):
+    fields = frozenset(["id", "type", "timestamp", "ssrc", "packets-sent", "rb-round-trip", "round-trip-time"])
+    for sample in samples:
+        for structure, _ in sample.values():
+            expected = {field: value for field, value in stats_to_dict(structure.to_string()).items() if field in fields}
+            assert stats_structure_to_dict(structure, fields) == expected
+
+
+def test_stats_structure_to_dict_benchmark(samples):
+    # microbenchmark of the conversion of whole stats snapshots, run with -s to see the timings
+    num_iterations = 200
+    timings = {}
+    for name, convert in (
+        ("stats_to_dict(to_string())", lambda structure: stats_to_dict(structure.to_string())),
+        ("stats_structure_to_dict", stats_structure_to_dict),
+    ):
+        start = time.perf_counter()
+        for _ in range(num_iterations):
+            for sample in samples:
+                for structure, _ in sample.values():
+                    convert(structure)
+        timings[name] = (time.perf_counter() - start) / (num_iterations * len(samples))
+    for name, timing in timings.items():
+        print(f"{name}: {timing * 1e6:.1f} us per stats snapshot")
@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("gymnasium")
+
+from control.drl.buffer import ObservationBuffer
+from control.drl.mdp import ViewerSeqMDP, ViewerSeqNoBaselineMDP
+from message.client import make_local_mqtt_pair
+
+SAMPLES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "gstwebrtcapp",
+    "control",
+    "drl",
+    "samples",
+    "browser_stats_samples.json",
+)
+# the states made from the samples by the loop-based make_state before make_seq_features was vectorized
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "viewer_seq_states_golden.json")
+
+# indices of the recorded samples merged into the observations of each step and the gcc estimates (bps) of the step
+WINDOWS = [[0, 1], [1, 2], [2, 3], [0, 1, 2, 3], [3]]
+GCC_ESTIMATES = [[2.5e6], [3e6, 1.8e6], [0.7e6], [4e6], [1.2e6, 0.9e6, 2e6]]
+
+
+@pytest.fixture(scope="module")
+def samples():
+    with open(SAMPLES_PATH) as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with open(GOLDEN_PATH) as file:
+        return json.load(file)
+
+
+@pytest.mark.parametrize("mdp_class", [ViewerSeqMDP, ViewerSeqNoBaselineMDP])
+@pytest.mark.parametrize("num_observations_for_state", [1, 2, 3, 5])
+def test_seq_states_match_golden(samples, golden, mdp_class, num_observations_for_state):
+    mdp = mdp_class(num_observations_for_state=num_observations_for_state)
+    mdp.mqtts = make_local_mqtt_pair(f"test_{mdp_class.__name__}_{num_observations_for_state}", ["gcc"])
+    # the observations are merged the way DrlEnv does it
+    observation_buffer = ObservationBuffer(stats_schema=mdp.get_stats_schema())
+    for sample in samples:
+        observation_buffer.append(sample)
+    expected_states = golden[mdp_class.__name__][str(num_observations_for_state)]
+    try:
+        for window, estimates, expected_state in zip(WINDOWS, GCC_ESTIMATES, expected_states):
+            for estimate in estimates:
+                mdp.mqtts.publisher.publish(mdp.mqtts.subscriber.topics.gcc, estimate)
+            state = mdp.make_state(observation_buffer.get_selected(window), None)
+            assert list(state.keys()) == list(expected_state.keys())
+            for key, expected in expected_state.items():
+                np.testing.assert_allclose(np.asarray(state[key], dtype=np.float64), expected, rtol=1e-9, atol=1e-12)
+    finally:
+        mdp.mqtts.stop()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("gymnasium")
+
+from control.drl.mdp import ViewerMDP, ViewerSeqMDP, ViewerSeqOfflineMDP
+from control.drl.reward import stack_states
+from control.drl.sim_env import SimulatedDrlEnv
+from network.trace import NetworkTrace
+
+# bandwidth trace in mbps, one value per second, with drops that make the reward penalties fire now and then
+TRACE_VALUES = [8.0, 12.0, 5.0, 15.0, 10.0, 2.0, 9.0, 20.0] * 4
+NUM_STEPS = 24
+
+
+def _make_mdp(mdp_class, reward_function_name, state_history_size):
+    if mdp_class is ViewerSeqMDP:
+        return ViewerSeqMDP(reward_function_name=reward_function_name, state_history_size=state_history_size)
+    return mdp_class(
+        reward_function_name=reward_function_name, episode_length=NUM_STEPS + 1, state_history_size=state_history_size
+    )
+
+
+def _assert_parts_equal(batch_parts, step_parts, t):
+    assert list(batch_parts.keys()) == list(step_parts.keys())
+    for part, value in step_parts.items():
+        if isinstance(value, str):
+            assert batch_parts[part][t] == value, (t, part)
+        else:
+            np.testing.assert_allclose(float(batch_parts[part][t]), value, rtol=1e-9, atol=1e-12, err_msg=f"{t} {part}")
+
+
+@pytest.mark.parametrize(
+    "mdp_class, reward_function_name",
+    [
+        (ViewerMDP, "qoe_ahoy"),
+        (ViewerSeqMDP, "qoe_ahoy_seq"),
+        (ViewerSeqMDP, "qoe_ahoy_seq_sensible"),
+        (ViewerSeqOfflineMDP, "qoe_offline"),
+    ],
+)
+@pytest.mark.parametrize("state_history_size", [3, 10])
+def test_batched_rewards_match_per_step_rewards(mdp_class, reward_function_name, state_history_size):
+    mdp = _make_mdp(mdp_class, reward_function_name, state_history_size)
+    trace = NetworkTrace(
+        size=len(TRACE_VALUES),
+        av_value=sum(TRACE_VALUES) / len(TRACE_VALUES),
+        ooc_rate=0.0,
+        values=TRACE_VALUES,
+    )
+    env = SimulatedDrlEnv(mdp, [trace], seed=0)
+    rng = np.random.default_rng(0)
+    states, actions, max_delays, rewards, reward_parts = [], [], [], [], []
+    try:
+        env.reset(seed=0)
+        for _ in range(NUM_STEPS):
+            # mostly the low bitrates, so the rollout has both the rewarded and the penalized steps
+            _, reward, terminated, truncated, _ = env.step(rng.uniform(-1, 0, 1).astype(np.float32))
+            assert not (terminated or truncated)
+            states.append(mdp.last_states[-1])
+            actions.append(mdp.last_actions[-1])
+            max_delays.append(mdp.reward_params.get("max_delay"))
+            rewards.append(reward)
+            reward_parts.append(dict(env.reward_parts))
+    finally:
+        env.close()
+
+    params = {"constants": mdp.CONSTANTS, "actions": actions}
+    if reward_function_name == "qoe_offline":
+        # the offline MDP updates the max delay on each step, so it is passed per state
+        params["max_delay"] = np.asarray(max_delays, dtype=np.float64)
+    batch_rewards, batch_parts = mdp.reward_function.calculate_rewards(
+        stack_states(states), params, state_history_size
+    )
+
+    assert np.count_nonzero(batch_rewards) > 0
+    np.testing.assert_allclose(batch_rewards, rewards, rtol=1e-9, atol=1e-12)
+    for t, step_parts in enumerate(reward_parts):
+        _assert_parts_equal(batch_parts, step_parts, t)